@@ -1,21 +1,353 @@
 # a library class to perform basic matrix operations to use in the NN class
+#
+# The elements are stored in one contiguous array('d') (8-byte floats) with a row and a column stride, so a transpose
+# is a view with swapped strides (no copy). The loops over rows and columns run in C through array slices and map()
+# instead of nested Python loops over lists of lists. NumPy can view a matrix without copying through __array__,
+# so the NN runs on either backend and doesn't need NumPy at all. Only Python 3.12+ calls __buffer__: before that
+# (3.11 included) memoryview(m) raises TypeError, and NumPy uses __array__.
+import math
+import random
+from array import array
+from itertools import repeat
+from operator import add, sub, mul, truediv
+
+# dot product of two sequences (math.sumprod is Python 3.12+):
+dot = getattr(math, 'sumprod', None) or (lambda a, b: sum(map(mul, a, b)))
+
 
 class Matrix:
-    # create new matrix of rows x columns and initialize to 0:
-    def __init__(self, rows, columns, fill):
+    # create new matrix of rows x columns and initialize to fill:
+    def __init__(self, rows, columns, fill=0.0):
         self.rows = rows
         self.columns = columns
-        self.matrix = [[fill] * self.columns for i in range(self.rows)]
+        self.data = array('d', [fill]) * (rows * columns)
+        self.offset = 0
+        self.row_stride = columns  # distance in data between two rows
+        self.column_stride = 1  # distance in data between two columns
+
+    # ------------------------------------------------------------------
+    # other constructors:
+    @classmethod
+    def from_data(cls, rows, columns, data):
+        m = cls.__new__(cls)
+        m.rows, m.columns = rows, columns
+        m.data = data if isinstance(data, array) and data.typecode == 'd' else array('d', data)
+        m.offset, m.row_stride, m.column_stride = 0, columns, 1
+        if len(m.data) != rows * columns:
+            raise ValueError(f"{len(m.data)} elements for a {rows} x {columns} matrix")
+        return m
+
+    @classmethod
+    def from_list(cls, values):
+        rows = [list(row) for row in values]
+        return cls.from_data(len(rows), len(rows[0]) if rows else 0, [x for row in rows for x in row])
+
+    # a rows x 1 column vector:
+    @classmethod
+    def column(cls, values):
+        values = array('d', values)
+        return cls.from_data(len(values), 1, values)
+
+    # random values in the uniform interval [low, high]:
+    @classmethod
+    def random(cls, rows, columns, low=-1.0, high=1.0):
+        return cls.from_data(rows, columns, [random.uniform(low, high) for _ in range(rows * columns)])
+
+    # copy of any object exporting a 2-D (or 1-D: one row) buffer of doubles, e.g. a NumPy float64 array:
+    @classmethod
+    def from_buffer(cls, obj):
+        view = memoryview(obj)
+        if view.format != 'd':
+            raise TypeError(f"buffer of '{view.format}', expected doubles ('d')")
+        shape = view.shape if view.ndim == 2 else (1, view.shape[0])
+        data = array('d')
+        data.frombytes(view.tobytes())
+        return cls.from_data(shape[0], shape[1], data)
+
+    # ------------------------------------------------------------------
+    @property
+    def shape(self):
+        return self.rows, self.columns
+
+    def is_contiguous(self):
+        return (self.offset == 0 and self.row_stride == self.columns and self.column_stride == 1
+                and len(self.data) == self.rows * self.columns)
+
+    # the matrix itself if it's contiguous, otherwise a contiguous copy:
+    def contiguous(self):
+        if self.is_contiguous():
+            return self
+        return Matrix.from_data(self.rows, self.columns, array('d', (x for i in range(self.rows) for x in self.row(i))))
+
+    def copy(self):
+        return Matrix.from_data(self.rows, self.columns, array('d', self.contiguous().data))
+
+    # row i and column j as array slices (a copy, computed in C):
+    def row(self, i):
+        start = self.offset + i * self.row_stride
+        return self.data[start:start + self.column_stride * (self.columns - 1) + 1:self.column_stride]
+
+    def col(self, j):
+        start = self.offset + j * self.column_stride
+        return self.data[start:start + self.row_stride * (self.rows - 1) + 1:self.row_stride]
+
+    def __len__(self):
+        return self.rows
+
+    # m[i, j] is an element, m[start:stop] a view of the rows start to stop - 1:
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.rows)
+            if step != 1:
+                raise ValueError("row slices with a step are not supported")
+            m = Matrix.__new__(Matrix)
+            m.rows, m.columns, m.data = max(stop - start, 0), self.columns, self.data
+            m.offset = self.offset + start * self.row_stride
+            m.row_stride, m.column_stride = self.row_stride, self.column_stride
+            return m
+        i, j = index
+        return self.data[self.offset + i * self.row_stride + j * self.column_stride]
+
+    def __setitem__(self, index, value):
+        i, j = index
+        self.data[self.offset + i * self.row_stride + j * self.column_stride] = value
+
+    # all the elements row after row, as a flat array:
+    def ravel(self):
+        return self.contiguous().data
+
+    # list of lists (a copy):
+    def tolist(self):
+        return [list(self.row(i)) for i in range(self.rows)]
+
+    # the old list of lists attribute: rows that read and write the elements of the matrix, so m.matrix[i][j] = v
+    # and m.matrix[i] = values still change m
+    @property
+    def matrix(self):
+        return MatrixRows(self)
+
+    def __repr__(self):
+        return f"Matrix({self.tolist()!r})"
+
+    # ------------------------------------------------------------------
+    # transpose: a view of the same data with swapped strides
+    def transpose(self):
+        m = Matrix.__new__(Matrix)
+        m.rows, m.columns, m.data, m.offset = self.columns, self.rows, self.data, self.offset
+        m.row_stride, m.column_stride = self.column_stride, self.row_stride
+        return m
+
+    T = property(transpose)
+
+    # same elements with another shape (a view if the matrix is contiguous):
+    def reshape(self, rows, columns):
+        if rows == -1:
+            rows = self.rows * self.columns // columns
+        return Matrix.from_data(rows, columns, self.contiguous().data)
+
+    # ------------------------------------------------------------------
+    # matrix product: every element is the dot product of a row of self and a column of other
+    def matmul(self, other):
+        if self.columns != other.rows:
+            raise ValueError(f"can't multiply {self.rows} x {self.columns} by {other.rows} x {other.columns}")
+        columns = [other.col(j) for j in range(other.columns)]
+        data = array('d', (dot(row, column) for row in map(self.row, range(self.rows)) for column in columns))
+        return Matrix.from_data(self.rows, other.columns, data)
+
+    __matmul__ = matmul
+
+    # ------------------------------------------------------------------
+    # element-wise operation with broadcasting: other is a number, a matrix of the same shape, or a matrix with one
+    # row or one column (like a bias vector) that is repeated over the other rows or columns
+    def elementwise(self, op, other, reverse=False):
+        if not isinstance(other, Matrix):
+            value = float(other)
+            if self.is_contiguous():  # one map() over the whole data
+                pairs = (repeat(value), self.data) if reverse else (self.data, repeat(value))
+                return Matrix.from_data(self.rows, self.columns, array('d', map(op, *pairs)))
+            if reverse:
+                rows = (map(op, repeat(value, self.columns), self.row(i)) for i in range(self.rows))
+            else:
+                rows = (map(op, self.row(i), repeat(value, self.columns)) for i in range(self.rows))
+            return Matrix.from_data(self.rows, self.columns, array('d', (x for row in rows for x in row)))
+
+        rows, columns = max(self.rows, other.rows), max(self.columns, other.columns)
+        for m in (self, other):
+            if m.rows not in (1, rows) or m.columns not in (1, columns):
+                raise ValueError(f"can't broadcast {self.shape} with {other.shape}")
+
+        def row_of(m, i):
+            values = m.row(i if m.rows > 1 else 0)
+            return values if m.columns > 1 else repeat(values[0], columns)
+
+        first, second = (other, self) if reverse else (self, other)
+        if first.shape == second.shape and first.is_contiguous() and second.is_contiguous():
+            return Matrix.from_data(rows, columns, array('d', map(op, first.data, second.data)))
+        data = array('d')
+        for i in range(rows):
+            data.extend(map(op, row_of(first, i), row_of(second, i)))
+        return Matrix.from_data(rows, columns, data)
+
+    def __add__(self, other):
+        return self.elementwise(add, other)
 
+    def __radd__(self, other):
+        return self.elementwise(add, other, reverse=True)
+
+    def __sub__(self, other):
+        return self.elementwise(sub, other)
+
+    def __rsub__(self, other):
+        return self.elementwise(sub, other, reverse=True)
+
+    # element-wise (Hadamard) product, as NumPy's *:
+    def __mul__(self, other):
+        return self.elementwise(mul, other)
+
+    def __rmul__(self, other):
+        return self.elementwise(mul, other, reverse=True)
+
+    def __truediv__(self, other):
+        return self.elementwise(truediv, other)
+
+    def __neg__(self):
+        return self.elementwise(mul, -1.0)
+
+    # in place versions: the result is written back into the data of self
+    def assign(self, other):
+        if self.is_contiguous() and other.is_contiguous() and other.shape == self.shape:
+            self.data[:] = other.data
+        else:
+            for i in range(self.rows):
+                for j in range(self.columns):
+                    self[i, j] = other[i if other.rows > 1 else 0, j if other.columns > 1 else 0]
+        return self
+
+    def __iadd__(self, other):
+        return self.assign(self + other)
+
+    def __isub__(self, other):
+        return self.assign(self - other)
+
+    def __imul__(self, other):
+        return self.assign(self * other)
+
+    # ------------------------------------------------------------------
+    # apply the function f to every element (e.g. the sigmoid):
+    def map(self, f):
+        return Matrix.from_data(self.rows, self.columns, array('d', map(f, self.contiguous().data)))
+
+    # sum of all the elements (axis None), of every column (axis 0: a 1 x columns matrix) or of every row (axis 1:
+    # a rows x 1 matrix):
+    def sum(self, axis=None):
+        if axis is None:
+            return math.fsum(self.contiguous().data)
+        if axis == 0:
+            return Matrix.from_data(1, self.columns, [math.fsum(self.col(j)) for j in range(self.columns)])
+        return Matrix.from_data(self.rows, 1, [math.fsum(self.row(i)) for i in range(self.rows)])
 
     # scalar addition
     def scale(self, a):
         for i in range(self.rows):
             for j in range(self.columns):
-                self.matrix[i][j] += a
+                self[i, j] += a
 
     # scalar multiplication
     def multiply(self, a):
         for i in range(self.rows):
             for j in range(self.columns):
-                self.matrix[i][j] *= a
+                self[i, j] *= a
+
+    # ------------------------------------------------------------------
+    # zero-copy interop: np.asarray(m) is a view of the memory of m (transposed views included). The view is made
+    # with np.frombuffer(), so it holds a buffer export of the array('d'): while it exists the array can't be
+    # resized (BufferError) and the view never points to freed memory. __buffer__ is only called by Python 3.12+
+    # (memoryview(m)), older versions ignore it
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        if self.rows * self.columns == 0:
+            view = np.empty((self.rows, self.columns))
+        else:
+            base = np.frombuffer(self.data, dtype=np.float64)[self.offset:]
+            view = np.lib.stride_tricks.as_strided(base, (self.rows, self.columns),
+                                                   (self.row_stride * 8, self.column_stride * 8))
+        if dtype is not None and np.dtype(dtype) != view.dtype:
+            if copy is False:
+                raise ValueError(f"a Matrix is float64, not {np.dtype(dtype)}, without a copy")
+            return view.astype(dtype)
+        return view.copy() if copy else view
+
+    def __buffer__(self, flags):
+        if not self.is_contiguous():
+            raise BufferError("only contiguous matrices export a buffer, use contiguous()")
+        return memoryview(self.data).cast('B').cast('d', (self.rows, self.columns))
+
+
+# ------------------------------------------------------------------
+# Matrix.matrix: the rows of a matrix as a sequence of write-through rows
+class MatrixRows:
+    def __init__(self, m):
+        self.m = m
+
+    def __len__(self):
+        return self.m.rows
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [MatrixRow(self.m, k) for k in range(*i.indices(self.m.rows))]
+        if i < 0:
+            i += self.m.rows
+        if not 0 <= i < self.m.rows:
+            raise IndexError(i)
+        return MatrixRow(self.m, i)
+
+    def __setitem__(self, i, values):
+        row = self[i]
+        values = list(values)
+        if len(values) != len(row):
+            raise ValueError(f"{len(values)} values for a row of {len(row)}")
+        for j, value in enumerate(values):
+            row[j] = value
+
+    def __iter__(self):
+        return (MatrixRow(self.m, i) for i in range(self.m.rows))
+
+    def __eq__(self, other):
+        return self.m.tolist() == [list(row) for row in other]
+
+    def __repr__(self):
+        return repr(self.m.tolist())
+
+
+class MatrixRow:
+    def __init__(self, m, i):
+        self.m = m
+        self.i = i
+
+    def __len__(self):
+        return self.m.columns
+
+    def __getitem__(self, j):
+        if isinstance(j, slice):
+            return list(self.m.row(self.i))[j]
+        if j < 0:
+            j += self.m.columns
+        if not 0 <= j < self.m.columns:
+            raise IndexError(j)
+        return self.m[self.i, j]
+
+    def __setitem__(self, j, value):
+        if j < 0:
+            j += self.m.columns
+        if not 0 <= j < self.m.columns:
+            raise IndexError(j)
+        self.m[self.i, j] = value
+
+    def __iter__(self):
+        return iter(self.m.row(self.i))
+
+    def __eq__(self, other):
+        return list(self) == list(other)
+
+    def __repr__(self):
+        return repr(list(self))
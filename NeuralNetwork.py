@@ -1,34 +1,80 @@
-import numpy as np
+import math
+from array import array
+from itertools import chain
+from Matrix import Matrix
+
+# NumPy is optional: without it the networks run on the array-backed Matrix class (backend='matrix')
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+BACKENDS = ('numpy', 'matrix')
+
+
+# the sigmoid of one number for the Matrix backend (written so that exp() never overflows):
+def sigmoid(x):
+    if x >= 0:
+        return 1 / (1 + math.exp(-x))
+    z = math.exp(x)
+    return z / (1 + z)
+
 
 # the three-layer fully connected Neural Network class:
 # ------------------------------------------------------------------
 class NeuralNetwork:
     # hidden layer matrix: H = σ(W_ih * I + B_h), output matrix: O = σ(W_ho * H + B_o)
     # B is the bias matrix, all elements are 1.
-    def __init__(self, nr_inputs, nr_hidden, nr_outputs, learning_rate):
+    # backend is 'numpy' (NumPy arrays) or 'matrix' (Matrix objects), the default is numpy if it is installed.
+    # The computations below only use the operators both have (@, +, -, *, .T), so they run on either one.
+    def __init__(self, nr_inputs, nr_hidden, nr_outputs, learning_rate, backend=None):
         # number of elements in each of the layers:
         self.nr_inputs = nr_inputs
         self.nr_hidden = nr_hidden
         self.nr_outputs = nr_outputs
         self.learning_rate = learning_rate
+        self.backend = backend or ('numpy' if np is not None else 'matrix')
+        if self.backend not in BACKENDS:
+            raise ValueError(f"unknown backend {self.backend!r}, expected one of {BACKENDS}")
+        if self.backend == 'numpy' and np is None:
+            raise ImportError("the numpy backend needs NumPy, use backend='matrix'")
 
         # create the input-hidden and hidden-output weight matrices. Initialize as random values
         # in the uniform interval [-1, 1]. In () is the matrix shape
         # nr of columns in the weight matrix = nr of input nodes
-        self.weights_IH = np.random.random((self.nr_hidden, self.nr_inputs)) * 2 - 1
+        self.weights_IH = self.random(self.nr_hidden, self.nr_inputs)
         # nr or rows in the weight matrix = nr of hidden nodes
-        self.weights_HO = np.random.random((self.nr_outputs, self.nr_hidden)) * 2 - 1
+        self.weights_HO = self.random(self.nr_outputs, self.nr_hidden)
 
         # create the bias matrices for the hidden and output layers with random values [-1, 1]:
-        self.bias_H = np.random.random(self.nr_hidden) * 2 - 1
-        self.bias_H = self.bias_H.reshape(self.nr_hidden, 1)  # reshape as a nr_hidden x 1 matrix
-        self.bias_O = np.random.random(self.nr_outputs) * 2 - 1
-        self.bias_O = self.bias_O.reshape(self.nr_outputs, 1)  # reshape as a nr_outputs x 1 matrix
+        self.bias_H = self.random(self.nr_hidden, 1)  # a nr_hidden x 1 matrix
+        self.bias_O = self.random(self.nr_outputs, 1)  # a nr_outputs x 1 matrix
+
+    # random rows x columns matrix of the backend in the uniform interval [-1, 1]:
+    def random(self, rows, columns):
+        if self.backend == 'matrix':
+            return Matrix.random(rows, columns)
+        return np.random.random(rows * columns).reshape(rows, columns) * 2 - 1
+
+    # convert inputs or targets (a list, a list of rows, a NumPy array or a Matrix) to a rows x columns matrix of
+    # the backend (rows=-1: as many rows as needed):
+    def matrix(self, values, rows, columns):
+        if self.backend == 'numpy':
+            return np.asarray(values, dtype=float).reshape(rows, columns)
+        if isinstance(values, Matrix):
+            return values.reshape(rows, columns)
+        try:
+            data = array('d', values)
+        except TypeError:
+            data = array('d', chain.from_iterable(values))
+        return Matrix.from_data(len(data) // columns if rows == -1 else rows, columns, data)
 
 
     # create the sigmoid function and its derivative:
     # ------------------------------------------------------------------
     def sigmoid(self, x):
+        if self.backend == 'matrix':
+            return x.map(sigmoid)
         return 1 / (1 + np.exp(-x))
 
 
@@ -41,49 +87,49 @@ class NeuralNetwork:
     # feed-forward process (assuming that we have normalized the inputs to the 0-1 space)
     # calculate the hidden layer nodes: H = σ(W_ih * I + B_h)
     def predict(self, inputs):
-        # convert inputs to vector np array:
-        inputs = np.array(inputs).reshape(self.nr_inputs, 1)
-
-        # compute hidden nodes as W_ih * I:
-        hidden = np.matmul(self.weights_IH, inputs)
-
-        # now add the bias of the hidden layer (+ B_h):
-        hidden = np.add(hidden, self.bias_H)
-        # now we pass it from the sigmoid activation function:
-        hidden = self.sigmoid(hidden)
+        # convert inputs to a column vector:
+        inputs = self.matrix(inputs, self.nr_inputs, 1)
+        hidden, output = self.feed_forward(inputs)
+        # return the output:
+        return output
 
+    # the forward pass for column inputs (nr_inputs x 1), returning both the hidden and the output nodes, so that
+    # train() can reuse them for the back-propagation:
+    def feed_forward(self, inputs):
+        # compute hidden nodes as W_ih * I, add the bias of the hidden layer (+ B_h) and pass it from the sigmoid
+        # activation function:
+        hidden = self.sigmoid(self.weights_IH @ inputs + self.bias_H)
         # now the hidden nodes are multiplied with the HO weights to create the output nodes: O = σ(W_ho * H + B_o)
-        output_nodes = np.matmul(self.weights_HO, hidden)
+        output = self.sigmoid(self.weights_HO @ hidden + self.bias_O)
+        return hidden, output
 
-        # now add the bias of the output layer (+ B_o):
-        output_b = np.add(output_nodes, self.bias_O)
-
-        # finally we pass it from the sigmoid activation function:
-        output = self.sigmoid(output_b)
-
-        # return the output:
-        return output
+    # ------------------------------------------------------------------
+    # predict a whole batch in one matrix multiplication per layer: inputs is an N x nr_inputs matrix (one sample
+    # per row) and the result is N x nr_outputs. The same as H = σ(I * W_ih^T + B_h^T) for all rows at once:
+    def predict_batch(self, inputs):
+        inputs = self.matrix(inputs, -1, self.nr_inputs)
+        hidden = self.sigmoid(inputs @ self.weights_IH.T + self.bias_H.T)
+        return self.sigmoid(hidden @ self.weights_HO.T + self.bias_O.T)
 
     # ------------------------------------------------------------------
     # back-propagation algorithm to train the NN weights: we need to propagate the error between the NN output and the
     # target output to adjust all the weights for both hidden and input layers.
     #
     def train(self, inputs, targets):
-        # convert inputs and targets to np vector arrays:
-        inputs = np.array(inputs).reshape(self.nr_inputs, 1)
-        targets = np.array(targets).reshape(self.nr_outputs, 1)
+        # convert inputs and targets to column vectors:
+        inputs = self.matrix(inputs, self.nr_inputs, 1)
+        targets = self.matrix(targets, self.nr_outputs, 1)
 
-        # feed forward the specific input and calculate the output:
-        outputs = self.predict(inputs)
+        # feed forward the specific input and calculate the hidden and output layers (once, they are reused below):
+        hidden, outputs = self.feed_forward(inputs)
 
         # calculate the output layer error: target - output
-        output_errors = np.subtract(targets, outputs)
+        output_errors = targets - outputs
 
         # now we need to calculate the hidden layer error: they are the proportions of the weights for each
         # output error from each hidden node. We calculate by transposing the W_ho and multiplying with the
         # output errors we just calculated:
-        weights_HO_transposed = np.transpose(self.weights_HO)
-        hidden_errors = np.matmul(weights_HO_transposed, output_errors)
+        hidden_errors = self.weights_HO.T @ output_errors
 
         # now we apply gradient descent in order to update the weights and bias for every input sample:
         # total cost function = Sum(guess - y)^2, to minimize this we set the partial derivative for m equal to 0:
@@ -94,45 +140,110 @@ class NeuralNetwork:
         # the equivalent for matrix is: ΔW_ho = lr * E_o * O*(1-O) (*) H_trans , and ΔW_ih = lr * E_h  H*(1-H) (*) I_trans
         # Δbias_O = lr * E_o * O*(1-O), Δbias_I = lr * E_h  H*(1-H)
 
-        # output layer:
-        # calculate the derivative of the sigmoid: the output is already passed through the sigmoid:
-        grad = self.d_sigmoid(outputs)
-        # now multiply element-wise with the output errors:
-        grad = np.multiply(grad, output_errors)
-        # now multiply with the learning rate:
-        grad *= self.learning_rate
-
-        # Calculate output weight deltas: first compute (again) and transpose the hidden layer outputs:
-        # compute hidden nodes as W_ih * I:
-        hidden_nodes = np.matmul(self.weights_IH, inputs)
-        # now add the bias of the hidden layer (+ B_h):
-        hidden_b = np.add(hidden_nodes, self.bias_H)
-
-        # now we pass it from the sigmoid activation function:
-        hidden = self.sigmoid(hidden_b)
-
-        # compute the transposed matrix:
-        hidden_T = np.transpose(hidden)
-        # now compute the delta weights:
-        weights_HO_delta = np.matmul(grad, hidden_T)
-        # finally update the H->O weights:
-        self.weights_HO = np.add(self.weights_HO, weights_HO_delta)
-
-        # hidden layer:
-        # calculate gradient of the hidden layer as the hidden vector passed through the sigmoid derivative:
-        grad_h = self.d_sigmoid(hidden)
-        # now multiply element-wise with the hidden errors:
-        grad_h = np.multiply(grad_h, hidden_errors)
-        # now multiply with the learning rate:
-        grad_h = grad_h * self.learning_rate
-
-        # calculate hidden weight deltas: transpose input layer inputs:
-        input_T = np.transpose(inputs)
-        # now compute the input delta weights:
-        weights_IH_delta = np.matmul(grad_h, input_T)
-        # finally update the I->H weights:
-        self.weights_IH = np.add(self.weights_IH, weights_IH_delta)
-
-        # adjust the output and hidden bias by the deltas (grad3 and grad3_h:
-        self.bias_O = np.add(self.bias_O, grad)
-        self.bias_H = np.add(self.bias_H, grad_h)
+        # output layer: the derivative of the sigmoid (the output is already passed through the sigmoid), multiplied
+        # element-wise with the output errors and with the learning rate:
+        grad = self.d_sigmoid(outputs) * output_errors * self.learning_rate
+        # hidden layer: the same with the hidden vector and the hidden errors:
+        grad_h = self.d_sigmoid(hidden) * hidden_errors * self.learning_rate
+
+        # finally update the weights with the deltas (gradient times the transposed layer inputs) and the biases with
+        # the gradients. The updates are in place, so views of the weights (NeuralNetworkPopulation) stay valid:
+        self.weights_HO += grad @ hidden.T
+        self.weights_IH += grad_h @ inputs.T
+        self.bias_O += grad
+        self.bias_H += grad_h
+
+    # ------------------------------------------------------------------
+    # mini-batch gradient descent: inputs is N x nr_inputs and targets N x nr_outputs. Every batch_size rows are one
+    # forward pass and one update with the mean gradient of the batch (batch_size=None: the whole set in one batch)
+    def train_batch(self, inputs, targets, batch_size=None):
+        inputs = self.matrix(inputs, -1, self.nr_inputs)
+        targets = self.matrix(targets, -1, self.nr_outputs)
+        batch_size = batch_size or len(inputs)
+        for start in range(0, len(inputs), batch_size):
+            I = inputs[start:start + batch_size]
+            T = targets[start:start + batch_size]
+            # forward pass, one row per sample:
+            hidden = self.sigmoid(I @ self.weights_IH.T + self.bias_H.T)
+            outputs = self.sigmoid(hidden @ self.weights_HO.T + self.bias_O.T)
+            # errors and gradients as in train(), the gradients averaged over the batch:
+            output_errors = T - outputs
+            hidden_errors = output_errors @ self.weights_HO
+            rate = self.learning_rate / len(I)
+            grad = self.d_sigmoid(outputs) * output_errors * rate
+            grad_h = self.d_sigmoid(hidden) * hidden_errors * rate
+            self.weights_HO += grad.T @ hidden
+            self.weights_IH += grad_h.T @ I
+            self.bias_O += grad.sum(axis=0).reshape(self.nr_outputs, 1)
+            self.bias_H += grad_h.sum(axis=0).reshape(self.nr_hidden, 1)
+
+
+# ------------------------------------------------------------------
+# one network per butterfly with the computation for all of them vectorized (NumPy only): the weights of N networks are stacked
+# into N x nr_hidden x nr_inputs and N x nr_outputs x nr_hidden tensors (biases N x nodes x 1), and each agent feeds
+# its own sample (one row of an N x nr_inputs matrix) through its own network.
+class NeuralNetworkPopulation:
+    def __init__(self, nr_networks, nr_inputs, nr_hidden, nr_outputs, learning_rate):
+        self.nr_inputs = nr_inputs
+        self.nr_hidden = nr_hidden
+        self.nr_outputs = nr_outputs
+        self.learning_rate = learning_rate
+        # random values in the uniform interval [-1, 1] as in NeuralNetwork:
+        self.weights_IH = np.random.random((nr_networks, nr_hidden, nr_inputs)) * 2 - 1
+        self.weights_HO = np.random.random((nr_networks, nr_outputs, nr_hidden)) * 2 - 1
+        self.bias_H = np.random.random((nr_networks, nr_hidden, 1)) * 2 - 1
+        self.bias_O = np.random.random((nr_networks, nr_outputs, 1)) * 2 - 1
+
+    # stack existing networks (they must have the same shape, Matrix weights are read without a copy):
+    @classmethod
+    def from_networks(cls, networks):
+        first = networks[0]
+        population = cls(0, first.nr_inputs, first.nr_hidden, first.nr_outputs, first.learning_rate)
+        population.weights_IH = np.stack([nn.weights_IH for nn in networks])
+        population.weights_HO = np.stack([nn.weights_HO for nn in networks])
+        population.bias_H = np.stack([nn.bias_H for nn in networks])
+        population.bias_O = np.stack([nn.bias_O for nn in networks])
+        return population
+
+    def __len__(self):
+        return len(self.weights_IH)
+
+    # a NeuralNetwork whose weights are views into network i of the population (training either one trains both):
+    def network(self, i):
+        nn = NeuralNetwork.__new__(NeuralNetwork)
+        nn.nr_inputs, nn.nr_hidden, nn.nr_outputs = self.nr_inputs, self.nr_hidden, self.nr_outputs
+        nn.learning_rate, nn.backend = self.learning_rate, 'numpy'
+        nn.weights_IH, nn.weights_HO = self.weights_IH[i], self.weights_HO[i]
+        nn.bias_H, nn.bias_O = self.bias_H[i], self.bias_O[i]
+        return nn
+
+    def sigmoid(self, x):
+        return 1 / (1 + np.exp(-x))
+
+    def d_sigmoid(self, y):
+        return y * (1 - y)
+
+    # forward pass of every network with its own sample: inputs N x nr_inputs -> (hidden N x nr_hidden x 1,
+    # outputs N x nr_outputs x 1):
+    def feed_forward(self, inputs):
+        inputs = np.asarray(inputs, dtype=float).reshape(-1, self.nr_inputs, 1)
+        hidden = self.sigmoid(np.matmul(self.weights_IH, inputs) + self.bias_H)
+        return hidden, self.sigmoid(np.matmul(self.weights_HO, hidden) + self.bias_O)
+
+    # predictions of all networks, N x nr_outputs:
+    def predict(self, inputs):
+        return self.feed_forward(inputs)[1][:, :, 0]
+
+    # one back-propagation step of every network on its own sample (the same update as NeuralNetwork.train()):
+    def train(self, inputs, targets):
+        inputs = np.asarray(inputs, dtype=float).reshape(-1, self.nr_inputs, 1)
+        targets = np.asarray(targets, dtype=float).reshape(-1, self.nr_outputs, 1)
+        hidden, outputs = self.feed_forward(inputs)
+        output_errors = targets - outputs
+        hidden_errors = np.matmul(self.weights_HO.transpose(0, 2, 1), output_errors)
+        grad = self.d_sigmoid(outputs) * output_errors * self.learning_rate
+        grad_h = self.d_sigmoid(hidden) * hidden_errors * self.learning_rate
+        self.weights_HO += np.matmul(grad, hidden.transpose(0, 2, 1))
+        self.weights_IH += np.matmul(grad_h, inputs.transpose(0, 2, 1))
+        self.bias_O += grad
+        self.bias_H += grad_h
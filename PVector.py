@@ -2,6 +2,9 @@
 from math import *
 
 class PVector:
+    # only the two coordinates are stored (no per-instance __dict__): smaller and faster vectors
+    __slots__ = ('x', 'y')
+
     def __init__(self, x, y):  # initiation of vector class
         self.x = x
         self.y = y
@@ -14,12 +17,15 @@ class PVector:
         mag = sqrt(self.x * self.x + self.y * self.y)
         return mag
 
+    # the squared magnitude: no sqrt, enough to compare lengths
+    def magnitude_sq(self):
+        return self.x * self.x + self.y * self.y
+
     def set_Magnitude(self, a):
-        if self.get_Magnitude() != 0:
-            m_x = self.x * a / self.get_Magnitude()
-            m_y = self.y * a / self.get_Magnitude()
-            self.x = m_x
-            self.y = m_y
+        mag = self.get_Magnitude()
+        if mag != 0:
+            self.x = self.x * a / mag
+            self.y = self.y * a / mag
         else:
             self.x = 0
             self.y = 0
@@ -31,10 +37,13 @@ class PVector:
 
     # subtracts vector v from self and puts the result in new vector
     def Sub(self, v):
-        w = PVector(0, 0)  # create temporary vector
-        w.x = self.x - v.x
-        w.y = self.y - v.y
-        return w
+        return PVector(self.x - v.x, self.y - v.y)
+
+    # subtracts vector v from self and replace (no new vector):
+    def isub(self, v):
+        self.x = self.x - v.x
+        self.y = self.y - v.y
+        return self
 
     # adds constant c to vector:
     def AddC(self, c):
@@ -48,19 +57,24 @@ class PVector:
 
     # vector divide returns a new vector as the result of the division by number a:
     def Div(self, a):
-        v = PVector(0, 0)  # create temporary vector
+        v = PVector(self.x, self.y)
+        return v.idiv(a)
+
+    # divides self by number a and replace (no new vector):
+    def idiv(self, a):
         if a != 0:
-            v.x = self.x / a
-            v.y = self.y / a
-        elif a == 0:
-            v.x = 999999
-            v.y = 999999
-        return v
+            self.x = self.x / a
+            self.y = self.y / a
+        else:
+            self.x = 999999
+            self.y = 999999
+        return self
 
     # clockwise rotate vector by angle a (in rads):
     def Rotate(self, a):
-        new_x = self.x * cos(a) - self.y * sin(a)
-        new_y = self.x * sin(a) + self.y * cos(a)
+        c, s = cos(a), sin(a)
+        new_x = self.x * c - self.y * s
+        new_y = self.x * s + self.y * c
         self.x = new_x
         self.y = new_y
 
@@ -69,17 +83,28 @@ class PVector:
         v.x = self.x
         v.y = self.y
 
+    # returns a new vector with the same coordinates:
+    def copy(self):
+        return PVector(self.x, self.y)
+
     # divides by the magnitude of the vector
     def Normalize(self):
-        if self.get_Magnitude() != 0:
-            self.x = self.x / self.get_Magnitude()
-            self.y = self.y / self.get_Magnitude()
+        self.normalize_inplace()
+
+    # same as Normalize(), with one sqrt, returning self:
+    def normalize_inplace(self):
+        mag = self.get_Magnitude()
+        if mag != 0:
+            self.x = self.x / mag
+            self.y = self.y / mag
         else:
             self.x = 0
             self.y = 0
+        return self
 
+    # compare the squared magnitude, so no sqrt is needed when the vector is within the limit:
     def Limit(self, lim):
-        if self.get_Magnitude() > lim:
+        if lim < 0 or self.x * self.x + self.y * self.y > lim * lim:
             self.set_Magnitude(lim)
 
     def InnerProduct(self, v):
@@ -104,5 +129,52 @@ class PVector:
 
     # the distance between two vectors
     def Distance(self, v):
-        dist = sqrt(pow(abs(self.x - v.x), 2) + pow(abs(self.y - v.y), 2))
-        return dist
+        dx = self.x - v.x
+        dy = self.y - v.y
+        return sqrt(dx * dx + dy * dy)
+
+    # the squared distance between two vectors: no sqrt, enough to compare distances
+    def distance_sq(self, v):
+        dx = self.x - v.x
+        dy = self.y - v.y
+        return dx * dx + dy * dy
+
+    # ------------------------------------------------------------------
+    # operators: +, - and * / by a number return new vectors, +=, -=, *= and /= change the vector
+    def __add__(self, v):
+        return PVector(self.x + v.x, self.y + v.y)
+
+    def __sub__(self, v):
+        return PVector(self.x - v.x, self.y - v.y)
+
+    def __mul__(self, a):
+        return PVector(self.x * a, self.y * a)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, a):
+        return self.Div(a)
+
+    def __neg__(self):
+        return PVector(-self.x, -self.y)
+
+    def __iadd__(self, v):
+        self.Add(v)
+        return self
+
+    def __isub__(self, v):
+        return self.isub(v)
+
+    def __imul__(self, a):
+        self.Mult(a)
+        return self
+
+    def __itruediv__(self, a):
+        return self.idiv(a)
+
+    def __iter__(self):
+        yield self.x
+        yield self.y
+
+    def __repr__(self):
+        return f"PVector({self.x!r}, {self.y!r})"
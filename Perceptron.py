@@ -1,5 +1,6 @@
 from PVector import *
 from random import *
+import numpy as np
 
 # ------------------------------------------------------------------
 # The perceptron class (one neuron to classify butterfly behaviour)
@@ -36,3 +37,44 @@ class Perceptron:
             elif self.weights[i] < 0:
                 self.weights[i] = 0
 
+
+# ------------------------------------------------------------------
+# A population of perceptrons, one per butterfly, computed in one batched step: the weights of all agents are an
+# N x nr_forces array, and the forces are one shared basis of nr_forces unit vectors equally spaced around the
+# circle (nr_forces x 2) scaled by each agent's max force, the same forces every Butterfly builds for itself.
+class PerceptronPopulation:
+    def __init__(self, nr_agents, nr_forces, learning_rate, rng=None):
+        rng = np.random.default_rng() if rng is None else rng
+        # initialize the weights with random values from 0 to 1:
+        self.weights = rng.random((nr_agents, nr_forces))
+        self.c = learning_rate
+        angles = 2 * np.pi * np.arange(nr_forces) / nr_forces
+        self.basis = np.column_stack((np.cos(angles), np.sin(angles)))
+
+    # collect the weights of existing perceptrons (they must have the same number of inputs):
+    @classmethod
+    def from_perceptrons(cls, perceptrons):
+        population = cls(0, len(perceptrons[0].weights), perceptrons[0].c)
+        population.weights = np.array([p.weights for p in perceptrons], dtype=float)
+        return population
+
+    def __len__(self):
+        return len(self.weights)
+
+    # a Perceptron whose weights are a view of row i (training either one trains both):
+    def perceptron(self, i):
+        p = Perceptron.__new__(Perceptron)
+        p.weights = self.weights[i]
+        p.c = self.c
+        return p
+
+    # the total force of every agent (N x 2): the weighted sum of its forces, without activation function.
+    # max_force is the length of the forces of each agent (N):
+    def feed_forward(self, max_force):
+        return (self.weights @ self.basis) * np.asarray(max_force)[:, None]
+
+    # update all the weights according to the errors (N x 2): Dw = input * error, weight = weight + Dw, then force
+    # the weights to be in the [0..1] range:
+    def train(self, max_force, errors):
+        self.weights += self.c * (errors @ self.basis.T) * np.asarray(max_force)[:, None]
+        np.clip(self.weights, 0, 1, out=self.weights)
@@ -0,0 +1,60 @@
+# Benchmark of the separation neighbour search: uniform grid (spatial.SpatialGrid) against comparing all pairs.
+# The world grows with the number of agents so that the density stays the same as 100 butterflies on the
+# 1200x800 canvas, which is what a larger ecosystem looks like. Run from the repository root:
+#   python -m benchmarks.spatial
+import sys
+import time
+import numpy as np
+from flock import separation_sums
+from spatial import SpatialGrid
+
+SEPARATION_DISTANCE = 80
+DENSITY = 100 / (1200 * 800)  # butterflies per square pixel
+SIZES = [100, 1000, 5000, 10000, 50000]
+BRUTE_FORCE_LIMIT = 5000  # all pairs needs N x N memory and time
+
+
+# the reference: compare every butterfly with every other one
+def brute_force_sums(points, radius):
+    diff = points[:, None, :] - points[None, :, :]
+    d2 = (diff ** 2).sum(axis=2)
+    close = (d2 > 0) & (d2 < radius * radius)
+    return (diff * close[:, :, None]).sum(axis=1), close.sum(axis=1)
+
+
+def grid_sums(grid, points, radius):
+    grid.rebuild(points)
+    return separation_sums(grid, radius)
+
+
+def best_time(function, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes=SIZES, repeat=5, seed=0):
+    rng = np.random.default_rng(seed)
+    print(f"{'agents':>8} {'world':>12} {'grid ms':>10} {'us/agent':>9} {'all pairs ms':>13}")
+    for n in sizes:
+        side = np.sqrt(n / DENSITY / 1.5)  # keep the 3:2 aspect ratio of the canvas
+        width, height = 1.5 * side, side
+        points = rng.uniform((0, 0), (width, height), (n, 2))
+        grid = SpatialGrid(SEPARATION_DISTANCE, width, height)
+
+        grid_time = best_time(lambda: grid_sums(grid, points, SEPARATION_DISTANCE), repeat)
+        brute = "-"
+        if n <= BRUTE_FORCE_LIMIT:
+            # check the grid finds exactly the same neighbours:
+            total, count = grid_sums(grid, points, SEPARATION_DISTANCE)
+            ref_total, ref_count = brute_force_sums(points, SEPARATION_DISTANCE)
+            assert np.array_equal(count, ref_count) and np.allclose(total, ref_total)
+            brute = f"{best_time(lambda: brute_force_sums(points, SEPARATION_DISTANCE), repeat) * 1000:.2f}"
+        print(f"{n:>8} {f'{width:.0f}x{height:.0f}':>12} {grid_time * 1000:>10.2f} {grid_time / n * 1e6:>9.2f} {brute:>13}")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or SIZES)
@@ -0,0 +1,239 @@
+# Seeded, headless benchmark suite: PVector operations, the steering behaviours, the Perceptron and NeuralNetwork,
+# a full butterfly_behaviours() frame for 10 to 10k butterflies (one at a time and with the flock engine) and the
+# composited rendering of the flock.
+# Results are written as JSON so runs can be compared, and a stored baseline flags regressions:
+#   python -m benchmarks.suite --output results.json
+#   python -m benchmarks.suite --baseline results.json      (exit code 1 if something got slower)
+import argparse
+import json
+import platform
+import random as rand
+import sys
+import time
+import numpy as np
+from PVector import PVector
+from Perceptron import Perceptron
+from NeuralNetwork import NeuralNetwork
+from headless import create_ecosystem
+
+FRAME_SIZES = [10, 100, 1000, 10000]
+THRESHOLD = 0.10  # a benchmark more than 10% slower than the baseline is a regression
+
+
+# ------------------------------------------------------------------
+# best time per call of function over a few repeats of number calls (the minimum is the least noisy estimate):
+def measure(function, number, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def seed_all(seed):
+    rand.seed(seed)
+    np.random.seed(seed)
+
+
+# ------------------------------------------------------------------
+def pvector_benchmarks(number):
+    a, b = PVector(3.5, -2.25), PVector(-1.5, 4.75)
+    v = PVector(0, 0)
+
+    def normalize():
+        v.set(3.5, -2.25)
+        v.Normalize()
+
+    def limit():
+        v.set(3.5, -2.25)
+        v.Limit(1.5)
+
+    return {
+        "pvector.add": measure(lambda: v.Add(b), number),
+        "pvector.sub": measure(lambda: a.Sub(b), number),
+        "pvector.normalize": measure(normalize, number),
+        "pvector.limit": measure(limit, number),
+        "pvector.distance": measure(lambda: a.Distance(b), number),
+    }
+
+
+# every steering behaviour of one butterfly among n (separate searches the spatial index of all of them):
+def steering_benchmarks(number, n=100, seed=0):
+    seed_all(seed)
+    canvas, butterflies, step = create_ecosystem(n, seed=seed)
+    for _ in range(10):  # get the butterflies moving
+        step()
+    from spatial import SpatialHash
+    neighbours = SpatialHash(80, butterflies)
+    butterfly = butterflies[0]
+    food = PVector(600, 400)
+    return {
+        "steering.wander": measure(butterfly.wander, number),
+        "steering.seek": measure(lambda: butterfly.seek(food, "none"), number),
+        "steering.boundaries": measure(butterfly.boundaries, number),
+        f"steering.separate_{n}": measure(lambda: butterfly.separate(neighbours), number),
+        "steering.move": measure(butterfly.move, number),
+        "steering.bounce": measure(butterfly.bounce, number),
+        "steering.apply_perceptron": measure(lambda: butterfly.apply_perceptron(food), number),
+    }
+
+
+def learning_benchmarks(number, seed=0):
+    seed_all(seed)
+    forces = [PVector(0.2, 0) for _ in range(8)]
+    for i, force in enumerate(forces):
+        force.Rotate(2 * np.pi * i / 8)
+    perceptron = Perceptron(8, 0.01)
+    error = PVector(10, -5)
+    nn = NeuralNetwork(2, 4, 2, 0.1)
+    nn_matrix = NeuralNetwork(2, 4, 2, 0.1, backend='matrix')
+    sample, target = [0.3, 0.7], [0.5, 0.5]
+    return {
+        "perceptron.feed_forward": measure(lambda: perceptron.feed_forward(forces), number),
+        "perceptron.train": measure(lambda: perceptron.train(forces, error), number),
+        "nn.predict": measure(lambda: nn.predict(sample), number),
+        "nn.train": measure(lambda: nn.train(sample, target), number),
+        "nn.predict[matrix]": measure(lambda: nn_matrix.predict(sample), number),
+        "nn.train[matrix]": measure(lambda: nn_matrix.train(sample, target), number),
+    }
+
+
+# one full frame of n butterflies (wander, boundaries, separate, move, bounce):
+def frame_benchmarks(sizes, seed=0, flock=False):
+    results = {}
+    for n in sizes:
+        seed_all(seed)
+        canvas, butterflies, step = create_ecosystem(n, seed=seed, flock=flock)
+        step()  # warm up
+        number = max(1, 2000 // n)
+        results[f"frame.{'flock' if flock else 'scalar'}_{n}"] = measure(step, number, repeat=3)
+    return results
+
+
+# compositing all the sprites of a flock into one frame (render.CompositeRenderer):
+def render_benchmarks(sizes, seed=0):
+    results = {}
+    for n in sizes:
+        seed_all(seed)
+        canvas, butterflies, step = create_ecosystem(n, seed=seed, flock=True)
+        flock = butterflies[0].flock
+        flock.use_renderer('composite')
+        results[f"render.composite_{n}"] = measure(flock.draw, max(1, 200 // n), repeat=3)
+    return results
+
+
+# one frame of n butterflies hunted by n / 10 wasps, the caught butterflies replaced so the size stays the same:
+def predator_benchmarks(sizes, seed=0):
+    from wasp import WaspSwarm, step_predators
+    results = {}
+    for n in sizes:
+        seed_all(seed)
+        canvas, butterflies, step = create_ecosystem(n, seed=seed, flock=True)
+        flock = butterflies[0].flock
+        swarm = WaspSwarm.random(canvas, max(1, n // 10), seed)
+        results[f"frame.wasps_{n}"] = measure(lambda: step_predators(flock, swarm, respawn=True),
+                                              max(1, 200 // n), repeat=3)
+    return results
+
+
+# avoiding OBSTACLES rectangles with n butterflies, checked one by one and looked up in a DistanceField (field.py):
+def obstacle_benchmarks(sizes, seed=0, obstacles=50):
+    from world import Obstacle
+    results = {}
+    for n in sizes:
+        seed_all(seed)
+        canvas, butterflies, step = create_ecosystem(n, seed=seed, flock=True)
+        flock = butterflies[0].flock
+        rng = np.random.default_rng(seed)
+        for x, y, w, h in zip(*rng.uniform((100, 100, 10, 10), (1000, 600, 80, 80), (obstacles, 4)).T):
+            flock.add_obstacle(Obstacle(canvas, x, y, w, h, 'blue'))
+        number = max(1, 2000 // n)
+        results[f"obstacles.loop_{n}"] = measure(flock.avoid_environment, number, repeat=3)
+        flock.use_field()
+        results[f"obstacles.field_{n}"] = measure(flock.avoid_environment, number, repeat=3)
+    return results
+
+
+# a fan of 5 ray-cast sensors (sensors.py) for every agent of a flock of n, against the borders and the other agents:
+def sensor_benchmarks(sizes, seed=0):
+    from sensors import RaySensors, sense_flock
+    results = {}
+    sensors = RaySensors()
+    for n in sizes:
+        seed_all(seed)
+        canvas, butterflies, step = create_ecosystem(n, seed=seed, flock=True)
+        for _ in range(10):  # get the butterflies moving
+            step()
+        flock = butterflies[0].flock
+        results[f"sensors.flock_{n}"] = measure(lambda: sense_flock(sensors, flock), max(1, 200 // n), repeat=3)
+    return results
+
+
+# ------------------------------------------------------------------
+def run(sizes=FRAME_SIZES, seed=0, number=20000):
+    results = {}
+    results.update(pvector_benchmarks(number))
+    results.update(steering_benchmarks(number // 10, seed=seed))
+    results.update(learning_benchmarks(number // 10, seed=seed))
+    results.update(frame_benchmarks(sizes, seed=seed))
+    results.update(frame_benchmarks(sizes, seed=seed, flock=True))
+    results.update(render_benchmarks(sizes, seed=seed))
+    results.update(predator_benchmarks(sizes, seed=seed))
+    results.update(obstacle_benchmarks(sizes, seed=seed))
+    results.update(sensor_benchmarks(sizes, seed=seed))
+    return {
+        "meta": {"python": platform.python_version(), "numpy": np.__version__, "machine": platform.machine(),
+                 "seed": seed, "time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+        "results": results,
+    }
+
+
+# benchmarks slower than the baseline by more than threshold, as name -> (baseline, current):
+def regressions(current, baseline, threshold=THRESHOLD):
+    slower = {}
+    for name, seconds in current["results"].items():
+        before = baseline["results"].get(name)
+        if before and seconds > before * (1 + threshold):
+            slower[name] = (before, seconds)
+    return slower
+
+
+def report(current, baseline=None):
+    for name, seconds in current["results"].items():
+        line = f"{name:<32} {seconds * 1e6:>14.2f} us"
+        if baseline and name in baseline["results"]:
+            line += f"   {seconds / baseline['results'][name]:>6.2f}x baseline"
+        print(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ecosystem benchmark suite")
+    parser.add_argument("--output", "-o", help="write the results to this JSON file")
+    parser.add_argument("--baseline", "-b", help="compare with the results stored in this JSON file")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="relative slowdown that is a regression")
+    parser.add_argument("--sizes", type=int, nargs="+", default=FRAME_SIZES, help="butterflies per frame benchmark")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    current = run(args.sizes, args.seed)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(current, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(current, f, indent=2)
+
+    if baseline:
+        slower = regressions(current, baseline, args.threshold)
+        for name, (before, seconds) in slower.items():
+            print(f"REGRESSION {name}: {before * 1e6:.2f} us -> {seconds * 1e6:.2f} us")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
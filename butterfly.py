@@ -1,11 +1,101 @@
 import numpy as np
-from PIL import Image, ImageTk
+from sprites import sprite_cache, sprite_size
+from field import BOUNCE_SPACE
 import random as rand
+from itertools import repeat
+from time import perf_counter
 from Perceptron import *
 from NeuralNetwork import *
 
 
+# ------------------------------------------------------------------
+# draw the butterfly png, resized to the mass, on the canvas. The image comes from the shared sprite cache (or the
+# given one, e.g. sprites.wasp_cache). Returns the image (the caller must keep a reference to it) and the canvas item id:
+# (https://stackoverflow.com/questions/16424091/why-does-tkinter-image-not-show-up-if-created-in-a-function)
+# A headless canvas has no images: only the canvas item is created.
+def create_sprite(canvas, mass, x, y, cache=sprite_cache):
+    if getattr(canvas, 'headless', False):
+        return None, canvas.create_image(x, y)
+    photo = cache.photo(sprite_size(mass))
+    return photo, canvas.create_image(x, y, image=photo)
+
+
+# ------------------------------------------------------------------
+# one frame of the ecosystem for butterflies updated one at a time. neighbours is the SpatialHash of the butterflies
+# and food the PVector to seek, a FoodField (food.py: each butterfly seeks its nearest patch) or None to wander. The
+# optional recorder (TrajectoryRecorder) gets the frame at the end, and with a profiler (FrameProfiler) the phases are
+# timed and the neighbour checks counted (the canvas time of move() is its own phase: FrameProfiler.time_canvas()
+# times the canvas calls). dt is the time step in frames (timestep.py: less than 1 for sub-steps). With nn=True the
+# food is reached with the neural network (apply_NN()) instead of seek(). With a field (field.py: DistanceField of
+# the borders and the obstacles) the butterflies turn away from and bounce off the obstacles too, with one lookup
+# each:
+def step_butterflies(butterflies, neighbours, food=None, recorder=None, profiler=None, dt=1, nn=False, field=None):
+    start = perf_counter() if profiler is not None else 0
+    for butterfly, target in zip(butterflies, food_targets(butterflies, food)):
+        # First, determine the primary goal: seek food or wander.
+        if target is not None and nn:
+            butterfly.apply_NN(target)
+        elif target is not None:
+            # butterfly.apply_perceptron(target)
+            butterfly.seek(target, direction="none")
+        else:
+            butterfly.wander(dt)
+        if profiler is not None:
+            start = profiler.lap('wander' if target is None else 'nn' if nn else 'seek', start)
+
+        # Apply other behaviors like avoiding borders and other butterflies.
+        # These behaviors accumulate forces in the butterfly's acceleration vector.
+        if field is not None:
+            butterfly.avoid_field(field)  # the borders and the obstacles
+        else:
+            butterfly.boundaries()
+        if profiler is not None:
+            start = profiler.lap('boundaries', start)
+            candidates = list(neighbours.near(butterfly.location, 80))
+            profiler.count('neighbour_checks', len(candidates))
+            butterfly.separate(candidates)
+            start = profiler.lap('separate', start)
+            canvas = profiler.phases.get('canvas', 0)
+        else:
+            butterfly.separate(neighbours)
+
+        # Then, update the butterfly's position based on all accumulated forces.
+        butterfly.move(dt)
+        if profiler is not None:
+            now = perf_counter()
+            profiler.add_time('move', now - start - (profiler.phases.get('canvas', 0) - canvas))
+            start = now
+
+        # Finally, enforce hard boundaries.
+        butterfly.bounce()
+        if field is not None:
+            butterfly.bounce_field(field)
+        # keep the spatial index up to date for the next butterflies:
+        neighbours.update(butterfly)
+        if profiler is not None:
+            start = profiler.lap('bounce', start)
+
+    if hasattr(food, 'consume_butterflies'):
+        food.consume_butterflies(butterflies)
+        if profiler is not None:
+            profiler.lap('eat', start)
+    if recorder is not None:
+        recorder.record_butterflies(butterflies)
+
+
+# the target of every butterfly for this frame: the food point for all of them, or the nearest patch of a FoodField
+# found with one batched query (None: wander)
+def food_targets(butterflies, food):
+    if hasattr(food, 'targets_of'):
+        return food.targets_of(butterflies)
+    return repeat(food)
+
+
 class Butterfly:
+    sprites = sprite_cache  # where the sprite images come from
+    nn = None  # the NeuralNetwork of apply_NN(), created on the first use unless one is given (it can be shared)
+    experience = None  # where apply_NN() sends its training samples (training.TrainingPipeline), None: train now
+
     # Initialize and draw the butterfly. max speed is the maximum speed the butterfly can move:
     def __init__(self, canvas, max_speed, max_force, max_mass):
         self.canvas = canvas
@@ -23,15 +113,9 @@ class Butterfly:
         self.mass = max_mass
         self.wander_theta = 0  # initial angle for wander method
 
-        # open butterfly png file, resize it and draw it on the canvas using Pillow (ImageTk):
-        # Note: I must save the image to a class variable, because if not, it will collect garbage after the class is
-        # instantiated:
-        # (https://stackoverflow.com/questions/16424091/why-does-tkinter-image-not-show-up-if-created-in-a-function)
-        image = Image.open('butterfly.png')
-        SIZE = int(self.mass * 10)  # size equivalent to mass
-        im = image.resize((SIZE, SIZE))
-        self.image = ImageTk.PhotoImage(im)
-        self.id = self.canvas.create_image(self.location.x, self.location.y, image=self.image)
+        # draw the butterfly on the canvas. Note: I must save the image to a class variable, because if not, it will
+        # collect garbage after the class is instantiated:
+        self.image, self.id = create_sprite(self.canvas, self.mass, self.location.x, self.location.y, self.sprites)
 
         #---- perceptron engine data -----
         nr_forces = 8  # 3 is the minimum nr of forces to be equally spaced around the circle. More forces: smaller radius
@@ -64,18 +148,15 @@ class Butterfly:
         elif self.location.y > self.canvas_height - DISTANCE_FROM_BORDER:  # close to floor
             desired = PVector(self.velocity.x, -self.max_speed)
         else:
-            desired = PVector(0, 0)
+            return  # far from the borders: no steering force
 
-        if desired.get_Magnitude() != 0:  # if desired has an assigned value from above:
+        if desired.magnitude_sq() != 0:  # if desired has an assigned value from above:
             # Subtract the desired from the current velocity to create the steering force vector:
-            steer = desired.Sub(self.velocity)  # steer = desired - current velocity
+            steer = desired.isub(self.velocity)  # steer = desired - current velocity
             # Limit the steering force depending on the vehicle max force and mass:
             steer.Limit(self.max_force*2)  # 100% more force when bouncing
-        else:
-            steer = PVector(0, 0)
-
-        # finally apply the steering force:
-        self.apply_force(steer)
+            # finally apply the steering force:
+            self.apply_force(steer)
 
     # ------------------------------------------------------------------
     # a simple bounce off the edges method: set velocity to reverse in all cases
@@ -119,16 +200,13 @@ class Butterfly:
             desired = PVector(self.velocity.x, self.max_speed)
 
         else:
-            desired = PVector(0, 0)
+            return  # not approaching the obstacle: no steering force
 
-        if desired.get_Magnitude() != 0:
-            steer = desired.Sub(self.velocity)  # steer = desired - current velocity
-            steer.Normalize()
+        if desired.magnitude_sq() != 0:
+            steer = desired.isub(self.velocity)  # steer = desired - current velocity
+            steer.normalize_inplace()
             steer.Mult(self.max_force*1.5)
-        else:
-            steer = PVector(0, 0)
-
-        self.apply_force(steer)
+            self.apply_force(steer)
 
 
     # ------------------------------------------------------------------
@@ -147,28 +225,64 @@ class Butterfly:
         if abs(self.location.y - (obstacle.y + obstacle.size_y)) <= space and obstacle.x <= self.location.x <= obstacle.x + obstacle.size_x:
             self.velocity.y *= -1
 
+    # ------------------------------------------------------------------
+    # avoid the borders and all the obstacles of a DistanceField (field.py) with one lookup: near the nearest one
+    # the velocity component towards it is turned into max speed away from it, as boundaries() and avoid_obstacle()
+    # do for the side they find
+    def avoid_field(self, field):
+        distance, nx, ny, strength = field.sample_at(self.location.x, self.location.y)
+        if distance >= field.reach:
+            return  # far from the borders and the obstacles: no steering force
+        # steer = desired - velocity, where desired has the normal component max_speed:
+        towards = self.max_speed - (self.velocity.x * nx + self.velocity.y * ny)
+        steer = PVector(towards * nx, towards * ny)
+        steer.Limit(self.max_force * strength)
+        self.apply_force(steer)
+
+    # bounce off the obstacles of a DistanceField: reverse the velocity component towards the nearest one when closer
+    # than space, and move out of it if inside
+    def bounce_field(self, field, space=BOUNCE_SPACE):
+        distance, nx, ny, strength = field.sample_at(self.location.x, self.location.y)
+        if distance > space:
+            return
+        towards = self.velocity.x * nx + self.velocity.y * ny
+        if towards < 0:
+            self.velocity.x -= 2 * towards * nx
+            self.velocity.y -= 2 * towards * ny
+        if distance < 0:
+            dx, dy = (space - distance) * nx, (space - distance) * ny
+            self.location.x += dx
+            self.location.y += dy
+            self.canvas.move(self.id, dx, dy)
+
 # ------------------------------------------------------------------
-    # the move method updates the location based on the velocity by adding the two vectors, and moves the object
-    def move(self):
+    # the move method updates the location based on the velocity by adding the two vectors, and moves the object.
+    # Acceleration and velocity are per frame, dt is the time step in frames (timestep.py):
+    def move(self, dt=1):
         # add acceleration to velocity:
-        self.velocity.Add(self.acceleration)
+        self.velocity.x += self.acceleration.x * dt
+        self.velocity.y += self.acceleration.y * dt
         # limit maximum velocity
         self.velocity.Limit(self.max_speed)
         # add velocity to position:
-        self.location.Add(self.velocity)
+        dx, dy = self.velocity.x * dt, self.velocity.y * dt
+        self.location.x += dx
+        self.location.y += dy
         # reset the acceleration at the end of each frame:
-        self.acceleration.Mult(0)
-        # update the position of the image with the specific id by the pixels specified by the velocity:
-        self.canvas.move(self.id, self.velocity.x, self.velocity.y)
+        self.acceleration.set(0, 0)
+        # update the position of the image with the specific id by the pixels moved:
+        self.canvas.move(self.id, dx, dy)
 
 
     # ------------------------------------------------------------------
     # apply a force to the butterfly object:
     def apply_force(self, force):
-        f = PVector(0, 0)
-        force.Copy(f)  # copy force to temporary f
-        f = force.Div(self.mass)
-        self.acceleration.Add(f)  # update the acceleration vector
+        # update the acceleration vector with force / mass, without a temporary vector:
+        if self.mass != 0:
+            self.acceleration.x += force.x / self.mass
+            self.acceleration.y += force.y / self.mass
+        else:
+            self.acceleration.Add(force.Div(self.mass))
 
     # ------------------------------------------------------------------
     # Method to calculate and apply a steering force towards a target. It receives a target point and calculates
@@ -180,20 +294,21 @@ class Butterfly:
         desired = target.Sub(self.location)  # desired velocity = target position - current position
 
         distance = desired.get_Magnitude()  # this is how far the target is
-        desired.Normalize()  # get the unit vector in the direction of the desired vector
 
-        # to use also to avoid a point - reverse:
-        if direction == 'avoid':
-            self.max_speed *= -1
+        # to use also to avoid a point - reverse (a local speed, so max_speed keeps its sign for the next frames):
+        speed = -self.max_speed if direction == 'avoid' else self.max_speed
 
-        if distance < CLOSE_ENOUGH:  # if we arrive close to the target
+        # normalize (get the unit vector in the direction of the desired vector) and scale in one multiplication:
+        if distance == 0:
+            desired.set(0, 0)
+        elif distance < CLOSE_ENOUGH:  # if we arrive close to the target
             # limit with the max speed of the vehicle (if instead -max_speed, we have fleeing behaviour)
-            desired.Mult(self.max_speed * distance / CLOSE_ENOUGH)
+            desired.Mult(speed / CLOSE_ENOUGH)
         else:
-            desired.Mult(self.max_speed)
+            desired.Mult(speed / distance)
 
         # Subtract the desired from the current velocity to create the steering force vector:
-        steer = desired.Sub(self.velocity)  # steering force = desired vector - current velocity
+        steer = desired.isub(self.velocity)  # steering force = desired vector - current velocity
 
         # Limit the steering force depending on the vehicle max force:
         steer.Limit(self.max_force)
@@ -204,21 +319,24 @@ class Butterfly:
 
 # ------------------------------------------------------------------
     # method to create a wandering path for the vehicle. Result is to calculate a target vector
-    def wander(self):
+    def wander(self, dt=1):
         # values of diameter and radius should be almost equal for natural motion
         wanderR = 30  # Radius of wander circle: smaller = more straight movement. Natural movement: (~30)
         wanderD = 50  # Distance from current location to center of the wander circle: bigger = less jitter (~50)
         change = 0.3  # random angle in radians: increase results in more jittery movement (~0.3)
+        if dt != 1:
+            change *= dt ** 0.5  # a random walk: the spread of the angle grows with the square root of the time
         self.wander_theta += rand.uniform(-change, change)   # Add new random wander theta from -change to change rads
 
         # Now we have to calculate the new location to steer towards on the wander circle:
         circle_location = PVector(self.velocity.x, self.velocity.y)  # copy velocity to circle location (center of circle)
-        circle_location.Normalize()  # create unit vector in direction of current velocity
+        circle_location.normalize_inplace()  # create unit vector in direction of current velocity
         circle_location.Mult(wanderD)  # Multiply by distance: move wanderD pixels at the direction of current velocity
         circle_location.Add(self.location)  # now circleloc is the center of the circle, in the perimeter of which we move next
         heading = self.velocity.heading2D()  # We need to know the heading to offset wander_theta
-        circleOffSet = PVector(wanderR * cos(self.wander_theta + heading), wanderR * sin(self.wander_theta + heading))
-        circle_location.Add(circleOffSet)  # this is the target to feed the seek method
+        # add the offset on the circle: this is the target to feed the seek method
+        circle_location.x += wanderR * cos(self.wander_theta + heading)
+        circle_location.y += wanderR * sin(self.wander_theta + heading)
 
         # I can either use Reynold's method to seek the target, or use the perceptron. Perceptron is slower
         # but I think gives more realistic result:
@@ -231,21 +349,28 @@ class Butterfly:
     # avoid falling into other butterflies:
     def separate(self, butterflies):
         separation_distance = 80  # the desired separation distance before activating
-        sum = PVector(0, 0)  # the sum of all vectors of butterflies closer than desired distance
+        # butterflies is either the list of all butterflies or a SpatialHash of them, then only the butterflies in
+        # the neighbouring cells are checked:
+        if hasattr(butterflies, 'near'):
+            butterflies = butterflies.near(self.location, separation_distance)
+        separation_sq = separation_distance * separation_distance  # compare squared distances: no sqrt
+        x, y = self.location.x, self.location.y
+        sum_x = sum_y = 0  # the sum of all vectors of butterflies closer than desired distance
         count = 0  # counter of all vectors of butterflies closer than desired distance
         for butterfly in butterflies:
-            # calculate the distance between this vehicle and all other vehicles:
-            distance = self.location.Distance(butterfly.location)
+            # calculate the difference vector between this vehicle and all other vehicles:
+            dx = x - butterfly.location.x
+            dy = y - butterfly.location.y
             # if distance from specific butterfly is less than desired and more than 0 (so not itself):
-            if 0 < distance < separation_distance:
-                # calculate difference vector
-                diff = self.location.Sub(butterfly.location)
-                sum.Add(diff)  # add to the sum
+            if 0 < dx * dx + dy * dy < separation_sq:
+                sum_x += dx  # add to the sum
+                sum_y += dy
                 count += 1  # increase counter by one
         # after the loop, in case at least one is closer than desired distance, calculate average vector:
         if count > 0:
+            sum = PVector(sum_x, sum_y)
             sum.set_Magnitude(self.max_speed)  # set it to max speed
-            steer = sum.Sub(self.velocity)  # steer is now the desired (sum) minus the current velocity
+            steer = sum.isub(self.velocity)  # steer is now the desired (sum) minus the current velocity
             steer.Limit(self.max_force)
             self.apply_force(steer)
 
@@ -265,20 +390,25 @@ class Butterfly:
     # ------------------------------------------------------------------
     # control position based on an array of forces weighted by the fully connected NN
     def apply_NN(self, target):
+        if self.nn is None:
+            self.nn = NeuralNetwork(2, 8, 2, 0.1)  # inputs: location x & y, outputs: force x & y
         # predict the output force from the NN:
         training_data = []
         training_data.append(self.location.x)
         training_data.append(self.location.y)  # append x and y location coordinates in simple array
         result = self.nn.predict(training_data)
-        result = result.reshape(2,)  # convert into 1-dimensional array
+        result = result.ravel()  # convert into 1-dimensional array
         # apply the resulting force from the perceptron and move the vehicle:
         self.apply_force(PVector(result[0], result[1]))
         # calculate error from current location to target:
         #error = target.Sub(self.location)
         #error_array = [error.x/self.canvas_width, error.y/self.canvas_height]
         target_array = [target.x/self.canvas_width, target.y/self.canvas_height]
-        # re-adjust the weights according to the error:
-        self.nn.train(training_data, target_array)
+        # re-adjust the weights according to the error, or leave that to the background trainer:
+        if self.experience is not None:
+            self.experience.push(training_data, target_array)
+        else:
+            self.nn.train(training_data, target_array)
 
         # I want the NN to make a decision based on the training dataset: input is location x & y,
         # make a method "train_NN" that gets called in the move method, and for each frame it collects
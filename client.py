@@ -0,0 +1,175 @@
+# Thin Tk client of the simulation server (server.py): draws the streamed butterflies and sends the mouse actions
+# back as commands. Left button: food while pressed, right button: a new obstacle, 'c': remove the obstacles.
+#   python client.py --host 127.0.0.1 --port 8765
+import argparse
+import json
+import socket
+import threading
+import numpy as np
+from server import LENGTH, RECORD, decode_message
+
+
+# ------------------------------------------------------------------
+# the connection to the server: a background thread reads the messages and merges them into the latest state (the
+# position of every agent, the food, the tick and the obstacles), which the Tk loop takes when it is ready. However
+# far the Tk loop falls behind, the client keeps one position per agent and the last obstacles, and the loop only
+# draws the newest positions of the agents that moved since it last took them.
+class StreamClient:
+    def __init__(self, host, port):
+        self.socket = socket.create_connection((host, port))
+        self.lock = threading.Lock()  # the socket writes
+        self.state_lock = threading.Lock()  # the latest state
+        self.send_command({"cmd": "hello"})
+        self.thread = threading.Thread(target=self.read_messages, daemon=True)
+        self.frames = 0  # frames received
+        self.merged = 0  # frames merged into a newer one before they were taken
+
+    # start reading the frames of a world of agents (the first message, read with read_message()):
+    def start(self, agents):
+        self.positions = np.zeros((agents, 2))
+        self.changed = np.zeros(agents, dtype=bool)  # agents moved since the last take()
+        self.tick, self.food, self.fresh = 0, None, False  # fresh: a frame came since the last take()
+        self.obstacles = None  # the newest obstacles, if they changed since the last take()
+        self.connected = True
+        self.thread.start()
+
+    def read_exactly(self, n):
+        data = bytearray()
+        while len(data) < n:
+            chunk = self.socket.recv(n - len(data))
+            if not chunk:
+                raise ConnectionError("the server closed the connection")
+            data += chunk
+        return bytes(data)
+
+    # the next decoded message (blocking):
+    def read_message(self):
+        (length,) = LENGTH.unpack(self.read_exactly(LENGTH.size))
+        return decode_message(self.read_exactly(length))
+
+    def read_messages(self):
+        try:
+            while True:
+                self.merge(self.read_message())
+        except (ConnectionError, OSError):
+            with self.state_lock:
+                self.connected = False
+
+    def merge(self, message):
+        with self.state_lock:
+            if message[0] == 'frame':
+                _, self.tick, self.food, records = message
+                index = records['index']
+                self.positions[index, 0] = records['x']
+                self.positions[index, 1] = records['y']
+                self.changed[index] = True
+                self.frames += 1
+                self.merged += self.fresh
+                self.fresh = True
+            elif message[0] == 'obstacles':
+                self.obstacles = message[1]
+
+    # the messages for the view since the last call: the obstacles if they changed, then one frame with the newest
+    # positions of the agents that moved. None at the end when the server is gone:
+    def take(self):
+        with self.state_lock:
+            messages = []
+            if self.obstacles is not None:
+                messages.append(('obstacles', self.obstacles))
+                self.obstacles = None
+            if self.fresh:
+                index = np.flatnonzero(self.changed)
+                records = np.empty(len(index), dtype=RECORD)
+                records['index'] = index
+                records['x'] = self.positions[index, 0]
+                records['y'] = self.positions[index, 1]
+                self.changed[index] = False
+                self.fresh = False
+                messages.append(('frame', self.tick, self.food, records))
+            if not self.connected:
+                messages.append(None)
+            return messages
+
+    def send_command(self, command):
+        payload = json.dumps(command).encode()
+        with self.lock:
+            self.socket.sendall(LENGTH.pack(len(payload)) + payload)
+
+    def close(self):
+        self.socket.close()
+
+
+# ------------------------------------------------------------------
+# the canvas side: one sprite per agent, moved by the frames, the obstacles and the food marker
+class ClientView:
+    def __init__(self, canvas, world):
+        from butterfly import create_sprite
+        _, width, height, masses, obstacles = world
+        self.canvas = canvas
+        self.images, self.ids = [], []
+        for mass in masses.tolist():
+            image, item = create_sprite(canvas, mass, -100, -100)  # off the canvas until the first frame
+            self.images.append(image)
+            self.ids.append(item)
+        self.obstacles = []
+        self.food = canvas.create_oval(-10, -10, -10, -10, fill='orange', width=0)
+        self.show_obstacles(obstacles)
+        self.tick = 0
+
+    def show_obstacles(self, obstacles):
+        for item in self.obstacles:
+            self.canvas.delete(item)
+        self.obstacles = [self.canvas.create_rectangle(x, y, x + w, y + h, fill='blue', width=0)
+                          for x, y, w, h in obstacles]
+
+    def apply(self, message):
+        if message[0] == 'frame':
+            _, self.tick, food, records = message
+            ids = self.ids
+            for index, x, y in records.tolist():
+                self.canvas.coords(ids[index], x, y)
+            x, y = food if food is not None else (-10, -10)
+            self.canvas.coords(self.food, x - 4, y - 4, x + 4, y + 4)
+        elif message[0] == 'obstacles':
+            self.show_obstacles(message[1])
+
+
+# ------------------------------------------------------------------
+def main(argv=None):
+    from config import REFRESH_TIME
+    from world import World
+    parser = argparse.ArgumentParser(description="Watch and steer an ecosystem served by server.py")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--obstacle", type=int, nargs=2, default=(10, 150), metavar=("WIDTH", "HEIGHT"),
+                        help="size of the obstacles placed with the right button")
+    args = parser.parse_args(argv)
+
+    stream = StreamClient(args.host, args.port)
+    world = stream.read_message()  # the first message describes the world
+    top_window, canvas = World(f"Ecosystem {args.host}:{args.port}", world[1], world[2]).create()
+    view = ClientView(canvas, world)
+    stream.start(len(world[3]))
+
+    # apply the state received since the last call (only the newest positions end up on the canvas):
+    def poll():
+        for message in stream.take():
+            if message is None:
+                top_window.title("Ecosystem (disconnected)")
+                return
+            view.apply(message)
+        canvas.after(REFRESH_TIME, poll)
+
+    canvas.bind('<ButtonPress-1>', lambda event: stream.send_command({"cmd": "food", "x": event.x, "y": event.y}))
+    canvas.bind('<ButtonRelease-1>', lambda event: stream.send_command({"cmd": "food"}))
+    canvas.bind('<ButtonPress-3>', lambda event: stream.send_command(
+        {"cmd": "obstacle", "x": event.x, "y": event.y, "width": args.obstacle[0], "height": args.obstacle[1]}))
+    top_window.bind('c', lambda event: stream.send_command({"cmd": "clear_obstacles"}))
+
+    poll()
+    top_window.mainloop()
+    stream.close()
+
+
+if __name__ == "__main__":
+    main()
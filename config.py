@@ -0,0 +1,58 @@
+import random as rand
+
+# Set the characteristics of the world: window dimensions and gravity (indicative value 4):
+WIDTH, HEIGHT = 1200, 800
+BUTTERFLIES = 10  # number of butterflies in the ecosystem
+WASPS = 0  # number of wasps in the ecosystem
+FOOD_PATCHES = 0  # number of persistent food patches (food.py) scattered at the start
+
+# the world can be larger than the window (viewport.py): the window is then a viewport that can be panned (right
+# button, arrow keys) and zoomed (mouse wheel). Off-screen chunks of the world are stepped every MAX_LAG frames:
+WORLD_WIDTH, WORLD_HEIGHT = WIDTH, HEIGHT
+CHUNK_SIZE = 400  # side of the square chunks of the world
+MAX_LAG = 4  # frames an off-screen agent may lag behind (1: every agent is stepped every frame)
+
+REFRESH_TIME = 6  # time in milliseconds for refresh the tkinter frame
+SUBSTEPS = 1  # simulation sub-steps per step of REFRESH_TIME (timestep.py)
+MAX_CATCH_UP = 5  # at most this many steps per frame when the frames come late, the rest of the time is dropped
+
+# mean parameters for the creatures, and the spreads (standard deviations) of the gaussian traits around them:
+MAX_SPEED = 3
+MAX_FORCE = 0.2
+MEAN_MASS = 4
+SPEED_SPREAD = 0.5
+FORCE_SPREAD = 0.1
+MASS_SPREAD = 0.5
+
+# mean parameters for the wasps: a little faster than the butterflies, so they can catch the slower ones:
+WASP_SPEED = 3.5
+WASP_FORCE = 0.25
+WASP_MASS = 3
+
+
+# ------------------------------------------------------------------
+# random gaussian distribution characteristics around the mean values and deviations appropriate for each type.
+# Returns max speed, max force and mass of a new butterfly:
+def butterfly_traits():
+    return (max(0.5, rand.gauss(MAX_SPEED, SPEED_SPREAD)), max(0.1, rand.gauss(MAX_FORCE, FORCE_SPREAD)),
+            max(1, rand.gauss(MEAN_MASS, MASS_SPREAD)))
+
+
+# the same for n butterflies at once, as arrays (rng is a numpy Generator). The means and spreads can be changed
+# (sweep.py):
+def butterfly_traits_array(rng, n, speed=MAX_SPEED, force=MAX_FORCE, mass=MEAN_MASS,
+                           speed_spread=SPEED_SPREAD, force_spread=FORCE_SPREAD, mass_spread=MASS_SPREAD):
+    import numpy as np
+    return (np.maximum(0.5, rng.normal(speed, speed_spread, n)), np.maximum(0.1, rng.normal(force, force_spread, n)),
+            np.maximum(1, rng.normal(mass, mass_spread, n)))
+
+
+# max speed, max force and mass of a new wasp, and of n wasps as arrays:
+def wasp_traits():
+    return max(0.5, rand.gauss(WASP_SPEED, 0.5)), max(0.1, rand.gauss(WASP_FORCE, 0.1)), max(1, rand.gauss(WASP_MASS, 0.3))
+
+
+def wasp_traits_array(rng, n):
+    import numpy as np
+    return (np.maximum(0.5, rng.normal(WASP_SPEED, 0.5, n)), np.maximum(0.1, rng.normal(WASP_FORCE, 0.1, n)),
+            np.maximum(1, rng.normal(WASP_MASS, 0.3, n)))
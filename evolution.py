@@ -0,0 +1,278 @@
+# Neuroevolution of the butterflies: a genome is one flat vector of the traits (max speed, max force, mass), the
+# perceptron weights (Butterfly.brain) and the neural network weights (Butterfly.nn). Every generation each genome
+# flies a few seeded headless episodes: a small flock of butterflies with its traits starts at random points and
+# steers with its brains (the perceptron and the network forces of apply_perceptron() and apply_NN(), without the
+# online training) while it wanders, avoids the borders and separates as usual. The fitness is how close to the
+# food the flock stays on average. The best genomes survive, the rest of the next generation are mutated crossovers of
+# tournament winners.
+# The episodes run on a process pool. The genomes of a generation are written into one shared memory block that the
+# workers attached to when they started (as shards.py), so a task is only (genome, seed) and the result one number.
+#   python evolution.py best.npz --generations 30 --population 40 --episodes 3
+# The saved genomes are loaded into butterflies with load_genomes() and apply_genome().
+import argparse
+import concurrent.futures
+import os
+import time
+import numpy as np
+from multiprocessing import shared_memory
+from config import *
+from training import get_weights, set_weights, weight_count
+
+NR_FORCES = 8  # the perceptron of a Butterfly: one weight per force
+NN_SHAPE = (2, 8, 2)  # the network of Butterfly.apply_NN(): location x & y -> force x & y
+TRAITS = 3  # max speed, max force, mass
+GENES = TRAITS + NR_FORCES + weight_count(*NN_SHAPE)
+TRAIT_RANGES = np.array([(0.5, 6.0), (0.1, 1.0), (1.0, 8.0)])  # the traits are kept within these (low, high)
+CLOSE_ENOUGH = 50  # Butterfly.seek(): an agent this close to the food is at the food
+
+
+# ------------------------------------------------------------------
+# the parts of a genome (views):
+def genome_traits(genome):
+    return genome[:TRAITS]
+
+
+def genome_perceptron(genome):
+    return genome[TRAITS:TRAITS + NR_FORCES]
+
+
+def genome_network(genome):
+    return genome[TRAITS + NR_FORCES:]
+
+
+# n random genomes: the traits of config.py, perceptron weights in [0, 1] and network weights in [-1, 1] as the
+# Perceptron and the NeuralNetwork start with:
+def random_genomes(rng, n):
+    genomes = np.empty((n, GENES))
+    genomes[:, :TRAITS] = np.column_stack(butterfly_traits_array(rng, n))
+    genomes[:, TRAITS:TRAITS + NR_FORCES] = rng.random((n, NR_FORCES))
+    genomes[:, TRAITS + NR_FORCES:] = rng.uniform(-1, 1, (n, GENES - TRAITS - NR_FORCES))
+    return genomes
+
+
+# keep the traits in their ranges and the perceptron weights in [0, 1] (as Perceptron.train() does):
+def clip_genomes(genomes):
+    genomes[:, :TRAITS] = np.clip(genomes[:, :TRAITS], TRAIT_RANGES[:, 0], TRAIT_RANGES[:, 1])
+    genomes[:, TRAITS:TRAITS + NR_FORCES] = np.clip(genomes[:, TRAITS:TRAITS + NR_FORCES], 0, 1)
+    return genomes
+
+
+# ------------------------------------------------------------------
+# one episode of a genome: n butterflies for ticks frames in a width x height world with the food at food (x, y).
+# Returns the fitness, the mean over the frames and the butterflies of 1 - distance to the food / world diagonal,
+# plus the share of them at the food:
+def run_episode(genome, seed, n, ticks, width, height, food):
+    from flock import Flock
+    from NeuralNetwork import NeuralNetwork
+    rng = np.random.default_rng(seed)
+    speed, force, mass = genome_traits(genome)
+    location = rng.uniform((0, 0), (width, height), (n, 2))
+    flock = Flock.from_arrays(width, height, location, np.zeros((n, 2)), np.zeros((n, 2)), np.full(n, speed),
+                              np.full(n, force), np.full(n, mass), np.zeros(n), brains=False, seed=seed)
+    nn = NeuralNetwork(*NN_SHAPE, 0.1, backend='numpy')
+    set_weights(nn, genome_network(genome))
+    angles = 2 * np.pi * np.arange(NR_FORCES) / NR_FORCES  # the forces of PerceptronPopulation
+    perceptron = (genome_perceptron(genome) @ np.column_stack((np.cos(angles), np.sin(angles)))) * force
+
+    food = np.asarray(food, dtype=float)
+    diagonal = np.hypot(width, height)
+    fitness = 0.0
+    for tick in range(ticks):
+        # the forces of apply_perceptron() and apply_NN() (the network sees the raw location, as in apply_NN(), so
+        # its sigmoids saturate):
+        with np.errstate(over='ignore'):
+            flock.apply_force(perceptron + nn.predict_batch(flock.location))
+        flock.update()
+        distance = np.hypot(*(flock.location - food).T)
+        fitness += 1 - distance.mean() / diagonal + np.count_nonzero(distance < CLOSE_ENOUGH) / n
+    return fitness / ticks
+
+
+# ------------------------------------------------------------------
+# worker process side: attach to the genomes block once (pool initializer), then run episodes on request
+_worker = {}
+
+
+def _attach(name, population, episode):
+    block = shared_memory.SharedMemory(name=name)
+    _worker.update(block=block, genomes=np.ndarray((population, GENES), dtype=np.float64, buffer=block.buf),
+                   episode=episode)
+
+
+def _evaluate(candidate, seed):
+    return run_episode(_worker['genomes'][candidate].copy(), seed, **_worker['episode'])
+
+
+# ------------------------------------------------------------------
+# the evolution: population genomes, episodes seeded episodes per genome and generation (the same seeds for all the
+# genomes of a generation, so they are compared on the same worlds), elite genomes copied unchanged, the others
+# crossovers of two tournament winners with gaussian mutations of the given scale. workers processes (0: in this
+# process) run the episodes
+class Evolution:
+    def __init__(self, population=40, episodes=3, elite=4, tournament=3, mutation=0.1, workers=0, seed=0,
+                 n=20, ticks=300, width=WIDTH, height=HEIGHT, food=None):
+        self.population = population
+        self.episodes = episodes
+        self.elite = elite
+        self.tournament = tournament
+        self.mutation = mutation
+        self.workers = workers
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.episode = dict(n=n, ticks=ticks, width=width, height=height,
+                            food=(width / 2, height / 2) if food is None else tuple(food))
+        # the scale of the mutations of every gene:
+        self.scale = np.concatenate((TRAIT_RANGES[:, 1] - TRAIT_RANGES[:, 0], np.ones(NR_FORCES),
+                                     2 * np.ones(GENES - TRAITS - NR_FORCES))) * mutation
+        self.generation = 0
+        self.history = []  # per generation: best, mean, episodes, seconds
+
+        if workers:
+            self.block = shared_memory.SharedMemory(create=True, size=population * GENES * 8)
+            self.genomes = np.ndarray((population, GENES), dtype=np.float64, buffer=self.block.buf)
+            self.pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=_attach,
+                                                               initargs=(self.block.name, population, self.episode))
+        else:
+            self.block = None
+            self.genomes = np.empty((population, GENES))
+            self.pool = None
+        self.genomes[:] = clip_genomes(random_genomes(self.rng, population))
+        self.fitness = np.full(population, -np.inf)
+
+    # the fitness of every genome: the mean of its episodes
+    def evaluate(self):
+        seeds = [self.seed * 1000003 + self.generation * self.episodes + e for e in range(self.episodes)]
+        tasks = [(candidate, seed) for candidate in range(self.population) for seed in seeds]
+        if self.pool is None:
+            results = [run_episode(self.genomes[candidate], seed, **self.episode) for candidate, seed in tasks]
+        else:
+            chunk = max(1, len(tasks) // (4 * self.workers))
+            results = list(self.pool.map(_evaluate, *zip(*tasks), chunksize=chunk))
+        self.fitness = np.array(results).reshape(self.population, self.episodes).mean(axis=1)
+        return self.fitness
+
+    # the next generation from the evaluated one, written into the genomes in place:
+    def reproduce(self):
+        rng = self.rng
+        ranking = np.argsort(-self.fitness)
+        children = np.empty_like(self.genomes)
+        children[:self.elite] = self.genomes[ranking[:self.elite]]
+        k = self.population - self.elite
+        # tournaments: the fittest of tournament random genomes, twice per child
+        entrants = rng.integers(0, self.population, (2 * k, self.tournament))
+        winners = entrants[np.arange(2 * k), self.fitness[entrants].argmax(axis=1)]
+        mothers, fathers = self.genomes[winners[:k]], self.genomes[winners[k:]]
+        children[self.elite:] = np.where(rng.random((k, GENES)) < 0.5, mothers, fathers)  # uniform crossover
+        children[self.elite:] += rng.normal(0, 1, (k, GENES)) * self.scale
+        self.genomes[:] = clip_genomes(children)
+
+    # one generation: evaluate and reproduce. Returns the statistics of the evaluated generation
+    def step(self, log=print):
+        start = time.perf_counter()
+        fitness = self.evaluate()
+        seconds = time.perf_counter() - start
+        episodes = self.population * self.episodes
+        stats = {'generation': self.generation, 'best': float(fitness.max()), 'mean': float(fitness.mean()),
+                 'episodes': episodes, 'seconds': seconds, 'episodes_per_second': episodes / seconds}
+        self.history.append(stats)
+        log(f"generation {self.generation}: best {stats['best']:.4f} mean {stats['mean']:.4f}, "
+            f"{episodes} episodes in {seconds:.2f} s ({stats['episodes_per_second']:.1f} episodes/s)")
+        self.best = self.genomes[np.argsort(-fitness)].copy()  # the evaluated genomes, the fittest first
+        self.best_fitness = np.sort(fitness)[::-1]
+        self.reproduce()
+        self.generation += 1
+        return stats
+
+    def run(self, generations, log=print):
+        for _ in range(generations):
+            self.step(log)
+        return self.best
+
+    # the evaluated genomes of the last generation, the fittest first, with their fitness:
+    def save(self, path, count=None):
+        count = len(self.best) if count is None else count
+        np.savez(path, genomes=self.best[:count], fitness=self.best_fitness[:count], nn_shape=NN_SHAPE,
+                 nr_forces=NR_FORCES)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+        if self.block is not None:
+            self.genomes = self.genomes.copy()
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ------------------------------------------------------------------
+# the genomes saved by Evolution.save(), the fittest first:
+def load_genomes(path):
+    with np.load(path) as data:
+        if tuple(data['nn_shape']) != NN_SHAPE or int(data['nr_forces']) != NR_FORCES:
+            raise ValueError(f"{path} has genomes of another brain shape")
+        return data['genomes'].copy()
+
+
+# give a butterfly (a Butterfly or a flock view) the traits and the brains of a genome: the perceptron weights go
+# into its brain and the network weights into a new NeuralNetwork as its nn. The sprite keeps its size
+def apply_genome(butterfly, genome):
+    from NeuralNetwork import NeuralNetwork
+    butterfly.max_speed, butterfly.max_force, butterfly.mass = (float(value) for value in genome_traits(genome))
+    weights = genome_perceptron(genome)
+    for force, value in enumerate(weights.tolist()):
+        butterfly.brain.weights[force] = value
+    if hasattr(butterfly, 'forces'):
+        # the forces of a Butterfly are as long as its max force:
+        for force in butterfly.forces:
+            force.Normalize()
+            force.Mult(butterfly.max_force)
+    nn = NeuralNetwork(*NN_SHAPE, 0.1, backend='numpy')
+    set_weights(nn, genome_network(genome))
+    butterfly.nn = nn
+    return butterfly
+
+
+# the genome of a butterfly (the inverse of apply_genome(), e.g. to seed an evolution with trained butterflies):
+def butterfly_genome(butterfly):
+    if butterfly.nn is None:
+        raise ValueError("the butterfly has no network yet")
+    return np.concatenate(([butterfly.max_speed, butterfly.max_force, butterfly.mass],
+                           np.asarray(butterfly.brain.weights, dtype=float), get_weights(butterfly.nn)))
+
+
+# ------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evolve the butterfly brains and traits in seeded headless episodes")
+    parser.add_argument("output", help="file (.npz) the best genomes of the last generation are saved to")
+    parser.add_argument("--generations", "-g", type=int, default=30)
+    parser.add_argument("--population", "-p", type=int, default=40)
+    parser.add_argument("--episodes", "-e", type=int, default=3, help="seeded episodes per genome and generation")
+    parser.add_argument("--elite", type=int, default=4, help="genomes copied unchanged into the next generation")
+    parser.add_argument("--mutation", type=float, default=0.1, help="scale of the mutations")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (0: no pool)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--butterflies", "-n", type=int, default=20, help="butterflies per episode")
+    parser.add_argument("--ticks", "-k", type=int, default=300, help="frames per episode")
+    parser.add_argument("--keep", type=int, default=10, help="number of genomes saved")
+    args = parser.parse_args(argv)
+    if not 0 <= args.elite < args.population:
+        parser.error("--elite must be less than --population")
+
+    with Evolution(args.population, args.episodes, args.elite, mutation=args.mutation, workers=args.workers,
+                   seed=args.seed, n=args.butterflies, ticks=args.ticks) as evolution:
+        start = time.perf_counter()
+        evolution.run(args.generations)
+        evolution.save(args.output, args.keep)
+    episodes = sum(stats['episodes'] for stats in evolution.history)
+    print(f"{episodes} episodes in {time.perf_counter() - start:.1f} s, best fitness {evolution.best_fitness[0]:.4f}")
+
+
+if __name__ == "__main__":
+    main()
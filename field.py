@@ -0,0 +1,138 @@
+import numpy as np
+from math import ceil, floor
+
+# Distance field of the static environment: the borders of the world and the obstacle rectangles (world.Obstacle or
+# anything with x, y, size_x, size_y) rasterized once into a grid of cells. Every cell keeps the signed distance from
+# its centre to the nearest border or obstacle (negative inside an obstacle, at most reach), the unit normal pointing
+# away from it and the strength of its avoidance force, so avoiding and bouncing cost one lookup per agent whatever
+# the number of obstacles:
+#   field = DistanceField(WIDTH, HEIGHT)
+#   field.add(obstacle)                          only the cells within reach of the obstacle are painted again
+#   distance, normal, strength = field.sample(flock.location)
+# The distance between the cell centres is corrected along the normal (exact next to a straight side), so the
+# lookup doesn't have the resolution of the cells. Adding an obstacle merges it into the cells within reach of it,
+# removing one repaints those cells from the borders and obstacles that reach them.
+BORDER_FORCE = 2  # Butterfly.boundaries(): 100% more force when turning away from a border
+OBSTACLE_FORCE = 1.5  # Butterfly.avoid_obstacle(): 50% more force when turning away from an obstacle
+BOUNCE_SPACE = 5  # Butterfly.bounce_from_obstacle(): distance from an obstacle at which an agent bounces off it
+BORDERS = ('left', 'right', 'top', 'bottom')  # the keys of the border sources, the other sources are obstacles
+
+
+# ------------------------------------------------------------------
+# signed distance from the points (px, py arrays) to the rectangle x0 <= x <= x1, y0 <= y <= y1 and the unit normal
+# pointing away from it (out through the nearest side for the points inside):
+def rectangle_distance(px, py, x0, y0, x1, y1):
+    dx = np.where(px < x0, px - x0, np.where(px > x1, px - x1, 0.0))
+    dy = np.where(py < y0, py - y0, np.where(py > y1, py - y1, 0.0))
+    outside = np.hypot(dx, dy)
+    # inside: the depth below the left, right, top and bottom side
+    depths = np.stack((px - x0, x1 - px, py - y0, y1 - py))
+    side = depths.argmin(axis=0)
+    inside = outside == 0
+    distance = np.where(inside, -depths.min(axis=0), outside)
+    scale = np.divide(1.0, outside, out=np.zeros_like(outside), where=~inside)
+    nx = np.where(inside, np.array([-1.0, 1.0, 0.0, 0.0])[side], dx * scale)
+    ny = np.where(inside, np.array([0.0, 0.0, -1.0, 1.0])[side], dy * scale)
+    return distance, nx, ny
+
+
+# ------------------------------------------------------------------
+class DistanceField:
+    def __init__(self, width, height, reach=100, cell_size=4, obstacles=()):
+        self.width = width
+        self.height = height
+        self.reach = reach  # distance at which the agents start to turn away (the distances are clipped to it)
+        self.cell_size = cell_size
+        self.columns = max(1, ceil(width / cell_size))
+        self.rows = max(1, ceil(height / cell_size))
+        self.distance = np.full((self.rows, self.columns), float(reach))
+        self.normal = np.zeros((self.rows, self.columns, 2))
+        self.strength = np.zeros((self.rows, self.columns))
+        self.sources = {}  # key -> (x0, y0, x1, y1, strength): the borders and the obstacles
+        self.repaints = 0  # number of cells painted (for the profiler and the benchmarks)
+
+        # the borders are rectangles just outside the world:
+        outer = reach + 2 * cell_size
+        self.paint('left', -outer, -outer, 0, height + outer, BORDER_FORCE)
+        self.paint('right', width, -outer, width + outer, height + outer, BORDER_FORCE)
+        self.paint('top', -outer, -outer, width + outer, 0, BORDER_FORCE)
+        self.paint('bottom', -outer, height, width + outer, height + outer, BORDER_FORCE)
+        for obstacle in obstacles:
+            self.add(obstacle)
+
+    def __len__(self):
+        return len(self.sources) - 4  # the obstacles
+
+    # ------------------------------------------------------------------
+    # obstacles: add one (merged into the cells within reach of it), remove one or all of them (those cells are
+    # repainted from the rest)
+    def add(self, obstacle):
+        self.paint(id(obstacle), obstacle.x, obstacle.y, obstacle.x + obstacle.size_x, obstacle.y + obstacle.size_y,
+                   OBSTACLE_FORCE)
+
+    def remove(self, obstacle):
+        x0, y0, x1, y1, _ = self.sources.pop(id(obstacle))
+        self.repaint(*self.region(x0, y0, x1, y1))
+
+    def clear(self):
+        for key in [key for key in self.sources if key not in BORDERS]:
+            x0, y0, x1, y1, _ = self.sources.pop(key)
+            self.repaint(*self.region(x0, y0, x1, y1))
+
+    # the (row, column) slices of the cells that a rectangle reaches:
+    def region(self, x0, y0, x1, y1):
+        c0 = min(max(floor((x0 - self.reach) / self.cell_size), 0), self.columns)
+        c1 = min(max(ceil((x1 + self.reach) / self.cell_size), 0), self.columns)
+        r0 = min(max(floor((y0 - self.reach) / self.cell_size), 0), self.rows)
+        r1 = min(max(ceil((y1 + self.reach) / self.cell_size), 0), self.rows)
+        return slice(r0, r1), slice(c0, c1)
+
+    # add a source and merge its distances into the cells it reaches:
+    def paint(self, key, x0, y0, x1, y1, strength):
+        self.sources[key] = (x0, y0, x1, y1, strength)
+        rows, columns = self.region(x0, y0, x1, y1)
+        self.merge(rows, columns, (x0, y0, x1, y1, strength))
+
+    # paint the cells of the region again from the sources that reach it:
+    def repaint(self, rows, columns):
+        self.distance[rows, columns] = self.reach
+        self.normal[rows, columns] = 0
+        self.strength[rows, columns] = 0
+        for source in self.sources.values():
+            r, c = self.region(*source[:4])
+            if r.start < rows.stop and rows.start < r.stop and c.start < columns.stop and columns.start < c.stop:
+                self.merge(rows, columns, source)
+
+    # the cells of the region keep the source where it is nearer than what they have:
+    def merge(self, rows, columns, source):
+        x0, y0, x1, y1, strength = source
+        cx = (np.arange(columns.start, columns.stop) + 0.5) * self.cell_size
+        cy = (np.arange(rows.start, rows.stop) + 0.5) * self.cell_size
+        px, py = np.meshgrid(cx, cy)
+        distance, nx, ny = rectangle_distance(px, py, x0, y0, x1, y1)
+        nearer = distance < self.distance[rows, columns]
+        self.distance[rows, columns][nearer] = distance[nearer]
+        self.normal[rows, columns, 0][nearer] = nx[nearer]
+        self.normal[rows, columns, 1][nearer] = ny[nearer]
+        self.strength[rows, columns][nearer] = strength
+        self.repaints += distance.size
+
+    # ------------------------------------------------------------------
+    # the signed distance, normal and force strength at every point of an (N, 2) array:
+    def sample(self, points):
+        column = np.clip(np.floor(points[:, 0] / self.cell_size).astype(np.intp), 0, self.columns - 1)
+        row = np.clip(np.floor(points[:, 1] / self.cell_size).astype(np.intp), 0, self.rows - 1)
+        normal = self.normal[row, column]
+        # from the centre of the cell to the point along the normal:
+        offset = points - (np.column_stack((column, row)) + 0.5) * self.cell_size
+        distance = self.distance[row, column] + (offset * normal).sum(axis=1)
+        return distance, normal, self.strength[row, column]
+
+    # the same at one point, as floats (the scalar Butterfly path): distance, normal x, normal y, strength
+    def sample_at(self, x, y):
+        column = min(max(int(x // self.cell_size), 0), self.columns - 1)
+        row = min(max(int(y // self.cell_size), 0), self.rows - 1)
+        nx, ny = self.normal[row, column].tolist()
+        distance = float(self.distance[row, column]) + ((x - (column + 0.5) * self.cell_size) * nx +
+                                                        (y - (row + 0.5) * self.cell_size) * ny)
+        return distance, nx, ny, float(self.strength[row, column])
@@ -0,0 +1,675 @@
+import numpy as np
+from time import perf_counter
+from butterfly import *
+from spatial import SpatialGrid
+from field import DistanceField
+from Perceptron import PerceptronPopulation
+from render import create_renderer
+
+# ------------------------------------------------------------------
+# Structure-of-arrays flock engine: instead of one Butterfly object per agent, every agent's location, velocity,
+# acceleration, max_speed, max_force, mass and wander_theta live in contiguous NumPy arrays and the whole population
+# is stepped with a few batched array operations. The steering rules are the same as the Butterfly methods
+# (wander/seek, boundaries, separate, move and bounce), but all agents are updated from the same snapshot of the
+# previous frame instead of one after the other.
+
+
+# a PVector whose x and y are a row of an (N, 2) flock array, so the PVector methods write straight into the engine:
+class FlockVector(PVector):
+    __slots__ = ('_array', '_index')
+
+    def __init__(self, array, index):
+        self._array = array
+        self._index = index
+
+    @property
+    def x(self):
+        return float(self._array[self._index, 0])
+
+    @x.setter
+    def x(self, value):
+        self._array[self._index, 0] = value
+
+    @property
+    def y(self):
+        return float(self._array[self._index, 1])
+
+    @y.setter
+    def y(self, value):
+        self._array[self._index, 1] = value
+
+
+# ------------------------------------------------------------------
+# a thin Butterfly view onto one agent of the flock: all Butterfly methods keep working (one agent at a time) and
+# every change they make goes into the flock arrays:
+class ButterflyView(Butterfly):
+    def __init__(self, flock, index):
+        self.flock = flock
+        self.canvas = flock.canvas
+        self.canvas_width = flock.width
+        self.canvas_height = flock.height
+        self.rebind(index)
+
+    # point the view at agent index (the flock moves agents when others are removed, and its arrays when it grows):
+    def rebind(self, index):
+        flock = self.flock
+        self.index = index
+        self.location = FlockVector(flock.location, index)
+        self.velocity = FlockVector(flock.velocity, index)
+        self.acceleration = FlockVector(flock.acceleration, index)
+        if 'brain' in self.__dict__:
+            self.brain = flock.brains.perceptron(index)
+
+    @property
+    def id(self):
+        return self.flock.ids[self.index]
+
+    @property
+    def image(self):
+        return self.flock.images[self.index]
+
+    @property
+    def max_speed(self):
+        return float(self.flock.max_speed[self.index])
+
+    @max_speed.setter
+    def max_speed(self, value):
+        self.flock.max_speed[self.index] = value
+
+    @property
+    def max_force(self):
+        return float(self.flock.max_force[self.index])
+
+    @max_force.setter
+    def max_force(self, value):
+        self.flock.max_force[self.index] = value
+
+    @property
+    def mass(self):
+        return float(self.flock.mass[self.index])
+
+    @mass.setter
+    def mass(self, value):
+        self.flock.mass[self.index] = value
+
+    @property
+    def wander_theta(self):
+        return float(self.flock.wander_theta[self.index])
+
+    @wander_theta.setter
+    def wander_theta(self, value):
+        self.flock.wander_theta[self.index] = value
+
+
+# ------------------------------------------------------------------
+class Flock:
+    # the same constants the Butterfly methods use. They can be overridden per flock:
+    DISTANCE_FROM_BORDER = 100  # boundaries(): distance from the borders where it starts to change direction
+    CLOSE_ENOUGH = 50  # seek(): distance from target in order to detect arriving and stop
+    WANDER_R = 30  # wander(): radius of wander circle
+    WANDER_D = 50  # wander(): distance from current location to center of the wander circle
+    WANDER_CHANGE = 0.3  # wander(): random angle change in radians
+    SEPARATION_DISTANCE = 80  # separate(): the desired separation distance before activating
+    FLEE_DISTANCE = 100  # flee(): distance from the nearest predator at which an agent flees
+
+    # the per agent arrays, one row per agent (remove() and spawn() keep them in step):
+    AGENT_ARRAYS = ('location', 'velocity', 'acceleration', 'max_speed', 'max_force', 'mass', 'wander_theta')
+
+    sprites = sprite_cache  # sprites.py cache of the agent images
+    obstacles = ()  # rectangles (world.Obstacle or anything with x, y, size_x, size_y) to steer away from
+    field = None  # optional DistanceField (field.py) of the borders and the obstacles, see use_field()
+    recorder = None  # optional TrajectoryRecorder, called at the end of every update()
+    profiler = None  # optional FrameProfiler, timing the phases of update() and draw()
+    bounces = 0  # number of times an agent bounced off an edge
+    renderer = None  # render.py renderer used by draw(), chosen from the number of agents unless use_renderer() is called
+
+    # create a flock on the canvas with one agent per value of the max_speed, max_force and mass sequences:
+    def __init__(self, canvas, max_speed, max_force, mass, seed=None):
+        self.canvas = canvas
+        # get the canvas dimensions:
+        self.width = int(canvas.cget("width"))
+        self.height = int(canvas.cget("height"))
+        self.rng = np.random.default_rng(seed)
+
+        self.max_speed = np.array(max_speed, dtype=float)
+        self.max_force = np.array(max_force, dtype=float)
+        self.mass = np.array(mass, dtype=float)
+        n = len(self.mass)
+
+        # random initial location, velocity = 0 and acceleration = 0 as in Butterfly:
+        self.location = np.column_stack((self.rng.integers(0, self.width, n), self.rng.integers(0, self.height, n))).astype(float)
+        self.velocity = np.zeros((n, 2))
+        self.acceleration = np.zeros((n, 2))
+        self.wander_theta = np.zeros(n)
+        self.grid = SpatialGrid(self.SEPARATION_DISTANCE, self.width, self.height)
+        # perceptron engine data: one perceptron per butterfly with 8 forces, learning rate 0.01 as in Butterfly
+        self.brains = PerceptronPopulation(n, 8, 0.01, self.rng)
+
+        self.attach(canvas)
+
+    # build a flock from existing butterflies, keeping their state, perceptron weights and canvas items:
+    @classmethod
+    def from_butterflies(cls, butterflies, seed=None):
+        flock = cls.from_arrays(
+            butterflies[0].canvas_width, butterflies[0].canvas_height,
+            location=[(b.location.x, b.location.y) for b in butterflies],
+            velocity=[(b.velocity.x, b.velocity.y) for b in butterflies],
+            acceleration=[(b.acceleration.x, b.acceleration.y) for b in butterflies],
+            max_speed=[b.max_speed for b in butterflies],
+            max_force=[b.max_force for b in butterflies],
+            mass=[b.mass for b in butterflies],
+            wander_theta=[b.wander_theta for b in butterflies],
+            brains=PerceptronPopulation.from_perceptrons([b.brain for b in butterflies]),
+            seed=seed, canvas=butterflies[0].canvas)
+        flock.images = [b.image for b in butterflies]
+        flock.ids = [b.id for b in butterflies]
+        return flock
+
+    # build a flock over the given agent state (the arrays are copied), without canvas items. brains is the
+    # perceptron population (None: new random perceptrons, False: no perceptrons):
+    @classmethod
+    def from_arrays(cls, width, height, location, velocity, acceleration, max_speed, max_force, mass, wander_theta,
+                    brains=None, seed=None, canvas=None):
+        flock = cls.__new__(cls)
+        flock.canvas = canvas
+        flock.width = width
+        flock.height = height
+        flock.rng = np.random.default_rng(seed)
+
+        flock.location = np.array(location, dtype=float).reshape(-1, 2)
+        flock.velocity = np.array(velocity, dtype=float).reshape(-1, 2)
+        flock.acceleration = np.array(acceleration, dtype=float).reshape(-1, 2)
+        flock.max_speed = np.array(max_speed, dtype=float)
+        flock.max_force = np.array(max_force, dtype=float)
+        flock.mass = np.array(mass, dtype=float)
+        flock.wander_theta = np.array(wander_theta, dtype=float)
+        flock.grid = SpatialGrid(flock.SEPARATION_DISTANCE, width, height)
+        flock.brains = brains if brains is not None else PerceptronPopulation(len(flock.mass), 8, 0.01, flock.rng)
+        flock.images = []
+        flock.ids = []
+        flock.spare = []
+        return flock
+
+    # draw the flock on a canvas: one sprite per agent, unless the renderer composites them (kind as in use_renderer())
+    def attach(self, canvas, renderer=None):
+        self.canvas = canvas
+        self.images = []
+        self.ids = []
+        self.spare = []  # (image, item) of removed agents, hidden until spawn() reuses them
+        self.renderer = None
+        if renderer == 'composite':
+            self.use_renderer(renderer)
+            return
+        for i in range(len(self)):
+            image, item = create_sprite(canvas, self.mass[i], self.location[i, 0], self.location[i, 1], self.sprites)
+            self.images.append(image)
+            self.ids.append(item)
+
+    def __len__(self):
+        return len(self.mass)
+
+    # ------------------------------------------------------------------
+    # return Butterfly views onto the agents. Their brain is a view of the perceptron population, and the original
+    # butterflies can pass on any other attributes (nn, ...):
+    def view(self, index):
+        view = ButterflyView(self, index)
+        view.brain = self.brains.perceptron(index)
+        view.forces = [PVector(x, y) for x, y in (self.brains.basis * self.max_force[index]).tolist()]
+        # remembered, so remove() and spawn() can re-point it:
+        if not hasattr(self, 'registry'):
+            self.registry = {}
+        self.registry[index] = view
+        return view
+
+    def views(self, butterflies=None):
+        views = [self.view(i) for i in range(len(self))]
+        if butterflies is not None:
+            for view, butterfly in zip(views, butterflies):
+                if hasattr(butterfly, 'nn'):
+                    view.nn = butterfly.nn
+        return views
+
+    # ------------------------------------------------------------------
+    # the per agent arrays as (owner, attribute name), with the perceptron weights if the flock has perceptrons:
+    def agent_arrays(self):
+        arrays = [(self, name) for name in self.AGENT_ARRAYS]
+        if self.brains is not False:
+            arrays.append((self.brains, 'weights'))
+        return arrays
+
+    # set the number of agents to n. The agent arrays are views of the first rows of buffers with spare capacity
+    # that double when they are full, so adding agents only copies the arrays now and then. Returns True if the
+    # arrays were copied into new buffers (views onto the agents have to be re-pointed):
+    def _resize(self, n):
+        arrays = self.agent_arrays()
+        buffers = getattr(self, 'buffers', None)
+        moved = (buffers is None or len(buffers) != len(arrays) or n > len(buffers[0]) or
+                 any(getattr(owner, name).base is not buffer for (owner, name), buffer in zip(arrays, buffers)))
+        if moved:
+            capacity = max(n, 2 * len(self), 64)
+            buffers = []
+            for owner, name in arrays:
+                old = getattr(owner, name)
+                buffer = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+                count = min(len(old), n)
+                buffer[:count] = old[:count]
+                buffers.append(buffer)
+            self.buffers = buffers
+        for (owner, name), buffer in zip(arrays, self.buffers):
+            setattr(owner, name, buffer[:n])
+        return moved
+
+    # remove the agents at the indices. The last agents move into the holes (swap-remove), so only the removed rows
+    # are written, the Python lists change at the removed indices only and the arrays shrink without a copy. The
+    # canvas items of the removed agents are hidden and kept for spawn(). Agents with higher indices than the new
+    # length get the index of a removed agent: views onto them are re-pointed.
+    def remove(self, indices):
+        indices = np.unique(np.asarray(indices, dtype=np.intp))
+        n, k = len(self), len(indices)
+        if not k:
+            return
+        keep = n - k
+        holes = indices[indices < keep]  # removed agents in the rows that stay
+        tail = np.arange(keep, n)
+        fillers = tail[~np.isin(tail, indices)]  # the surviving agents of the rows that go
+        for owner, name in self.agent_arrays():
+            array = getattr(owner, name)
+            array[holes] = array[fillers]
+            setattr(owner, name, array[:keep])
+
+        holes, fillers = holes.tolist(), fillers.tolist()
+        if self.ids:
+            for i in indices.tolist():
+                self.canvas.itemconfigure(self.ids[i], state='hidden')
+                self.spare.append((self.images[i], self.ids[i]))
+            for hole, filler in zip(holes, fillers):
+                self.ids[hole], self.images[hole] = self.ids[filler], self.images[filler]
+            del self.ids[keep:], self.images[keep:]
+        registry = getattr(self, 'registry', None)
+        if registry:
+            for i in indices.tolist():
+                registry.pop(i, None)
+            for hole, filler in zip(holes, fillers):
+                view = registry.pop(filler, None)
+                if view is not None:
+                    view.rebind(hole)
+                    registry[hole] = view
+        if hasattr(self.renderer, 'set_masses'):
+            self.renderer.set_masses(self.mass)
+
+    # add one agent per value of max_speed, max_force and mass at the locations (K x 2), at rest as in the
+    # constructor and with new random perceptron weights. The hidden canvas items of removed agents are reused
+    # before new ones are created. Returns the indices of the new agents:
+    def spawn(self, location, max_speed, max_force, mass):
+        location = np.asarray(location, dtype=float).reshape(-1, 2)
+        n, k = len(self), len(location)
+        if self._resize(n + k):
+            for index, view in getattr(self, 'registry', {}).items():
+                view.rebind(index)
+        new = slice(n, n + k)
+        self.location[new] = location
+        self.velocity[new] = 0
+        self.acceleration[new] = 0
+        self.max_speed[new] = max_speed
+        self.max_force[new] = max_force
+        self.mass[new] = mass
+        self.wander_theta[new] = 0
+        if self.brains is not False:
+            self.brains.weights[new] = self.rng.random((k, self.brains.weights.shape[1]))
+
+        # the per agent canvas items, unless the renderer composites the agents:
+        if self.canvas is not None and len(self.ids) == n and getattr(self.renderer, 'kind', None) not in ('composite', 'layer'):
+            for i in range(n, n + k):
+                mass, x, y = self.mass[i], self.location[i, 0], self.location[i, 1]
+                if self.spare:
+                    image, item = self.spare.pop()
+                    if image is not None:
+                        image = self.sprites.photo(sprite_size(mass))
+                        self.canvas.itemconfigure(item, image=image, state='normal')
+                    else:
+                        self.canvas.itemconfigure(item, state='normal')
+                    self.canvas.coords(item, x, y)
+                else:
+                    image, item = create_sprite(self.canvas, mass, x, y, self.sprites)
+                self.images.append(image)
+                self.ids.append(item)
+        if hasattr(self.renderer, 'set_masses'):
+            self.renderer.set_masses(self.mass)
+        return np.arange(n, n + k)
+
+    # ------------------------------------------------------------------
+    # one frame of the butterfly_behaviours() loop for the whole flock: seek the food (PVector, or the nearest patch of
+    # a FoodField) if there is one, otherwise wander, then avoid the borders and the other butterflies, move and bounce. With perceptron=True the
+    # food is reached with the perceptrons instead of seek(), and with predators (a wasp.WaspSwarm or anything with
+    # an N x 2 location) the agents close to one flee from it:
+    def step(self, food=None, perceptron=False, predators=None):
+        self.update(food, perceptron, predators=predators)
+        self.draw()
+
+    # the simulation part of step(), without drawing. noise is the change of the wander angles (default: random), and
+    # dt the time step in frames (timestep.py: less than 1 for sub-steps):
+    def update(self, food=None, perceptron=False, noise=None, predators=None, dt=1):
+        profiler = self.profiler
+        start = perf_counter() if profiler is not None else 0
+        foraging = food is not None and hasattr(food, 'nearest')  # a FoodField (food.py) instead of one point
+        if noise is None and (food is None or foraging):
+            noise = self.wander_noise(dt)
+        if foraging:
+            self.forage(food, noise)
+        elif food is not None and perceptron:
+            self.apply_perceptron(np.array([food.x, food.y], dtype=float))
+        elif food is not None:
+            self.seek(np.array([food.x, food.y], dtype=float))
+        else:
+            self.wander(noise)
+        if profiler is not None:
+            start = profiler.lap('forage' if foraging else 'wander' if food is None else 'seek', start)
+        if predators is not None and len(predators):
+            self.flee(predators.location)
+            if profiler is not None:
+                start = profiler.lap('flee', start)
+        self.avoid_environment()
+        if profiler is not None:
+            start = profiler.lap('boundaries', start)
+        self.separate()
+        if profiler is not None:
+            start = profiler.lap('separate', start)
+            profiler.count('neighbour_checks', self.grid.checks)
+        self.move(dt)
+        if profiler is not None:
+            start = profiler.lap('move', start)
+        self.bounce()
+        if self.field is not None:
+            self.bounce_field()
+        if profiler is not None:
+            start = profiler.lap('bounce', start)
+        if foraging:
+            food.consume(self.location)
+            if profiler is not None:
+                profiler.lap('eat', start)
+        if self.recorder is not None:
+            self.recorder.record(self)
+
+    # ------------------------------------------------------------------
+    # add the forces (N x 2) divided by the mass to the acceleration:
+    def apply_force(self, forces):
+        self.acceleration += forces / self.mass[:, None]
+        if self.profiler is not None:
+            self.profiler.count('force_applications', len(self))
+
+    # ------------------------------------------------------------------
+    # Reynolds' seek towards the targets (a single point or one point per agent). With avoid=True the desired
+    # velocity is reversed (flee), as Butterfly.seek() with direction='avoid'. With agents (an index or boolean
+    # array) only those agents seek, one target per selected agent:
+    def seek(self, targets, avoid=False, agents=None):
+        location, velocity, max_speed, max_force = self.location, self.velocity, self.max_speed, self.max_force
+        if agents is not None:
+            location, velocity, max_speed, max_force = location[agents], velocity[agents], max_speed[agents], max_force[agents]
+        desired = targets - location
+        distance = np.hypot(desired[:, 0], desired[:, 1])
+        speed = -max_speed if avoid else max_speed
+        # normalize and multiply with the max speed, slowing down when we arrive close to the target:
+        scale = np.where(distance < self.CLOSE_ENOUGH, speed / self.CLOSE_ENOUGH, speed / np.where(distance != 0, distance, 1))
+        steer = limit(desired * scale[:, None] - velocity, max_force)
+        if agents is not None:
+            forces = np.zeros_like(self.velocity)
+            forces[agents] = steer
+            steer = forces
+        self.apply_force(steer)
+
+    # ------------------------------------------------------------------
+    # flee from the nearest predator closer than FLEE_DISTANCE (predators is an N x 2 array of locations). The
+    # predators are filed in a grid, and the nearest one of every agent is found with one batched query:
+    def flee(self, predators):
+        if not hasattr(self, 'predator_grid'):
+            self.predator_grid = SpatialGrid(self.FLEE_DISTANCE / 2, self.width, self.height)
+        self.predator_grid.rebuild(predators)
+        nearest, _ = self.predator_grid.nearest(self.location, self.FLEE_DISTANCE)
+        agents = np.flatnonzero(nearest >= 0)
+        if len(agents):
+            self.seek(predators[nearest[agents]], avoid=True, agents=agents)
+
+    # ------------------------------------------------------------------
+    # steer every butterfly with its perceptron: apply the weighted sum of its forces, then train the weights with the
+    # error from the current location to the target (a single point or one point per agent):
+    def apply_perceptron(self, targets):
+        self.apply_force(self.brains.feed_forward(self.max_force))
+        self.brains.train(self.max_force, targets - self.location)
+
+    # ------------------------------------------------------------------
+    # the random change of every wander angle for one frame, or for a time step of dt frames (a random walk: the
+    # spread grows with the square root of the time):
+    def wander_noise(self, dt=1):
+        change = self.WANDER_CHANGE if dt == 1 else self.WANDER_CHANGE * dt ** 0.5
+        return self.rng.uniform(-change, change, len(self))
+
+    # wander: seek a point on a circle in front of each butterfly, moved by a random angle every frame:
+    def wander(self, noise=None):
+        self.seek(self.wander_targets(noise))
+
+    def wander_targets(self, noise=None):
+        self.wander_theta += self.wander_noise() if noise is None else noise
+        circle_location = normalize(self.velocity) * self.WANDER_D + self.location
+        heading = np.arctan2(self.velocity[:, 1], self.velocity[:, 0])
+        angle = self.wander_theta + heading
+        circle_location[:, 0] += self.WANDER_R * np.cos(angle)
+        circle_location[:, 1] += self.WANDER_R * np.sin(angle)
+        return circle_location
+
+    # ------------------------------------------------------------------
+    # forage in a FoodField: seek the nearest patch within the perception radius, wander if there is none (one
+    # seek() for all the agents, with the patch or the wander point as target)
+    def forage(self, field, noise=None):
+        targets = self.wander_targets(noise)
+        slots = field.nearest(self.location)
+        found = slots >= 0
+        targets[found] = field.locations(slots[found])
+        self.seek(targets)
+
+    # ------------------------------------------------------------------
+    # turn away from the borders. The checks keep the priority of Butterfly.boundaries(): left, right, ceiling, floor
+    def boundaries(self):
+        x, y = self.location[:, 0], self.location[:, 1]
+        d = self.DISTANCE_FROM_BORDER
+        left = x < d
+        right = ~left & (x > self.width - d)
+        ceiling = ~left & ~right & (y < d)
+        floor = ~left & ~right & ~ceiling & (y > self.height - d)
+
+        desired = np.zeros_like(self.velocity)
+        desired[left] = np.column_stack((self.max_speed[left], self.velocity[left, 1]))
+        desired[right] = np.column_stack((-self.max_speed[right], self.velocity[right, 1]))
+        desired[ceiling] = np.column_stack((self.velocity[ceiling, 0], self.max_speed[ceiling]))
+        desired[floor] = np.column_stack((self.velocity[floor, 0], -self.max_speed[floor]))
+
+        active = (desired[:, 0] != 0) | (desired[:, 1] != 0)
+        steer = np.zeros_like(self.velocity)
+        steer[active] = limit(desired[active] - self.velocity[active], self.max_force[active] * 2)  # 100% more force
+        self.apply_force(steer)
+
+    # ------------------------------------------------------------------
+    # obstacles: add one (it is avoided from the next frame on), remove one or all of them. The distance field, if
+    # any, is updated where they are
+    def add_obstacle(self, obstacle):
+        self.obstacles = list(self.obstacles) + [obstacle]
+        if self.field is not None:
+            self.field.add(obstacle)
+
+    def remove_obstacle(self, obstacle):
+        self.obstacles = [o for o in self.obstacles if o is not obstacle]
+        if self.field is not None:
+            self.field.remove(obstacle)
+
+    def clear_obstacles(self):
+        self.obstacles = ()
+        if self.field is not None:
+            self.field.clear()
+
+    # avoid the borders and the obstacles with one DistanceField lookup per agent, whatever the number of obstacles.
+    # The field (a new one of the borders and the current obstacles if None) can be shared with other flocks:
+    def use_field(self, field=None, cell_size=4):
+        if field is None:
+            field = DistanceField(self.width, self.height, self.DISTANCE_FROM_BORDER, cell_size, self.obstacles)
+        self.field = field
+        return field
+
+    # the borders and the obstacles: from the distance field if there is one, otherwise checked one by one
+    def avoid_environment(self):
+        if self.field is not None:
+            self.avoid_field()
+            return
+        self.boundaries()
+        if self.obstacles:
+            self.avoid_obstacles()
+
+    # Butterfly.avoid_field() for all the agents: near the nearest border or obstacle the velocity component towards
+    # it is turned into max speed away from it
+    def avoid_field(self):
+        distance, normal, strength = self.field.sample(self.location)
+        active = np.flatnonzero(distance < self.field.reach)
+        normal = normal[active]
+        towards = self.max_speed[active] - (self.velocity[active] * normal).sum(axis=1)
+        forces = np.zeros_like(self.velocity)
+        forces[active] = limit(towards[:, None] * normal, self.max_force[active] * strength[active])
+        self.apply_force(forces)
+
+    # Butterfly.bounce_field() for all the agents: reverse the velocity component towards the nearest obstacle when
+    # closer than space, and move out of it if inside
+    def bounce_field(self, space=BOUNCE_SPACE):
+        distance, normal, _ = self.field.sample(self.location)
+        close = np.flatnonzero(distance <= space)
+        if not len(close):
+            return
+        normal, distance = normal[close], distance[close]
+        towards = np.minimum((self.velocity[close] * normal).sum(axis=1), 0)
+        self.velocity[close] -= 2 * towards[:, None] * normal
+        self.location[close] += np.maximum(space - distance, 0)[:, None] * normal * (distance < 0)[:, None]
+
+    # Butterfly.avoid_obstacle() for every obstacle: turn away from the side of the rectangle that is approached,
+    # checking the left, right, top and bottom side in this order
+    def avoid_obstacles(self, d_max=100):
+        x, y = self.location[:, 0], self.location[:, 1]
+        for obstacle in self.obstacles:
+            beside = (obstacle.y < y) & (y < obstacle.y + obstacle.size_y)
+            above_or_below = (obstacle.x < x) & (x < obstacle.x + obstacle.size_x)
+            left = beside & (np.abs(x - obstacle.x) < d_max)
+            right = ~left & beside & (np.abs(x - (obstacle.x + obstacle.size_x)) < d_max)
+            top = ~left & ~right & above_or_below & (np.abs(y - obstacle.y) < d_max)
+            bottom = ~left & ~right & ~top & above_or_below & (np.abs(y - (obstacle.y + obstacle.size_y)) < d_max)
+
+            desired = np.zeros_like(self.velocity)
+            desired[left] = np.column_stack((-self.max_speed[left], self.velocity[left, 1]))
+            desired[right] = np.column_stack((self.max_speed[right], self.velocity[right, 1]))
+            desired[top] = np.column_stack((self.velocity[top, 0], -self.max_speed[top]))
+            desired[bottom] = np.column_stack((self.velocity[bottom, 0], self.max_speed[bottom]))
+
+            active = (desired[:, 0] != 0) | (desired[:, 1] != 0)
+            if active.any():
+                steer = np.zeros_like(self.velocity)
+                steer[active] = set_magnitude(desired[active] - self.velocity[active], self.max_force[active] * 1.5)
+                self.apply_force(steer)
+
+    # ------------------------------------------------------------------
+    # steer away from every butterfly closer than the separation distance:
+    def separate(self):
+        self.grid.rebuild(self.location)
+        total, count = separation_sums(self.grid, self.SEPARATION_DISTANCE)
+        active = count > 0
+        steer = set_magnitude(total[active], self.max_speed[active]) - self.velocity[active]
+        forces = np.zeros_like(self.velocity)
+        forces[active] = limit(steer, self.max_force[active])
+        self.apply_force(forces)
+
+    # ------------------------------------------------------------------
+    # add acceleration to velocity, limit it, add velocity to location and reset the acceleration. The acceleration
+    # and the velocity are per frame, scaled by the time step dt (in frames):
+    def move(self, dt=1):
+        self.velocity += self.acceleration * dt
+        self.velocity[:] = limit(self.velocity, self.max_speed)
+        self.location += self.velocity * dt
+        self.acceleration[:] = 0
+
+    # ------------------------------------------------------------------
+    # bounce off the edges, in the same order as Butterfly.bounce() (which also truncates the other coordinate):
+    def bounce(self):
+        radius = np.trunc(self.mass * 10) / 2  # the radius is half the image size
+        x, y = self.location[:, 0], self.location[:, 1]
+        vx, vy = self.velocity[:, 0], self.velocity[:, 1]
+        bounces = 0
+
+        hit = x < radius
+        vx[hit] *= -1
+        x[hit], y[hit] = radius[hit], np.trunc(y[hit])
+        bounces += np.count_nonzero(hit)
+
+        hit = x > self.width - radius
+        vx[hit] *= -1
+        x[hit], y[hit] = self.width - radius[hit], np.trunc(y[hit])
+        bounces += np.count_nonzero(hit)
+
+        hit = y < radius
+        vy[hit] *= -1
+        x[hit], y[hit] = np.trunc(x[hit]), radius[hit]
+        bounces += np.count_nonzero(hit)
+
+        hit = y > self.height - radius
+        vy[hit] *= -1
+        x[hit], y[hit] = np.trunc(x[hit]), self.height - radius[hit]
+        self.bounces += int(bounces + np.count_nonzero(hit))
+
+    # ------------------------------------------------------------------
+    # draw with the renderer kind 'canvas', 'batched' or 'composite' (render.py), None: chosen from the number of
+    # agents. The composite renderer deletes the per agent canvas items:
+    def use_renderer(self, kind=None):
+        self.renderer = create_renderer(kind, self.canvas, self.ids, self.mass, self.width, self.height, self.sprites)
+        if self.renderer.kind == 'composite':
+            self.ids, self.images, self.spare = [], [], []  # deleted with the canvas items
+        return self.renderer
+
+    # keep the locations before a step, to draw in between (timestep.py):
+    def remember(self):
+        self.previous = self.location.copy()
+
+    # the locations alpha (0..1) of the way from the remembered ones to the current ones (the current ones if there
+    # are none, or agents were added or removed since):
+    def interpolated(self, alpha):
+        previous = getattr(self, 'previous', None)
+        if previous is None or previous.shape != self.location.shape:
+            return self.location
+        return previous + alpha * (self.location - previous)
+
+    # place the canvas images at the new locations, or interpolated between the last two steps:
+    def draw(self, alpha=None):
+        start = perf_counter() if self.profiler is not None else 0
+        if self.renderer is None:
+            self.use_renderer()
+        self.renderer.draw(self.location if alpha is None else self.interpolated(alpha))
+        if self.profiler is not None:
+            self.profiler.lap('canvas', start)
+
+
+# ------------------------------------------------------------------
+# sum of the difference vectors (self - other) and number of neighbours closer than radius for every point of the
+# grid, using only the pairs found in neighbouring cells:
+def separation_sums(grid, radius):
+    n = len(grid.points)
+    i, _, diff, _ = grid.pairs(radius)
+    total = np.column_stack((np.bincount(i, diff[:, 0], n), np.bincount(i, diff[:, 1], n)))
+    return total, np.bincount(i, minlength=n)
+
+
+# ------------------------------------------------------------------
+# row-wise vector helpers (v is N x 2, the magnitudes are N):
+def normalize(v):
+    mag = np.hypot(v[:, 0], v[:, 1])
+    return v / np.where(mag != 0, mag, 1)[:, None]
+
+
+def set_magnitude(v, a):
+    return normalize(v) * np.asarray(a)[:, None]
+
+
+def limit(v, lim):
+    mag = np.hypot(v[:, 0], v[:, 1])
+    scale = np.where(mag > lim, lim / np.where(mag != 0, mag, 1), 1)
+    return v * scale[:, None]
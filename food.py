@@ -0,0 +1,87 @@
+import numpy as np
+from world import Food
+from spatial import PointIndex
+
+# Persistent food patches for foraging scenarios: every butterfly seeks the nearest patch within its perception
+# radius (or wanders if there is none), eats from it when it gets close enough and the patch disappears when it is
+# depleted. The nearest patch of all the butterflies is found with one batched query of a PointIndex, which also
+# takes the patches that appear and disappear incrementally.
+PERCEPTION = 150  # distance at which a butterfly notices a food patch
+EAT_DISTANCE = 10  # distance from the centre of a patch at which a butterfly eats from it
+BITE = 1  # food eaten by one butterfly in one frame
+
+
+class FoodField:
+    def __init__(self, canvas, width, height, perception=PERCEPTION, eat_distance=EAT_DISTANCE, bite=BITE):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.perception = perception
+        self.eat_distance = eat_distance
+        self.bite = bite
+        self.index = PointIndex(perception, width, height)
+        self.patches = {}  # slot -> Food
+        self.eaten = 0  # total food eaten
+        self.depleted = 0  # number of patches eaten up
+
+    def __len__(self):
+        return len(self.patches)
+
+    def __iter__(self):
+        return iter(list(self.patches.values()))
+
+    # ------------------------------------------------------------------
+    def add(self, x, y, amount=100):
+        food = Food(self.canvas, x, y, amount)
+        food.slot = self.index.insert(x, y)
+        self.patches[food.slot] = food
+        return food
+
+    def remove(self, food):
+        self.index.remove(food.slot)
+        del self.patches[food.slot]
+        food.remove()
+
+    # n patches at random locations (rng: a numpy Generator):
+    def scatter(self, n, amount=100, rng=None, margin=20):
+        rng = rng if rng is not None else np.random.default_rng()
+        locations = rng.uniform((margin, margin), (self.width - margin, self.height - margin), (n, 2))
+        return [self.add(x, y, amount) for x, y in locations.tolist()]
+
+    # ------------------------------------------------------------------
+    # the slot of the nearest patch within the perception radius of every location (N x 2), -1 if there is none:
+    def nearest(self, locations):
+        return self.index.nearest(locations, self.perception)[0]
+
+    # the location of the patches in slots (N x 2):
+    def locations(self, slots):
+        return self.index.points.take(slots, axis=0)
+
+    # the butterflies closer than eat_distance to a patch take a bite from it (a patch feeds as many butterflies as
+    # it has food for, in index order). Depleted patches are removed. Returns the food eaten:
+    def consume(self, locations):
+        slots = self.index.nearest(locations, self.eat_distance)[0]
+        slots = slots[slots >= 0]
+        total = 0
+        for slot, eaters in zip(*np.unique(slots, return_counts=True)):
+            food = self.patches[int(slot)]
+            total += food.eat(self.bite * int(eaters))
+            if food.depleted():
+                self.remove(food)
+                self.depleted += 1
+        self.eaten += total
+        return total
+
+    # the same for a list of Butterfly objects: their targets (a PVector per butterfly, None to wander) and eating
+    def targets_of(self, butterflies):
+        from PVector import PVector
+        slots = self.nearest(butterfly_locations(butterflies))
+        points = self.index.points
+        return [PVector(*points[slot]) if slot >= 0 else None for slot in slots.tolist()]
+
+    def consume_butterflies(self, butterflies):
+        return self.consume(butterfly_locations(butterflies))
+
+
+def butterfly_locations(butterflies):
+    return np.array([(b.location.x, b.location.y) for b in butterflies], dtype=float).reshape(-1, 2)
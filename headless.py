@@ -0,0 +1,283 @@
+# Headless ecosystem: the same butterflies without a Tk display, for batch experiments and load tests.
+# Run N butterflies for K ticks as fast as possible and report the ticks per second:
+#   python headless.py --butterflies 1000 --ticks 500 --flock
+import argparse
+import random as rand
+import time
+from config import *
+
+
+# ------------------------------------------------------------------
+# A plain width x height bounds object that stands in for the tkinter Canvas. It answers the canvas calls the
+# butterflies make (cget, create_image, create_rectangle, move, coords, ...) and draws nothing:
+class HeadlessCanvas:
+    headless = True
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.items = 0  # number of canvas items created
+
+    def cget(self, option):
+        return {"width": self.width, "height": self.height}[option]
+
+    def create_image(self, x, y, **options):
+        self.items += 1
+        return self.items
+
+    def create_rectangle(self, x0, y0, x1, y1, **options):
+        self.items += 1
+        return self.items
+
+    def create_oval(self, x0, y0, x1, y1, **options):
+        self.items += 1
+        return self.items
+
+    def create_text(self, x, y, **options):
+        self.items += 1
+        return self.items
+
+    def move(self, item, dx, dy):
+        pass
+
+    def coords(self, item, *coords):
+        pass
+
+    def itemconfigure(self, item, **options):
+        pass
+
+    def delete(self, item):
+        pass
+
+    def bind(self, sequence, callback):
+        pass
+
+
+# ------------------------------------------------------------------
+# a headless canvas that remembers where every item is, and counts the draw calls:
+class RecordingCanvas(HeadlessCanvas):
+    def __init__(self, width, height):
+        super().__init__(width, height)
+        self.positions = {}  # item -> [x, y] (the first point of rectangles and ovals)
+        self.calls = 0  # number of move/coords calls
+
+    def create_image(self, x, y, **options):
+        item = super().create_image(x, y)
+        self.positions[item] = [x, y]
+        return item
+
+    def create_rectangle(self, x0, y0, x1, y1, **options):
+        item = super().create_rectangle(x0, y0, x1, y1)
+        self.positions[item] = [x0, y0]
+        return item
+
+    def create_oval(self, x0, y0, x1, y1, **options):
+        item = super().create_oval(x0, y0, x1, y1)
+        self.positions[item] = [x0, y0]
+        return item
+
+    def move(self, item, dx, dy):
+        self.calls += 1
+        position = self.positions[item]
+        position[0] += dx
+        position[1] += dy
+
+    def coords(self, item, *coords):
+        if not coords:
+            return list(self.positions[item])
+        self.calls += 1
+        self.positions[item] = [coords[0], coords[1]]
+
+    def delete(self, item):
+        self.positions.pop(item, None)
+
+
+# ------------------------------------------------------------------
+# headless replacement of World: create() returns no top window and the headless canvas
+class HeadlessWorld:
+    def __init__(self, title, width, height, record=False):
+        self.title = title
+        self.width = width
+        self.height = height
+        self.canvas = RecordingCanvas(width, height) if record else HeadlessCanvas(width, height)
+
+    def create(self):
+        return None, self.canvas
+
+
+# ------------------------------------------------------------------
+# create a headless world with n butterflies. With flock=True they are stepped by the vectorized engine, and with
+# workers > 0 by that many worker processes (shards.ShardedFlock, then the returned agents are the sharded flock).
+# The returned step function runs one frame of butterfly_behaviours() (food is a PVector or None):
+def create_ecosystem(n, width=WIDTH, height=HEIGHT, seed=None, flock=False, record=False, workers=0):
+    from butterfly import Butterfly, step_butterflies
+    from spatial import SpatialHash
+
+    rand.seed(seed)
+    _, canvas = HeadlessWorld("Ecosystem", width, height, record).create()
+    butterflies = [Butterfly(canvas, *butterfly_traits()) for i in range(n)]
+    if flock or workers:
+        from flock import Flock
+        engine = Flock.from_butterflies(butterflies, seed=seed)
+        if workers:
+            from shards import ShardedFlock
+            sharded = ShardedFlock(engine, workers)
+            return canvas, sharded, sharded.step
+        return canvas, engine.views(butterflies), engine.step
+
+    neighbours = SpatialHash(80, butterflies)
+    return canvas, butterflies, lambda food=None: step_butterflies(butterflies, neighbours, food)
+
+
+# the scalar frame with a profiler (and the recorder, if any):
+def create_profiled_step(butterflies, profiler, recorder=None):
+    from butterfly import step_butterflies
+    from spatial import SpatialHash
+    neighbours = SpatialHash(80, butterflies)
+    return lambda food=None: step_butterflies(butterflies, neighbours, food, recorder, profiler)
+
+
+# ------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the ecosystem without a display and report ticks per second")
+    parser.add_argument("--butterflies", "-n", type=int, default=BUTTERFLIES, help="number of butterflies")
+    parser.add_argument("--ticks", "-k", type=int, default=1000, help="number of frames to simulate")
+    parser.add_argument("--width", type=int, default=WIDTH)
+    parser.add_argument("--height", type=int, default=HEIGHT)
+    parser.add_argument("--seed", type=int, default=None, help="random seed for a reproducible run")
+    parser.add_argument("--flock", action="store_true", help="use the vectorized flock engine")
+    parser.add_argument("--workers", type=int, default=0, help="step the flock in this many worker processes")
+    parser.add_argument("--restore", help="continue the flock saved in this snapshot (.npz)")
+    parser.add_argument("--checkpoint", help="save flock snapshots in the background to this path ({tick} allowed)")
+    parser.add_argument("--checkpoint-every", type=int, default=1000, help="ticks between checkpoints")
+    parser.add_argument("--trajectory", help="record every frame to this trajectory file (recorder.py)")
+    parser.add_argument("--capacity", type=int, default=1000, help="frames kept in the trajectory ring buffer")
+    parser.add_argument("--profile", nargs="?", const="", metavar="DUMP",
+                        help="profile the frames, optionally dumping the profile to DUMP (.json or .csv)")
+    parser.add_argument("--record", action="store_true", help="keep track of the canvas item positions")
+    parser.add_argument("--food", type=int, default=FOOD_PATCHES, help="persistent food patches to forage")
+    parser.add_argument("--wasps", type=int, default=WASPS, help="wasps hunting the butterflies (wasp.py)")
+    parser.add_argument("--respawn", action="store_true", help="replace every caught butterfly by a new one")
+    parser.add_argument("--renderer", choices=("canvas", "batched", "composite"),
+                        help="draw the flock with this renderer (render.py), e.g. to time the composited frames")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    if args.restore:
+        from snapshot import load_snapshot
+        flock, _ = load_snapshot(args.restore, HeadlessWorld("Ecosystem", 0, 0, args.record).create()[1])
+        args.butterflies, args.flock, args.workers = len(flock), True, 0
+        butterflies, step = flock.views(), flock.step
+    else:
+        canvas, butterflies, step = create_ecosystem(args.butterflies, args.width, args.height, args.seed,
+                                                     args.flock, args.record, args.workers)
+    setup = time.perf_counter() - start
+
+    if args.renderer:
+        if not (args.flock or args.workers):
+            parser.error("--renderer needs the flock engine (--flock or --workers)")
+        (butterflies.flock if args.workers else butterflies[0].flock).use_renderer(args.renderer)
+
+    checkpointer = None
+    if args.checkpoint:
+        from snapshot import Checkpointer
+        if not (args.flock or args.workers):
+            parser.error("--checkpoint needs the flock engine (--flock or --workers)")
+        flock = butterflies.flock if args.workers else butterflies[0].flock
+        checkpointer = Checkpointer(flock, args.checkpoint, args.checkpoint_every)
+
+    recorder = None
+    if args.trajectory:
+        from recorder import TrajectoryRecorder
+        if args.flock or args.workers:
+            flock = butterflies.flock if args.workers else butterflies[0].flock
+            recorder = flock.recorder = TrajectoryRecorder.for_flock(args.trajectory, flock, args.capacity)
+        else:
+            recorder = TrajectoryRecorder(args.trajectory, [b.mass for b in butterflies], args.capacity,
+                                          args.width, args.height)
+            step_scalar = step
+
+            def step(food=None):
+                step_scalar(food)
+                recorder.record_butterflies(butterflies)
+
+    from profiler import FrameProfiler
+    profiler = FrameProfiler() if args.profile is not None else FrameProfiler.from_environment()
+    if profiler is not None:
+        if args.flock or args.workers:
+            flock = butterflies.flock if args.workers else butterflies[0].flock
+            flock.profiler = profiler
+            profiler.install(flock.canvas, time_canvas=False)
+        else:
+            profiler.install(butterflies[0].canvas)
+            step = create_profiled_step(butterflies, profiler, recorder)
+
+    patches = None
+    if args.food:
+        import numpy as np
+        from food import FoodField
+        if args.workers:
+            parser.error("--food needs a single process (--flock or the scalar engine)")
+        patches = FoodField(butterflies[0].canvas, args.width, args.height)
+        patches.scatter(args.food, rng=np.random.default_rng(args.seed))
+
+    caught = None
+    if args.wasps:
+        from wasp import Wasp, WaspSwarm, step_wasps, step_predators
+        if args.workers:
+            parser.error("--wasps needs a single process (--flock or the scalar engine)")
+        if args.trajectory:
+            parser.error("--trajectory records a fixed population: not with --wasps")
+        caught = [0]
+        if args.flock:
+            flock = butterflies[0].flock
+            swarm = WaspSwarm.random(flock.canvas, args.wasps, args.seed)
+            swarm.profiler = flock.profiler
+
+            def step(food=None):
+                caught[0] += step_predators(flock, swarm, food, args.respawn)
+        else:
+            # the butterflies list changes, so one spatial index for the wasps and the butterflies:
+            from butterfly import step_butterflies
+            from spatial import SpatialHash
+            wasps = [Wasp(butterflies[0].canvas, *wasp_traits()) for i in range(args.wasps)]
+            neighbours = SpatialHash(80, butterflies)
+
+            def step(food=None):
+                caught[0] += step_wasps(wasps, butterflies, neighbours, args.respawn)
+                step_butterflies(butterflies, neighbours, food, profiler=profiler)
+
+    start = time.perf_counter()
+    for tick in range(args.ticks):
+        if profiler is not None:
+            profiler.begin_frame()
+        step(patches)
+        if profiler is not None:
+            profiler.end_frame()
+        if checkpointer:
+            checkpointer.tick()
+    elapsed = time.perf_counter() - start
+    if checkpointer:
+        checkpointer.wait()
+    if recorder:
+        recorder.close()
+    if args.workers:
+        butterflies.close()
+
+    engine = f"{args.workers} workers" if args.workers else "flock" if args.flock else "scalar"
+    print(f"{args.butterflies} butterflies, {args.ticks} ticks ({engine}): setup {setup:.3f} s, "
+          f"{elapsed:.3f} s, {args.ticks / elapsed:.1f} ticks/s, {elapsed / args.ticks * 1000:.3f} ms/tick")
+    if caught is not None:
+        print(f"wasps: {args.wasps} wasps caught {caught[0]} butterflies")
+    if patches is not None:
+        print(f"food: {len(patches)} patches left, {patches.depleted} depleted, {patches.eaten:.0f} eaten")
+    if profiler is not None:
+        print(profiler.text())
+        if args.profile:
+            profiler.dump(args.profile)
+        else:
+            profiler.dump_from_environment()
+
+
+if __name__ == "__main__":
+    main()
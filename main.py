@@ -1,18 +1,14 @@
 from world import *
 from butterfly import *
+from config import *
+from spatial import SpatialHash
+from profiler import FrameProfiler, ProfilerOverlay
+from timestep import FixedTimestep
 import concurrent.futures
 
-# Set the characteristics of the world: window dimensions and gravity (indicative value 4):
-WIDTH, HEIGHT = 1200, 800
-BUTTERFLIES = 10  # number of butterflies in the ecosystem
-WASPS = 0  # number of wasps in the ecosystem
-
-REFRESH_TIME = 6  # time in milliseconds for refresh the tkinter frame
-
-# mean parameters for the creatures:
-MAX_SPEED = 3
-MAX_FORCE = 0.2
-MEAN_MASS = 4
+USE_FLOCK = False  # step all butterflies with the vectorized flock engine (flock.py) instead of one at a time
+LARGE_WORLD = WORLD_WIDTH > WIDTH or WORLD_HEIGHT > HEIGHT  # the window is a viewport onto the world (viewport.py)
+USE_NN = False  # steer the scalar butterflies to the food with the neural network, trained in the background (training.py)
 
 # global variables for food (left mouse click):
 food_exists = False
@@ -26,8 +22,64 @@ top_window, canvas = world.create()
 
 # create an array of butterflies with random gaussian distribution characteristics around the mean values and
 # deviations appropriate for each type:
-butterflies = [Butterfly(canvas, max(0.5, rand.gauss(MAX_SPEED, 0.5)), max(0.1, rand.gauss(MAX_FORCE, 0.1)), max(1, rand.gauss(MEAN_MASS, 0.5)))
-               for i in range(BUTTERFLIES)]
+butterflies = [Butterfly(canvas, *butterfly_traits()) for i in range(BUTTERFLIES)] if not LARGE_WORLD else []
+
+# a world larger than the window: the flock lives in world coordinates, only the butterflies in view are drawn and
+# the chunks out of view are stepped every MAX_LAG frames. The wasps and the food patches need the window sized world:
+if LARGE_WORLD:
+    from viewport import Viewport, ChunkedWorld
+    viewport = Viewport(WIDTH, HEIGHT, WORLD_WIDTH, WORLD_HEIGHT)
+    viewport.centre_on(WORLD_WIDTH / 2, WORLD_HEIGHT / 2)
+    viewport.bind(canvas)
+    chunked = ChunkedWorld.random(canvas, viewport, BUTTERFLIES, renderer='composite' if BUTTERFLIES >= 2000 else 'canvas')
+
+# optionally hand the butterflies over to the vectorized engine. The butterflies list then holds thin views onto it.
+# The flock draws with the renderer that suits its size (render.py): per item coords, one batched Tcl call, or all
+# the sprites composited into a single image for thousands of butterflies:
+if USE_FLOCK and not LARGE_WORLD:
+    from flock import Flock
+    flock = Flock.from_butterflies(butterflies)
+    butterflies = flock.views(butterflies)
+
+# one network for all the butterflies: they only predict with it, a background process trains it on the experiences
+# they push and the new weights are pulled in once per frame:
+pipeline = None
+if USE_NN and not USE_FLOCK:
+    from training import TrainingPipeline
+    pipeline = TrainingPipeline(2, 8, 2, 0.1, process=True).start()
+    for b in butterflies:
+        b.nn = pipeline.network
+        b.experience = pipeline
+
+# wasps hunting the butterflies (wasp.py), caught butterflies are removed:
+wasps = []
+if WASPS and not LARGE_WORLD:
+    from wasp import Wasp, WaspSwarm, step_wasps, update_predators
+    if USE_FLOCK:
+        swarm = WaspSwarm(canvas, *zip(*[wasp_traits() for i in range(WASPS)]))
+        swarm.share_renderer(flock)
+    else:
+        wasps = [Wasp(canvas, *wasp_traits()) for i in range(WASPS)]
+
+# persistent food patches that the butterflies forage when no food is offered with the mouse:
+patches = None
+if FOOD_PATCHES and not LARGE_WORLD:
+    from food import FoodField
+    patches = FoodField(canvas, WIDTH, HEIGHT)
+    patches.scatter(FOOD_PATCHES)
+
+# spatial index of the butterflies for the separation neighbour queries (cells as big as the separation distance):
+neighbours = SpatialHash(80, butterflies)
+
+# frame profiler, only when the ECOSYSTEM_PROFILE environment variable is set:
+profiler = FrameProfiler.from_environment()
+if profiler is not None:
+    profiler.install(canvas, time_canvas=not USE_FLOCK)
+    overlay = ProfilerOverlay(canvas, profiler)
+    if LARGE_WORLD:
+        chunked.flock.profiler = profiler
+    elif USE_FLOCK:
+        flock.profiler = profiler
 
 # mean test butterfly
 # butterflies = [Butterfly(canvas, MAX_SPEED, MAX_FORCE, MEAN_MASS)]
@@ -38,35 +90,61 @@ butterflies = [Butterfly(canvas, max(0.5, rand.gauss(MAX_SPEED, 0.5)), max(0.1,
 #obstacle2 = Obstacle(canvas, 800, 300, 150, 10, 'blue')
 
 
-# ------------------------------------------------------------------
-# define butterfly behaviours: using the after method it re-runs inside the tkinter mainloop
-def butterfly_behaviours():
-    global food_exists  # flag to indicate existence of food
-    global food  # PVector of the food position
+# the simulation runs in fixed steps of REFRESH_TIME, whenever the frames actually come (timestep.py):
+clock = FixedTimestep(REFRESH_TIME / 1000, SUBSTEPS, MAX_CATCH_UP)
+
 
-    # Update each butterfly's state sequentially.
-    for butterfly in butterflies:
-        # First, determine the primary goal: seek food or wander.
-        if food_exists:
-            # butterfly.apply_perceptron(food)
-            butterfly.seek(food, direction="none")
-        else:
-            butterfly.wander()
+# ------------------------------------------------------------------
+# one (sub-)step of the simulation, dt frames long:
+def simulate(dt):
+    target = food if food_exists else patches
+    if LARGE_WORLD:
+        chunked.update(target, dt)
+    elif USE_FLOCK and WASPS:
+        update_predators(flock, swarm, target, dt=dt)
+    elif USE_FLOCK:
+        # the flock engine runs the same behaviours for every butterfly in a few array operations:
+        flock.update(target, dt=dt)
+    else:
+        # the wasps hunt first, so the butterflies flee at their move:
+        if wasps:
+            step_wasps(wasps, butterflies, neighbours, dt=dt)
+        # Update each butterfly's state sequentially.
+        step_butterflies(butterflies, neighbours, target, profiler=profiler, dt=dt, nn=USE_NN)
+
+
+# the flock engine draws in between the last two steps. The scalar butterflies move their canvas items as they move:
+def remember():
+    if LARGE_WORLD:
+        chunked.remember()
+    elif USE_FLOCK:
+        flock.remember()
+        if WASPS:
+            swarm.remember()
+
+
+def render(alpha):
+    if LARGE_WORLD:
+        chunked.draw(alpha)
+    elif USE_FLOCK:
+        if WASPS:
+            swarm.draw(alpha)
+        flock.draw(alpha)
 
-        # Apply other behaviors like avoiding borders and other butterflies.
-        # These behaviors accumulate forces in the butterfly's acceleration vector.
-        butterfly.boundaries()
-        butterfly.separate(butterflies)
 
-        # The obstacle logic is commented out in the original file.
-        # butterfly.bounce_from_obstacle(obstacle1)
-        # butterfly.avoid_obstacle(obstacle1)
+# ------------------------------------------------------------------
+# define butterfly behaviours: using the after method it re-runs inside the tkinter mainloop
+def butterfly_behaviours():
+    if profiler is not None:
+        profiler.begin_frame()
 
-        # Then, update the butterfly's position based on all accumulated forces.
-        butterfly.move()
+    clock.run(simulate, render, remember)
+    if pipeline is not None:
+        pipeline.refresh()
 
-        # Finally, enforce hard boundaries.
-        butterfly.bounce()
+    if profiler is not None:
+        profiler.end_frame()
+        overlay.update()
 
     # re-runs the method each REFRESH_TIME millisecond:
     canvas.after(REFRESH_TIME, butterfly_behaviours)
@@ -81,8 +159,7 @@ def left_button_press(event):
 
     food_exists = True
     # define food position:
-    food.x = event.x
-    food.y = event.y
+    food.x, food.y = viewport.to_world(event.x, event.y) if LARGE_WORLD else (event.x, event.y)
 
 # bind mouse left button press with callback routine:
 canvas.bind('<ButtonPress-1>', left_button_press)
@@ -97,6 +174,17 @@ def left_button_release(event):
 # bind mouse left button release with callback routine:
 canvas.bind('<ButtonRelease-1>', left_button_release)
 
+# ----------------------------------------------
+# when the window is closed, write the profile (if ECOSYSTEM_PROFILE_DUMP names a file):
+def close_window():
+    if profiler is not None:
+        profiler.dump_from_environment()
+    if pipeline is not None:
+        pipeline.close()
+    top_window.destroy()
+
+top_window.protocol("WM_DELETE_WINDOW", close_window)
+
 # ----------------------------------------------
 # main event loop of tkinter:
 butterfly_behaviours()
@@ -0,0 +1,255 @@
+# Offline rendering: the frames of a recorded trajectory (recorder.py) or of a headless world simulated now are
+# composited without a display and written as numbered PNG images or as one animated GIF. Every frame is drawn like
+# the composite renderer draws it on screen (render.CompositeRenderer: the butterfly.png sprites of the masses on
+# the background, with the obstacle rectangles painted into the background), and the frames are spread in blocks
+# over a process pool. The workers open the trajectory file themselves when they start (pool initializer, as
+# shards.py), so a task is only a range of frames: a block of PNGs is written by the worker, a block of GIF frames
+# comes back as palette images that are put together in order here.
+#   python offline.py trajectory.traj frames/                      (frames/frame_000000.png, ...)
+#   python offline.py trajectory.traj run.gif --every 2 --scale 0.5
+#   python offline.py --world 500 --ticks 1000 run.gif --obstacle 500 300 10 250
+# A live world is recorded into a temporary trajectory file while it is simulated, and the blocks that are complete
+# are rendered while the next ones are simulated.
+import argparse
+import concurrent.futures
+import os
+import tempfile
+import time
+import numpy as np
+from PIL import Image
+from config import *
+from headless import HeadlessCanvas
+from recorder import TrajectoryRecorder, TrajectoryReplay
+from render import CompositeRenderer
+
+OBSTACLE_COLOUR = (0, 0, 255)  # 'blue', as the obstacles of main.py
+FRAME_NAME = 'frame_{:06d}.png'
+FPS = 25  # frames per second of the GIF
+BLOCK = 20  # frames per task
+PNG_COMPRESSION = 1  # zlib level of the PNG frames (fast, the frames are mostly background)
+
+
+# ------------------------------------------------------------------
+# the rectangles (x, y, width, height) of obstacles (world.Obstacle or anything with x, y, size_x, size_y):
+def obstacle_rectangles(obstacles):
+    return [(o.x, o.y, o.size_x, o.size_y) for o in obstacles]
+
+
+# the size of the output frames of a width x height world:
+def frame_size(width, height, scale):
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+# the frames of the agents of a trajectory as PIL images, scaled. With a palette (a 'P' image) the frames are
+# quantized to its colours without dithering, so all the frames of a GIF share one palette:
+class FrameRenderer:
+    def __init__(self, masses, width, height, obstacles=(), scale=1.0, palette=None):
+        self.compositor = CompositeRenderer(HeadlessCanvas(width, height), masses, width, height)
+        background = self.compositor.background
+        for x, y, size_x, size_y in obstacles:
+            x0, y0 = max(int(round(x)), 0), max(int(round(y)), 0)
+            x1, y1 = min(int(round(x + size_x)), width), min(int(round(y + size_y)), height)
+            background[y0:y1, x0:x1] = OBSTACLE_COLOUR + (255,)
+        self.size = frame_size(width, height, scale)
+        self.palette = palette
+
+    def image(self, location):
+        image = Image.fromarray(self.compositor.composite(location), 'RGBA').convert('RGB')
+        if image.size != self.size:
+            image = image.resize(self.size, Image.BILINEAR)
+        if self.palette is not None:
+            image = image.quantize(palette=self.palette, dither=Image.Dither.NONE)
+        return image
+
+
+# one palette for all the frames of a GIF, from the colours of a frame (the background, the obstacles and every
+# sprite size): returned as the 768 RGB values, the image with that palette is made with palette_image()
+def frame_palette(image, colours=256):
+    return image.quantize(colours, method=Image.Quantize.MEDIANCUT).getpalette()
+
+
+def palette_image(palette):
+    image = Image.new('P', (1, 1))
+    image.putpalette(palette)
+    return image
+
+
+# ------------------------------------------------------------------
+# worker process side: open the trajectory and set up the renderer once (pool initializer), then render blocks of
+# frames on request
+_worker = {}
+
+
+def _attach(path, obstacles, scale, palette):
+    replay = TrajectoryReplay(path)
+    _worker.update(path=path, renderer=FrameRenderer(replay.masses, replay.width, replay.height, obstacles, scale,
+                                                     palette_image(palette) if palette else None))
+
+
+# output frames start..stop-1, frame k is frame k * every of the trajectory. Written as PNGs into directory (returns
+# the number of frames), or returned as the bytes of the palette images if directory is None:
+def _render(start, stop, every, directory):
+    replay = TrajectoryReplay(_worker['path'])  # opened again: a live world appends frames to the file meanwhile
+    renderer = _worker['renderer']
+    frames = []
+    for k in range(start, stop):
+        _, frame = replay[k * every]
+        image = renderer.image(frame[:, 0:2])
+        if directory is None:
+            frames.append(image.tobytes())
+        else:
+            image.save(os.path.join(directory, FRAME_NAME.format(k)), compress_level=PNG_COMPRESSION)
+    return stop - start if directory is not None else frames
+
+
+# ------------------------------------------------------------------
+# the frames of a trajectory file, rendered in blocks by workers processes (0: in this process) to output: a
+# directory of numbered PNGs or, if it ends in .gif, an animated GIF. render(count) renders the frames up to the
+# first count frames of the file (the rest of a block waits for more frames), finish() the rest and writes the GIF.
+class OfflineRenderer:
+    def __init__(self, path, output, workers=0, every=1, scale=1.0, obstacles=(), fps=FPS, block=BLOCK):
+        self.path = path
+        self.output = output
+        self.gif = output.lower().endswith('.gif')
+        self.every = max(1, every)
+        self.fps = fps
+        self.block = block
+        self.submitted = 0  # output frames handed out so far
+        self.tasks = []  # in the order of the frames: futures, or the results of the in-process renderer
+        obstacles = [tuple(float(v) for v in rectangle) for rectangle in obstacles]
+
+        # the output directory (of the frames, or the one the GIF goes to) is made before any frame is rendered:
+        directory = os.path.dirname(output) if self.gif else output
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        replay = TrajectoryReplay(path)
+        self.size = frame_size(replay.width, replay.height, scale)
+        palette = None
+        if self.gif:
+            renderer = FrameRenderer(replay.masses, replay.width, replay.height, obstacles, scale)
+            palette = frame_palette(renderer.image(replay[0][1][:, 0:2]))
+        self.directory = None if self.gif else output
+        self.palette = palette
+
+        self.workers = workers
+        if workers:
+            self.pool = concurrent.futures.ProcessPoolExecutor(workers, initializer=_attach,
+                                                               initargs=(path, obstacles, scale, palette))
+        else:
+            self.pool = None
+            _attach(path, obstacles, scale, palette)
+
+    def __len__(self):
+        return self.submitted
+
+    # hand out the blocks of output frames whose trajectory frames are among the first count (all of them if
+    # partial, the last block may be shorter):
+    def render(self, count, partial=False):
+        available = (count + self.every - 1) // self.every  # output frames k with k * every < count
+        while available - self.submitted >= self.block or (partial and available > self.submitted):
+            start, stop = self.submitted, min(self.submitted + self.block, available)
+            if self.pool is None:
+                self.tasks.append(_render(start, stop, self.every, self.directory))
+            else:
+                self.tasks.append(self.pool.submit(_render, start, stop, self.every, self.directory))
+            self.submitted = stop
+
+    # render what is left of the count frames, wait for the workers and write the GIF. Returns the number of frames:
+    def finish(self, count):
+        self.render(count, partial=True)
+        results = [task.result() if self.pool is not None else task for task in self.tasks]
+        if self.gif and self.submitted:
+            frames = []
+            for block in results:
+                for data in block:
+                    image = Image.frombytes('P', self.size, data)
+                    image.putpalette(self.palette)
+                    frames.append(image)
+            frames[0].save(self.output, save_all=True, append_images=frames[1:], duration=round(1000 / self.fps),
+                           loop=0, optimize=False)
+        return self.submitted
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ------------------------------------------------------------------
+# render a trajectory file (every every-th frame). Returns the number of frames written:
+def render_trajectory(path, output, workers=0, every=1, scale=1.0, obstacles=(), fps=FPS):
+    with OfflineRenderer(path, output, workers, every, scale, obstacles, fps) as renderer:
+        return renderer.finish(len(TrajectoryReplay(path)))
+
+
+# simulate a flock (flock.py) for ticks frames and render them: the frames are recorded into a temporary trajectory
+# file and every block is rendered as soon as it is recorded, while the flock goes on. The obstacles of the flock are
+# drawn. Returns the number of frames written:
+def render_world(flock, ticks, output, workers=0, every=1, scale=1.0, fps=FPS, food=None):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'world.traj')
+        recorder = TrajectoryRecorder.for_flock(path, flock, ticks)
+        previous, flock.recorder = flock.recorder, recorder
+        try:
+            flock.update(food)  # the first frame (the palette of a GIF is made from it)
+            recorder.flush()
+            with OfflineRenderer(path, output, workers, every, scale, obstacle_rectangles(flock.obstacles),
+                                 fps) as renderer:
+                for tick in range(1, ticks):
+                    flock.update(food)
+                    if recorder.count % (renderer.block * renderer.every) == 0:
+                        recorder.flush()
+                        renderer.render(recorder.count)
+                recorder.flush()
+                return renderer.finish(recorder.count)
+        finally:
+            flock.recorder = previous
+            recorder.close()
+
+
+# ------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Render a trajectory or a headless world to PNG frames or a GIF")
+    parser.add_argument("source", nargs='?', help="trajectory file (recorder.py), or none with --world")
+    parser.add_argument("output", help="directory of numbered PNG frames, or a .gif file")
+    parser.add_argument("--world", type=int, metavar="N", help="simulate N butterflies instead of a trajectory")
+    parser.add_argument("--ticks", "-k", type=int, default=500, help="frames of the simulated world")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the simulated world")
+    parser.add_argument("--width", type=int, default=WIDTH, help="width of the simulated world")
+    parser.add_argument("--height", type=int, default=HEIGHT, help="height of the simulated world")
+    parser.add_argument("--obstacle", nargs=4, type=float, action="append", default=[], metavar=("X", "Y", "W", "H"),
+                        help="an obstacle rectangle (drawn, and avoided by a simulated world)")
+    parser.add_argument("--every", type=int, default=1, help="render every n-th frame")
+    parser.add_argument("--scale", type=float, default=1.0, help="scale of the output frames")
+    parser.add_argument("--fps", type=float, default=FPS, help="frames per second of a GIF")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (0: no pool)")
+    args = parser.parse_args(argv)
+    if (args.source is None) == (args.world is None):
+        parser.error("give either a trajectory file or --world N")
+
+    start = time.perf_counter()
+    if args.world is not None:
+        from flock import Flock
+        from world import Obstacle
+        rng = np.random.default_rng(args.seed)
+        flock = Flock(HeadlessCanvas(args.width, args.height), *butterfly_traits_array(rng, args.world),
+                      seed=args.seed)
+        for rectangle in args.obstacle:
+            flock.add_obstacle(Obstacle(flock.canvas, *rectangle, 'blue'))
+        count = render_world(flock, args.ticks, args.output, args.workers, args.every, args.scale, args.fps)
+    else:
+        count = render_trajectory(args.source, args.output, args.workers, args.every, args.scale, args.obstacle,
+                                  args.fps)
+    elapsed = time.perf_counter() - start
+    print(f"{count} frames in {elapsed:.2f} s, {count / elapsed:.1f} frames/s "
+          f"({count / args.fps / elapsed:.1f}x real time at {args.fps:g} fps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,210 @@
+import csv
+import json
+import os
+from collections import deque
+from time import perf_counter
+from config import REFRESH_TIME
+
+# Frame profiler: per-phase timers (wander/seek, boundaries, separate, move, bounce, canvas), counters (neighbour
+# checks, force applications, PVector allocations), a rolling frame-time histogram and the number of frames over the
+# REFRESH_TIME budget. It is off unless the ECOSYSTEM_PROFILE environment variable is set (or a FrameProfiler is
+# created explicitly): the simulation code only checks `if profiler is not None`, and the counting hooks are
+# installed only when profiling. The results are shown on a canvas overlay and dumped to JSON or CSV.
+
+ENVIRONMENT = 'ECOSYSTEM_PROFILE'  # set to 1 to profile, optionally ECOSYSTEM_PROFILE_DUMP=profile.json (or .csv)
+
+_active = None  # the profiler the counting hooks count for
+_originals = {}  # (class, method name) -> the method a counting hook replaced
+
+
+# replace a method of a class by one that counts its calls for the active profiler (once, until uninstall()):
+def _count_calls(cls, name, counter):
+    if (cls, name) in _originals:
+        return
+    method = cls.__dict__[name]
+
+    def counting(obj, *args, **kwargs):
+        if _active is not None:
+            _active.counters[counter] = _active.counters.get(counter, 0) + 1
+        return method(obj, *args, **kwargs)
+    _originals[(cls, name)] = method
+    setattr(cls, name, counting)
+
+
+class FrameProfiler:
+    def __init__(self, budget_ms=REFRESH_TIME, window=600, bin_ms=1.0, bins=20):
+        self.budget = budget_ms / 1000
+        self.window = window  # number of recent frames kept for the histogram and the CSV dump
+        self.bin_ms = bin_ms
+        self.bins = bins  # the last bin collects all frames longer than bins * bin_ms
+        self.phases = {}  # phase name -> total seconds
+        self.counters = {}  # counter name -> total
+        self.frames = deque(maxlen=window)  # (frame time, {phase: seconds}) of the recent frames
+        self.frame_count = 0
+        self.overruns = 0
+        self._frame_phases = {}
+        self._frame_start = None
+        self._timed = []  # (canvas, method name) of the timed canvas calls
+
+    # None unless profiling is switched on in the environment:
+    @classmethod
+    def from_environment(cls):
+        if os.environ.get(ENVIRONMENT, '') in ('', '0'):
+            return None
+        return cls()
+
+    # ------------------------------------------------------------------
+    def begin_frame(self):
+        self._frame_phases = {}
+        self._frame_start = perf_counter()
+
+    def end_frame(self):
+        elapsed = perf_counter() - self._frame_start
+        self.frames.append((elapsed, self._frame_phases))
+        self.frame_count += 1
+        if elapsed > self.budget:
+            self.overruns += 1
+        return elapsed
+
+    # add the time since start to a phase and return the current time, so phases can be chained:
+    #   t = perf_counter(); wander(); t = profiler.lap('wander', t); boundaries(); t = profiler.lap(...)
+    def lap(self, phase, start):
+        now = perf_counter()
+        self.add_time(phase, now - start)
+        return now
+
+    def add_time(self, phase, seconds):
+        self.phases[phase] = self.phases.get(phase, 0) + seconds
+        self._frame_phases[phase] = self._frame_phases.get(phase, 0) + seconds
+
+    def count(self, counter, amount=1):
+        self.counters[counter] = self.counters.get(counter, 0) + amount
+
+    # ------------------------------------------------------------------
+    # counting hooks, installed only while profiling and removed again by uninstall(). They count for the profiler
+    # that installed them last (one at a time). The flock engine times its drawing itself, so it doesn't need the
+    # per-call canvas timers (time_canvas=False):
+    def install(self, canvas, time_canvas=True):
+        global _active
+        if _active is not None and _active is not self:
+            _active.uninstall()
+        _active = self
+        self.count_pvectors()
+        self.count_forces()
+        if time_canvas:
+            self.time_canvas(canvas)
+
+    # put the original methods back: profiling costs nothing again
+    def uninstall(self):
+        global _active
+        if _active is self:
+            for (cls, name), method in _originals.items():
+                setattr(cls, name, method)
+            _originals.clear()
+            _active = None
+        for canvas, name in self._timed:
+            canvas.__dict__.pop(name, None)
+        self._timed = []
+
+    # count every PVector created (replaces PVector.__init__ on the class):
+    def count_pvectors(self):
+        from PVector import PVector
+        _count_calls(PVector, '__init__', 'pvector_allocations')
+
+    # count the Butterfly.apply_force() calls:
+    def count_forces(self):
+        from butterfly import Butterfly
+        _count_calls(Butterfly, 'apply_force', 'force_applications')
+
+    # time the canvas calls of the butterflies (canvas.move and canvas.coords) as the 'canvas' phase:
+    def time_canvas(self, canvas):
+        for name in ('move', 'coords'):
+            if name in canvas.__dict__:  # timed already
+                continue
+            method = getattr(canvas, name)
+
+            def timed(*args, method=method):
+                start = perf_counter()
+                result = method(*args)
+                self.add_time('canvas', perf_counter() - start)
+                return result
+            setattr(canvas, name, timed)
+            self._timed.append((canvas, name))
+
+    # ------------------------------------------------------------------
+    def histogram(self):
+        counts = [0] * self.bins
+        for elapsed, _ in self.frames:
+            counts[min(int(elapsed * 1000 / self.bin_ms), self.bins - 1)] += 1
+        return counts
+
+    def summary(self):
+        times = sorted(elapsed for elapsed, _ in self.frames)
+        n = len(times)
+        return {
+            'frames': self.frame_count,
+            'budget_ms': self.budget * 1000,
+            'overruns': self.overruns,
+            'recent_frames': n,
+            'mean_ms': sum(times) / n * 1000 if n else 0,
+            'p50_ms': times[n // 2] * 1000 if n else 0,
+            'p95_ms': times[min(n - 1, int(n * 0.95))] * 1000 if n else 0,
+            'max_ms': times[-1] * 1000 if n else 0,
+            'phase_ms_per_frame': {phase: seconds * 1000 / max(self.frame_count, 1)
+                                   for phase, seconds in self.phases.items()},
+            'counters_per_frame': {name: total / max(self.frame_count, 1) for name, total in self.counters.items()},
+            'histogram_bin_ms': self.bin_ms,
+            'histogram': self.histogram(),
+        }
+
+    # a few lines for the overlay or the console:
+    def text(self):
+        s = self.summary()
+        lines = [f"frame {s['mean_ms']:.2f} ms (p95 {s['p95_ms']:.2f}), over {s['budget_ms']:.0f} ms: "
+                 f"{s['overruns']}/{s['frames']}"]
+        lines += [f"{phase} {ms:.2f} ms" for phase, ms in s['phase_ms_per_frame'].items()]
+        lines += [f"{name} {value:.0f}" for name, value in s['counters_per_frame'].items()]
+        return "\n".join(lines)
+
+    # ------------------------------------------------------------------
+    # write the summary (.json) or the recent frames, one row per frame with the phase times (.csv):
+    def dump(self, path):
+        if path.endswith('.csv'):
+            self.dump_csv(path)
+        else:
+            self.dump_json(path)
+
+    def dump_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def dump_csv(self, path):
+        phases = sorted(self.phases)
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'frame_ms'] + [phase + '_ms' for phase in phases])
+            first = self.frame_count - len(self.frames)
+            for i, (elapsed, frame_phases) in enumerate(self.frames):
+                writer.writerow([first + i, f"{elapsed * 1000:.4f}"] +
+                                [f"{frame_phases.get(phase, 0) * 1000:.4f}" for phase in phases])
+
+    # dump to the file named in ECOSYSTEM_PROFILE_DUMP, if any:
+    def dump_from_environment(self):
+        path = os.environ.get(ENVIRONMENT + '_DUMP')
+        if path:
+            self.dump(path)
+        return path
+
+
+# ------------------------------------------------------------------
+# the profiler text in the corner of the canvas, refreshed every `every` frames:
+class ProfilerOverlay:
+    def __init__(self, canvas, profiler, every=30):
+        self.canvas = canvas
+        self.profiler = profiler
+        self.every = every
+        self.id = canvas.create_text(10, 10, anchor='nw', font=('Courier', 9), text='')
+
+    def update(self):
+        if self.profiler.frame_count % self.every == 0:
+            self.canvas.itemconfigure(self.id, text=self.profiler.text())
@@ -0,0 +1,178 @@
+# Trajectory recorder: the position and velocity of every butterfly, every tick, appended to a memory-mapped ring
+# buffer file with fixed-size records (N x [x, y, vx, vy] float32). Recording a frame is one array copy into the
+# mapped file, and the file never grows: when it is full the oldest frames are overwritten. A replay reads the file
+# and drives a canvas (Tk or headless) without simulating again:
+#   python recorder.py trajectory.traj            (replay in a Tk window)
+#   python recorder.py trajectory.traj --headless (replay as fast as possible and report frames per second)
+import argparse
+import time
+import numpy as np
+
+MAGIC = 0x45434f54524a  # 'ECOTRJ'
+VERSION = 1
+HEADER = 8  # int64 header fields: magic, version, agents, capacity, frames written, width, height, reserved
+FIELDS = 4  # x, y, vx, vy
+
+
+# ------------------------------------------------------------------
+# byte layout of the file: header, masses (float32 x agents), ticks (int64 x capacity), frames:
+def _layout(agents, capacity):
+    masses = HEADER * 8
+    ticks = masses + agents * 4
+    ticks += -ticks % 8  # keep the int64 ticks aligned
+    frames = ticks + capacity * 8
+    return masses, ticks, frames, frames + capacity * agents * FIELDS * 4
+
+
+def _map(path, mode, agents, capacity):
+    masses, ticks, frames, size = _layout(agents, capacity)
+    return (np.memmap(path, np.int64, mode, 0, (HEADER,)),
+            np.memmap(path, np.float32, mode, masses, (agents,)),
+            np.memmap(path, np.int64, mode, ticks, (capacity,)),
+            np.memmap(path, np.float32, mode, frames, (capacity, agents, FIELDS)))
+
+
+# ------------------------------------------------------------------
+class TrajectoryRecorder:
+    # a new ring buffer file for the agents (their masses are kept to draw them at the right size on replay):
+    def __init__(self, path, masses, capacity, width, height):
+        agents = len(masses)
+        size = _layout(agents, capacity)[3]
+        with open(path, 'wb') as f:
+            f.truncate(size)
+        self.path = path
+        self.capacity = capacity
+        self.header, mass, self.ticks, self.frames = _map(path, 'r+', agents, capacity)
+        self.header[:] = (MAGIC, VERSION, agents, capacity, 0, width, height, 0)
+        mass[:] = masses
+        self.count = 0  # frames recorded so far
+        self.tick = 0
+
+    @classmethod
+    def for_flock(cls, path, flock, capacity):
+        return cls(path, flock.mass, capacity, flock.width, flock.height)
+
+    # append one frame: location and velocity are N x 2 arrays
+    def record_arrays(self, location, velocity, tick=None):
+        slot = self.count % self.capacity
+        frame = self.frames[slot]
+        frame[:, 0:2] = location
+        frame[:, 2:4] = velocity
+        self.ticks[slot] = self.tick if tick is None else tick
+        self.count += 1
+        self.tick += 1
+        self.header[4] = self.count
+
+    # called by Flock.update() after move() and bounce():
+    def record(self, flock):
+        self.record_arrays(flock.location, flock.velocity)
+
+    # the scalar path: gather the Butterfly vectors into the mapped frame directly
+    def record_butterflies(self, butterflies):
+        n = len(butterflies)
+        values = np.fromiter((v for b in butterflies
+                              for v in (b.location.x, b.location.y, b.velocity.x, b.velocity.y)), np.float32, n * 4)
+        slot = self.count % self.capacity
+        self.frames[slot] = values.reshape(n, FIELDS)
+        self.ticks[slot] = self.tick
+        self.count += 1
+        self.tick += 1
+        self.header[4] = self.count
+
+    def flush(self):
+        self.frames.flush()
+        self.ticks.flush()
+        self.header.flush()
+
+    def close(self):
+        self.flush()
+        self.header = self.ticks = self.frames = None
+
+
+# ------------------------------------------------------------------
+# read access to a trajectory file: the frames still in the ring, oldest first
+class TrajectoryReplay:
+    def __init__(self, path):
+        header = np.memmap(path, np.int64, 'r', 0, (HEADER,))
+        magic, version, agents, capacity, count, width, height, _ = header.tolist()
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} trajectory file")
+        self.agents, self.capacity, self.count = agents, capacity, count
+        self.width, self.height = width, height
+        _, self.masses, self.ticks, self.frames = _map(path, 'r', agents, capacity)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    # frame i (0 is the oldest one still in the file): (tick, N x 4 array of x, y, vx, vy)
+    def __getitem__(self, i):
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        slot = (self.count - len(self) + i) % self.capacity
+        return int(self.ticks[slot]), self.frames[slot]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+# ------------------------------------------------------------------
+# drive a canvas from a replay: one sprite per recorded agent, moved to the recorded positions
+class ReplayPlayer:
+    def __init__(self, replay, canvas):
+        from butterfly import create_sprite
+        self.replay = replay
+        self.canvas = canvas
+        self.frame = 0
+        tick, first = replay[0]
+        self.images, self.ids = [], []
+        for mass, (x, y) in zip(replay.masses.tolist(), first[:, 0:2].tolist()):
+            image, item = create_sprite(canvas, mass, x, y)
+            self.images.append(image)
+            self.ids.append(item)
+
+    # show the next frame, returns False at the end of the recording:
+    def step(self):
+        if self.frame >= len(self.replay):
+            return False
+        tick, frame = self.replay[self.frame]
+        for item, (x, y) in zip(self.ids, frame[:, 0:2].tolist()):
+            self.canvas.coords(item, x, y)
+        self.frame += 1
+        return True
+
+    # play in the Tk main loop, one frame every refresh milliseconds:
+    def play(self, refresh):
+        if self.step():
+            self.canvas.after(refresh, self.play, refresh)
+
+
+def main(argv=None):
+    from config import REFRESH_TIME
+    parser = argparse.ArgumentParser(description="Replay a recorded trajectory")
+    parser.add_argument("path")
+    parser.add_argument("--headless", action="store_true", help="replay without a display as fast as possible")
+    parser.add_argument("--refresh", type=int, default=REFRESH_TIME, help="milliseconds per frame")
+    args = parser.parse_args(argv)
+
+    replay = TrajectoryReplay(args.path)
+    if args.headless:
+        from headless import HeadlessWorld
+        _, canvas = HeadlessWorld("Replay", replay.width, replay.height, record=True).create()
+        player = ReplayPlayer(replay, canvas)
+        start = time.perf_counter()
+        while player.step():
+            pass
+        elapsed = time.perf_counter() - start
+        print(f"{len(replay)} frames of {replay.agents} agents in {elapsed:.3f} s, "
+              f"{len(replay) / elapsed:.1f} frames/s")
+        return
+
+    from world import World
+    top_window, canvas = World("Ecosystem replay", replay.width, replay.height).create()
+    ReplayPlayer(replay, canvas).play(args.refresh)
+    top_window.mainloop()
+
+
+if __name__ == "__main__":
+    main()
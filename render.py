@@ -0,0 +1,191 @@
+import numpy as np
+from sprites import sprite_cache
+
+# Renderers of the flock: they put the agents at their locations (N x 2) on the canvas once per frame.
+#   CanvasRenderer:        one canvas item per butterfly, one canvas.coords call per butterfly (small flocks)
+#   BatchedCanvasRenderer: one canvas item per butterfly, all the coords updates in a single Tcl script
+#   CompositeRenderer:     no items per butterfly: the sprites are blitted into one RGB frame with NumPy and shown
+#                          as a single canvas image (large flocks, where Tk can't keep up with the items)
+# choose_renderer() picks one from the number of agents.
+
+BATCHED_FROM = 200  # agents from which the coords updates are batched into one Tcl call
+COMPOSITE_FROM = 2000  # agents from which the sprites are composited into one image
+BACKGROUND = (173, 216, 230)  # 'light blue', the canvas background of World
+
+
+def choose_renderer(n):
+    if n >= COMPOSITE_FROM:
+        return 'composite'
+    if n >= BATCHED_FROM:
+        return 'batched'
+    return 'canvas'
+
+
+# create the renderer of a flock (kind None: chosen from the number of agents, a headless canvas draws nothing so it
+# always gets the plain one). cache is the sprites.py cache of the agent images:
+def create_renderer(kind, canvas, ids, masses, width, height, cache=sprite_cache):
+    if kind is None:
+        kind = 'canvas' if getattr(canvas, 'headless', False) else choose_renderer(len(masses))
+    if kind == 'canvas':
+        return CanvasRenderer(canvas, ids)
+    if kind == 'batched':
+        return BatchedCanvasRenderer(canvas, ids)
+    if kind == 'composite':
+        return CompositeRenderer(canvas, masses, width, height, ids, cache=cache)
+    raise ValueError(f"unknown renderer {kind!r}")
+
+
+# ------------------------------------------------------------------
+# one canvas.coords call per item:
+class CanvasRenderer:
+    kind = 'canvas'
+
+    def __init__(self, canvas, ids):
+        self.canvas = canvas
+        self.ids = ids
+
+    def draw(self, location):
+        coords = self.canvas.coords
+        for item, (x, y) in zip(self.ids, location.tolist()):
+            coords(item, x, y)
+
+
+# ------------------------------------------------------------------
+# the coords of all the items in one Tcl script, so Python crosses into Tcl once per frame instead of once per
+# butterfly. A canvas without a Tcl interpreter (headless) gets the per item calls:
+class BatchedCanvasRenderer(CanvasRenderer):
+    kind = 'batched'
+
+    def draw(self, location):
+        tk = getattr(self.canvas, 'tk', None)
+        if tk is None:
+            return super().draw(location)
+        path = str(self.canvas)
+        xs, ys = location[:, 0].tolist(), location[:, 1].tolist()
+        tk.eval("\n".join([f"{path} coords {item} {x:.2f} {y:.2f}" for item, x, y in zip(self.ids, xs, ys)]))
+
+
+# ------------------------------------------------------------------
+# the sprites of a set of agents for compositing: the agents are grouped by sprite size, and for every size the flat
+# offsets (from the top left corner of the sprite in a frame of this width) and the colours of the opaque pixels are
+# kept (a pixel is opaque if its alpha is over half, as Tk images show it). set_masses() regroups the agents when
+# they change, the sprite pixels of a size are only extracted once:
+class SpriteGroups:
+    def __init__(self, masses, width, cache=sprite_cache):
+        self.width = width
+        self.cache = cache
+        self.sprites = {}  # size -> (dy, dx, offsets, colours)
+        self.set_masses(masses)
+
+    def sprite(self, size):
+        if size not in self.sprites:
+            sprite = np.asarray(self.cache.image(size)).copy()
+            dy, dx = np.nonzero(sprite[:, :, 3] > 127)
+            sprite[:, :, 3] = 255
+            colours = sprite.reshape(-1).view(np.uint32).reshape(size, size)[dy, dx]
+            self.sprites[size] = (dy.astype(np.int64), dx.astype(np.int64),
+                                  (dy * self.width + dx).astype(np.int64), colours)
+        return self.sprites[size]
+
+    def set_masses(self, masses):
+        sizes = (np.asarray(masses, dtype=float) * 10).astype(int)  # sprite_size() of every agent
+        self.groups = [(np.flatnonzero(sizes == size), size) + self.sprite(size) for size in np.unique(sizes).tolist()]
+
+    # blit the sprites at the locations (the centres of the sprites, as the canvas images are anchored) into pixels,
+    # a height x width frame as a flat array of uint32 pixels. Sprites that are completely inside the frame are
+    # written with one flat index per pixel, the ones crossing the border are clipped:
+    def blit(self, pixels, height, location, chunk=1024):
+        width = self.width
+        position = np.rint(location).astype(np.int64)
+        for agents, size, dy, dx, offsets, colours in self.groups:
+            x0 = position[agents, 0] - size // 2
+            y0 = position[agents, 1] - size // 2
+            inside = (x0 >= 0) & (y0 >= 0) & (x0 + size <= width) & (y0 + size <= height)
+
+            corners = (y0 * width + x0)[inside]
+            for start in range(0, len(corners), chunk):
+                index = corners[start:start + chunk, None] + offsets
+                pixels[index] = np.broadcast_to(colours, index.shape)
+
+            border = ~inside
+            if border.any():
+                ys = y0[border, None] + dy
+                xs = x0[border, None] + dx
+                visible = (ys >= 0) & (ys < height) & (xs >= 0) & (xs < width)
+                pixels[(ys * width + xs)[visible]] = np.broadcast_to(colours, ys.shape)[visible]
+
+
+# ------------------------------------------------------------------
+# all the sprites composited into one frame per step, with fancy indexing per sprite size (SpriteGroups).
+# Overlapping butterflies are drawn in index order. The frame (height x width RGBA, written as one uint32 per pixel)
+# is pasted into one PhotoImage shown by a single canvas item. Other agent types are drawn into the same frame
+# as layers (layer()), on top of the agents of the renderer:
+class CompositeRenderer:
+    kind = 'composite'
+    CHUNK = 1024  # agents blitted per array operation (bounds the size of the index arrays)
+
+    def __init__(self, canvas, masses, width, height, ids=(), background=BACKGROUND, cache=sprite_cache):
+        self.canvas = canvas
+        self.width = width
+        self.height = height
+        self.background = np.empty((height, width, 4), dtype=np.uint8)
+        self.background[:] = tuple(background) + (255,)
+        self.frame = self.background.copy()
+        self.pixels = self.frame.reshape(-1).view(np.uint32)  # the frame as a flat array of pixels
+
+        # the per agent items are not needed anymore:
+        for item in ids:
+            canvas.delete(item)
+
+        self.sprites = SpriteGroups(masses, width, cache)
+        self.layers = []
+
+        self.photo = None
+        self.id = None
+        if not getattr(canvas, 'headless', False):
+            from PIL import ImageTk
+            self.photo = ImageTk.PhotoImage('RGBA', (width, height))
+            self.id = canvas.create_image(0, 0, anchor='nw', image=self.photo)
+            canvas.tag_lower(self.id)  # under the obstacles and the other canvas items
+        else:
+            self.id = canvas.create_image(0, 0)
+
+    # the agents were removed or added:
+    def set_masses(self, masses):
+        self.sprites.set_masses(masses)
+
+    # a renderer for other agents (with their own sprite cache) that draws them into this frame:
+    def layer(self, masses, cache=sprite_cache):
+        layer = CompositeLayer(SpriteGroups(masses, self.width, cache))
+        self.layers.append(layer)
+        return layer
+
+    def composite(self, location):
+        np.copyto(self.frame, self.background)
+        self.sprites.blit(self.pixels, self.height, location, self.CHUNK)
+        for layer in self.layers:
+            if layer.location is not None:
+                layer.sprites.blit(self.pixels, self.height, layer.location, self.CHUNK)
+        return self.frame
+
+    def draw(self, location):
+        frame = self.composite(location)
+        if self.photo is not None:
+            from PIL import Image
+            self.photo.paste(Image.fromarray(frame, 'RGBA'))
+
+
+# the renderer of agents drawn into the frame of a CompositeRenderer: draw() only hands over the locations, they are
+# blitted at the next draw() of the CompositeRenderer
+class CompositeLayer:
+    kind = 'layer'
+
+    def __init__(self, sprites):
+        self.sprites = sprites
+        self.location = None
+
+    def set_masses(self, masses):
+        self.sprites.set_masses(masses)
+
+    def draw(self, location):
+        self.location = location
@@ -0,0 +1,150 @@
+import numpy as np
+from math import ceil
+from spatial import SpatialGrid, ring
+
+# Ray-cast perception: every agent casts a fan of rays around its heading (PVector.heading2D() of its velocity) and
+# senses the distance to the first thing each ray hits: a border of the world, an obstacle rectangle (world.Obstacle
+# or anything with x, y, size_x, size_y) or another agent (a disc of the size of its sprite). All the rays of all the
+# agents are intersected in array operations:
+#   borders:   one division per ray and axis
+#   obstacles: the slab test, per obstacle only for the agents within range of it
+#   agents:    the ray-circle test for the pairs of agents within range, found with a SpatialGrid (broad phase)
+#              ring by ring, until every ray has hit something nearer than the next ring
+# sense() returns the N x rays distances (max_range where nothing is hit) and inputs() the same divided by max_range,
+# the 0..1 inputs of a NeuralNetwork with one input per ray (NeuralNetwork.predict_batch()).
+CHUNK = 1024  # agents whose neighbour pairs are tested at once (bounds the size of the pair arrays)
+
+
+# ------------------------------------------------------------------
+class RaySensors:
+    # rays evenly spread over fov radians centred on the heading, sensing up to max_range:
+    def __init__(self, rays=5, fov=np.pi, max_range=150):
+        self.rays = rays
+        self.fov = fov
+        self.max_range = max_range
+        self.angles = np.linspace(-fov / 2, fov / 2, rays) if rays > 1 else np.zeros(1)  # relative to the heading
+        self.grid = None
+        self.checks = 0  # ray-circle tests of the last sense() (for the profiler)
+
+    # the unit direction of every ray of every agent, as the x and the y components (N x rays each):
+    def directions(self, velocity):
+        angle = np.arctan2(velocity[:, 1], velocity[:, 0])[:, None] + self.angles
+        return np.cos(angle), np.sin(angle)
+
+    # the distances (N x rays) from the agents at location (N x 2) along the fan around their velocity (N x 2) to
+    # the borders of a width x height world, the obstacles and the other agents (discs of radius N, none if None):
+    def sense(self, location, velocity, width, height, obstacles=(), radius=None):
+        directions = self.directions(velocity)
+        distance = np.full((len(location), self.rays), float(self.max_range))
+        if not len(location):
+            return distance
+        self.borders(distance, location, directions, width, height)
+        for obstacle in obstacles:
+            self.obstacle(distance, location, directions, obstacle)
+        if radius is not None:
+            self.agents(distance, location, directions, radius, width, height)
+        return distance
+
+    def inputs(self, location, velocity, width, height, obstacles=(), radius=None):
+        return self.sense(location, velocity, width, height, obstacles, radius) / self.max_range
+
+    # ------------------------------------------------------------------
+    # the walls x = 0, x = width, y = 0 and y = height, seen from inside the world:
+    def borders(self, distance, location, directions, width, height):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for axis, size in ((0, width), (1, height)):
+                d = directions[axis]
+                p = location[:, axis, None]
+                t = np.where(d > 0, (size - p) / d, np.where(d < 0, -p / d, np.inf))
+                np.minimum(distance, np.maximum(t, 0), out=distance)
+
+    # the slab test of one rectangle, for the agents within max_range of it (0 for the agents inside it):
+    def obstacle(self, distance, location, directions, obstacle):
+        x0, y0 = obstacle.x, obstacle.y
+        x1, y1 = x0 + obstacle.size_x, y0 + obstacle.size_y
+        reach = self.max_range
+        x, y = location[:, 0], location[:, 1]
+        near = np.flatnonzero((x > x0 - reach) & (x < x1 + reach) & (y > y0 - reach) & (y < y1 + reach))
+        if not len(near):
+            return
+        enter, leave = None, None
+        for axis, low, high in ((0, x0, x1), (1, y0, y1)):
+            d = directions[axis][near]
+            d = np.where(np.abs(d) < 1e-12, 1e-12, d)  # rays parallel to a side
+            p = location[near, axis, None]
+            t0, t1 = (low - p) / d, (high - p) / d
+            axis_enter, axis_leave = np.minimum(t0, t1), np.maximum(t0, t1)
+            enter = axis_enter if enter is None else np.maximum(enter, axis_enter)
+            leave = axis_leave if leave is None else np.minimum(leave, axis_leave)
+        hit = (leave >= np.maximum(enter, 0))
+        t = np.where(hit, np.maximum(enter, 0), np.inf)
+        distance[near] = np.minimum(distance[near], t)
+
+    # the ray-circle test against the other agents within max_range (plus their radius). The cells around every agent
+    # are searched in rings outwards (SpatialGrid.nearest() does the same), and an agent stops searching when all its
+    # rays hit something nearer than the agents of the next ring can be:
+    def agents(self, distance, location, directions, radius, width, height):
+        radius = np.asarray(radius, dtype=float)
+        largest = float(radius.max())
+        cell = max(self.max_range / 4, 2 * largest)
+        if self.grid is None or self.grid.cell_size != cell or (self.grid.columns, self.grid.rows) != (
+                max(1, ceil(width / cell)), max(1, ceil(height / cell))):
+            self.grid = SpatialGrid(cell, width, height)
+        self.grid.rebuild(location)
+        column, row = self.grid.cells_of(location)
+        self.checks = 0
+        active = np.arange(len(location))
+        for k in range(ceil((self.max_range + largest) / cell) + 1):
+            offsets = ring(k)
+            for start in range(0, len(active), CHUNK):
+                queries = active[start:start + CHUNK]
+                i, j = self.grid.candidates_at(column.take(queries), row.take(queries), offsets)
+                self.hit_agents(distance, location, directions, radius, queries.take(i), j)
+            # the agents of the next ring are at least k cells away:
+            nearest = k * cell - largest
+            active = active[distance[active].max(axis=1) > nearest]
+            if not len(active):
+                break
+
+    # the nearest hit of every ray of the agents i among the agents j (pairs grouped by i):
+    def hit_agents(self, distance, location, directions, radius, i, j):
+        x, y = location[:, 0], location[:, 1]
+        rx, ry = x.take(j) - x.take(i), y.take(j) - y.take(i)
+        d2 = rx * rx + ry * ry
+        r = radius.take(j)
+        # only the agents that can be nearer than the farthest ray of agent i gets now:
+        reach = distance.max(axis=1).take(i) + r
+        keep = np.flatnonzero((i != j) & (d2 < reach * reach))
+        if not len(keep):
+            return
+        i, rx, ry, d2, r = i.take(keep), rx.take(keep), ry.take(keep), d2.take(keep), r.take(keep)
+        self.checks += len(i) * self.rays
+
+        # |rel - t d| = r: t = b - sqrt(b^2 - c), with b = rel . d and c = |rel|^2 - r^2 (0 from inside the disc)
+        b = rx[:, None] * directions[0].take(i, axis=0) + ry[:, None] * directions[1].take(i, axis=0)
+        c = (d2 - r * r)[:, None]
+        disc = b * b - c
+        t = np.where(c < 0, 0.0, b - np.sqrt(np.maximum(disc, 0)))
+        t = np.where((disc >= 0) & (t >= 0), t, np.inf)
+
+        starts = np.flatnonzero(np.concatenate(([True], i[1:] != i[:-1])))
+        agents = i.take(starts)
+        distance[agents] = np.minimum(distance[agents], np.minimum.reduceat(t, starts, axis=0))
+
+
+# ------------------------------------------------------------------
+# the sensors of a flock (flock.py): its agents, obstacles and borders, the agents as discs of their sprite size
+def sense_flock(sensors, flock, agents=True):
+    radius = np.trunc(flock.mass * 10) / 2 if agents else None
+    return sensors.sense(flock.location, flock.velocity, flock.width, flock.height, flock.obstacles, radius)
+
+
+# the same for scalar butterflies (objects with location and velocity PVectors and a mass):
+def sense_butterflies(sensors, butterflies, obstacles=(), agents=True):
+    location = np.array([(b.location.x, b.location.y) for b in butterflies], dtype=float).reshape(-1, 2)
+    velocity = np.array([(b.velocity.x, b.velocity.y) for b in butterflies], dtype=float).reshape(-1, 2)
+    radius = np.array([int(b.mass * 10) / 2 for b in butterflies]) if agents else None
+    first = butterflies[0] if butterflies else None
+    width = first.canvas_width if first is not None else 0
+    height = first.canvas_height if first is not None else 0
+    return sensors.sense(location, velocity, width, height, obstacles, radius)
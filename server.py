@@ -0,0 +1,360 @@
+# Simulation server: a headless flock stepped on a fixed tick by asyncio and streamed to any number of TCP or
+# WebSocket clients (client.py is a thin Tk client):
+#   python server.py --butterflies 2000 --port 8765
+#
+# Every client gets a world message when it connects (size, agent masses, obstacles) and then frames with only the
+# agents that moved more than --threshold pixels since the last frame that client received. The simulation never
+# waits for a client: it publishes its latest state and every client sends it when its connection is ready again,
+# so a slow client skips frames (the delta is against what it really has, so nothing is lost) instead of slowing down
+# the world. Clients send commands on the same connection as JSON:
+#   {"cmd": "food", "x": 300, "y": 200}   seek food at (x, y), {"cmd": "food"} removes it
+#   {"cmd": "obstacle", "x": 500, "y": 300, "width": 10, "height": 250}
+#   {"cmd": "clear_obstacles"}
+#
+# Plain TCP messages are a little-endian uint32 length followed by the payload, and a TCP client starts with a
+# {"cmd": "hello"} command. A connection that starts with an HTTP GET is upgraded to a WebSocket instead: the state messages go out as binary frames, the commands come in as
+# text (or binary) frames.
+import argparse
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import numpy as np
+from config import *
+
+# message types (first byte of every server message):
+WORLD = ord('W')  # width, height, number of agents, masses (float32), obstacles
+FRAME = ord('F')  # tick, food, changed agents
+OBSTACLES = ord('O')  # the obstacles after a change
+
+FRAME_HEADER = struct.Struct('<BIIBff')  # type, tick, number of records, food flag, food x, food y
+WORLD_HEADER = struct.Struct('<BIII')  # type, width, height, number of agents
+COUNT = struct.Struct('<I')  # number of obstacles
+RECORD = np.dtype([('index', '<u4'), ('x', '<f4'), ('y', '<f4')])  # one agent of a frame
+OBSTACLE = np.dtype([('x', '<f4'), ('y', '<f4'), ('width', '<f4'), ('height', '<f4')])
+LENGTH = struct.Struct('<I')  # plain TCP message length
+
+WEBSOCKET_GUID = b'258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+
+# ------------------------------------------------------------------
+# encoding and decoding of the server messages (the client uses decode_message()):
+def encode_world(width, height, masses, obstacles):
+    masses = np.asarray(masses, dtype='<f4')
+    return WORLD_HEADER.pack(WORLD, width, height, len(masses)) + masses.tobytes() + obstacle_records(obstacles)
+
+
+def encode_obstacles(obstacles):
+    return bytes([OBSTACLES]) + obstacle_records(obstacles)
+
+
+# the number of obstacles and one x, y, width, height record per obstacle:
+def obstacle_records(obstacles):
+    records = np.array([(o.x, o.y, o.size_x, o.size_y) for o in obstacles], dtype=OBSTACLE)
+    return COUNT.pack(len(records)) + records.tobytes()
+
+
+# the agents in indices with their locations (N x 2):
+def encode_frame(tick, indices, locations, food=None):
+    records = np.empty(len(indices), dtype=RECORD)
+    records['index'] = indices
+    records['x'] = locations[:, 0]
+    records['y'] = locations[:, 1]
+    fx, fy = (food.x, food.y) if food is not None else (0, 0)
+    return FRAME_HEADER.pack(FRAME, tick, len(records), food is not None, fx, fy) + records.tobytes()
+
+
+def decode_obstacles(payload, offset):
+    (count,) = COUNT.unpack_from(payload, offset)
+    return np.frombuffer(payload, OBSTACLE, count, offset + COUNT.size).tolist()
+
+
+# returns ('world', width, height, masses, obstacles), ('frame', tick, food or None, records) or
+# ('obstacles', [(x, y, width, height), ...]):
+def decode_message(payload):
+    kind = payload[0]
+    if kind == FRAME:
+        _, tick, count, has_food, fx, fy = FRAME_HEADER.unpack_from(payload)
+        records = np.frombuffer(payload, RECORD, count, FRAME_HEADER.size)
+        return 'frame', tick, (fx, fy) if has_food else None, records
+    if kind == WORLD:
+        _, width, height, n = WORLD_HEADER.unpack_from(payload)
+        masses = np.frombuffer(payload, '<f4', n, WORLD_HEADER.size)
+        return 'world', width, height, masses, decode_obstacles(payload, WORLD_HEADER.size + n * 4)
+    if kind == OBSTACLES:
+        return 'obstacles', decode_obstacles(payload, 1)
+    raise ValueError(f"unknown message type {kind!r}")
+
+
+# ------------------------------------------------------------------
+# a client connection with plain length-prefixed messages:
+class TcpConnection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    async def send(self, payload):
+        self.writer.write(LENGTH.pack(len(payload)) + payload)
+        await self.writer.drain()
+
+    # the next message, or None when the client has gone:
+    async def receive(self):
+        try:
+            (length,) = LENGTH.unpack(await self.reader.readexactly(LENGTH.size))
+            return await self.reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+    # close without waiting for the frames that are still buffered (a stalled client may never read them):
+    def close(self):
+        self.writer.transport.abort()
+
+
+# a WebSocket connection (RFC 6455): unmasked binary frames out, masked frames in
+class WebSocketConnection(TcpConnection):
+    # answer the HTTP upgrade request (the 'GET ' has been read already):
+    async def handshake(self):
+        await self.reader.readline()  # the rest of the request line
+        headers = {}
+        while True:
+            line = (await self.reader.readline()).decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if key is None:
+            self.writer.write(b"HTTP/1.1 400 Bad Request\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1(key.encode() + WEBSOCKET_GUID).digest()).decode()
+        self.writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                           f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        await self.writer.drain()
+        return True
+
+    async def send(self, payload, opcode=0x2):
+        n = len(payload)
+        if n < 126:
+            header = struct.pack('!BB', 0x80 | opcode, n)
+        elif n < 1 << 16:
+            header = struct.pack('!BBH', 0x80 | opcode, 126, n)
+        else:
+            header = struct.pack('!BBQ', 0x80 | opcode, 127, n)
+        self.writer.write(header + payload)
+        await self.writer.drain()
+
+    async def receive(self):
+        try:
+            while True:
+                first, second = await self.reader.readexactly(2)
+                opcode, n = first & 0x0f, second & 0x7f
+                if n == 126:
+                    (n,) = struct.unpack('!H', await self.reader.readexactly(2))
+                elif n == 127:
+                    (n,) = struct.unpack('!Q', await self.reader.readexactly(8))
+                mask = await self.reader.readexactly(4) if second & 0x80 else None
+                payload = await self.reader.readexactly(n)
+                if mask is not None:
+                    payload = (np.frombuffer(payload, np.uint8) ^ np.resize(np.frombuffer(mask, np.uint8), n)).tobytes()
+                if opcode == 0x8:  # close
+                    return None
+                if opcode == 0x9:  # ping
+                    await self.send(payload, opcode=0xA)
+                elif opcode in (0x1, 0x2):  # text, binary (fragmented messages are not used by the commands)
+                    return payload
+        except (asyncio.IncompleteReadError, ConnectionError):
+            return None
+
+
+# ------------------------------------------------------------------
+class Client:
+    def __init__(self, connection, agents):
+        self.connection = connection
+        self.sent = np.full((agents, 2), np.nan)  # the locations this client has, NaN: never sent
+        self.tick = -1  # the last tick sent
+        self.ready = asyncio.Event()  # set when there is a newer state than tick
+        self.obstacles_changed = False
+        self.frames = 0
+        self.dropped = 0  # ticks that were never sent because the client was busy
+
+
+class SimulationServer:
+    def __init__(self, flock, tick=REFRESH_TIME / 1000, threshold=0.5):
+        from world import Obstacle
+        self.Obstacle = Obstacle
+        self.flock = flock
+        self.tick_time = tick
+        self.threshold = threshold  # agents that moved less than this (pixels) are not sent
+        self.food = None
+        self.tick = 0
+        self.location = flock.location.copy()  # the latest published state
+        self.clients = set()
+        self.late_ticks = 0  # ticks that started late because stepping took longer than the tick
+
+    # ------------------------------------------------------------------
+    # the simulation loop: step, publish, sleep until the next tick. It never awaits the clients:
+    async def run(self, ticks=None):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while ticks is None or self.tick < ticks:
+            self.flock.update(self.food)
+            self.tick += 1
+            self.publish()
+            deadline += self.tick_time
+            delay = deadline - loop.time()
+            if delay < 0:  # behind: start the next tick now instead of catching up with a burst
+                self.late_ticks += 1
+                deadline = loop.time()
+            await asyncio.sleep(max(delay, 0))
+
+    # the latest state goes into one slot that every client reads when its connection can take a frame:
+    def publish(self):
+        self.location = self.flock.location.copy()
+        for client in self.clients:
+            client.ready.set()
+
+    # ------------------------------------------------------------------
+    # a new connection: a WebSocket if it starts with an HTTP GET, otherwise plain TCP (then the first four bytes are
+    # the length of the hello command)
+    async def handle(self, reader, writer):
+        client = None
+        try:
+            start = await reader.readexactly(LENGTH.size)
+            if start == b'GET ':
+                connection = WebSocketConnection(reader, writer)
+                if not await connection.handshake():
+                    connection.close()
+                    return
+                first = None
+            else:
+                connection = TcpConnection(reader, writer)
+                (length,) = LENGTH.unpack(start)
+                first = await reader.readexactly(length)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+            return
+
+        client = Client(connection, len(self.flock))
+        client.handler = asyncio.current_task()
+        self.clients.add(client)
+        sender = asyncio.create_task(self.send_frames(client))
+        try:
+            if first is not None:
+                self.command(first, client)
+            while (message := await connection.receive()) is not None:
+                self.command(message, client)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+            connection.close()
+
+    # the sender of one client: the world first, then a frame whenever a newer state is published and the previous
+    # frame has been written out (drain), so the ticks published meanwhile are skipped
+    async def send_frames(self, client):
+        flock = self.flock
+        try:
+            await client.connection.send(encode_world(flock.width, flock.height, flock.mass, flock.obstacles))
+            client.ready.set()
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                if client.obstacles_changed:
+                    client.obstacles_changed = False
+                    await client.connection.send(encode_obstacles(flock.obstacles))
+                tick, location = self.tick, self.location
+                if tick == client.tick:  # woken up for the obstacles only
+                    continue
+                if client.tick >= 0:
+                    client.dropped += tick - client.tick - 1
+                moved = np.abs(location - client.sent).max(axis=1)
+                indices = np.flatnonzero(~(moved <= self.threshold))  # NaN (never sent) counts as moved
+                client.sent[indices] = location[indices]
+                client.tick = tick
+                client.frames += 1
+                await client.connection.send(encode_frame(tick, indices, location[indices], self.food))
+        except ConnectionError:
+            pass
+
+    # ------------------------------------------------------------------
+    # a command of a client. Commands that are not valid JSON objects, that are unknown or that lack a field (or have
+    # one that is not a finite number) are ignored, they never drop the connection:
+    def command(self, message, client=None):
+        try:
+            command = json.loads(message)
+            name = command['cmd']
+            if name == 'food':
+                from PVector import PVector
+                self.food = PVector(*command_numbers(command, 'x', 'y')) if 'x' in command else None
+            elif name == 'obstacle':
+                x, y, width, height = command_numbers(command, 'x', 'y', 'width', 'height')
+                self.flock.add_obstacle(self.Obstacle(self.flock.canvas, x, y, width, height, 'blue'))
+                self.obstacles_changed()
+            elif name == 'clear_obstacles':
+                self.flock.clear_obstacles()
+                self.obstacles_changed()
+        except (ValueError, KeyError, TypeError):
+            return
+
+    def obstacles_changed(self):
+        for client in self.clients:
+            client.obstacles_changed = True
+            client.ready.set()
+
+    async def serve(self, host, port, ticks=None):
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            try:
+                await self.run(ticks)
+            finally:
+                await self.close_clients()
+
+    # disconnect every client and wait for their handlers to finish:
+    async def close_clients(self):
+        handlers = [client.handler for client in self.clients]
+        for client in list(self.clients):
+            client.connection.close()
+        await asyncio.gather(*handlers, return_exceptions=True)
+
+
+# ------------------------------------------------------------------
+# the fields of a command as finite floats (KeyError if one is missing, ValueError or TypeError if it isn't a number):
+def command_numbers(command, *fields):
+    values = [float(command[field]) for field in fields]
+    if not np.isfinite(values).all():
+        raise ValueError(f"not a finite number in {command!r}")
+    return values
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Step a headless ecosystem and stream it to TCP/WebSocket clients")
+    parser.add_argument("--butterflies", "-n", type=int, default=BUTTERFLIES, help="number of butterflies")
+    parser.add_argument("--width", type=int, default=WIDTH)
+    parser.add_argument("--height", type=int, default=HEIGHT)
+    parser.add_argument("--seed", type=int, default=None, help="random seed for a reproducible run")
+    parser.add_argument("--restore", help="serve the flock saved in this snapshot (.npz)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tick", type=float, default=REFRESH_TIME, help="milliseconds per simulation tick")
+    parser.add_argument("--threshold", type=float, default=0.5, help="pixels an agent moves before it is sent again")
+    args = parser.parse_args(argv)
+
+    from headless import HeadlessWorld, create_ecosystem
+    if args.restore:
+        from snapshot import load_snapshot
+        flock, _ = load_snapshot(args.restore, HeadlessWorld("Ecosystem", 0, 0).create()[1])
+    else:
+        _, views, _ = create_ecosystem(args.butterflies, args.width, args.height, args.seed, flock=True)
+        flock = views[0].flock
+    server = SimulationServer(flock, args.tick / 1000, args.threshold)
+    print(f"serving {len(flock)} butterflies on {args.host}:{args.port}")
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
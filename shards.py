@@ -0,0 +1,203 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from field import BORDERS, DistanceField
+from flock import Flock
+
+# Multi-process flock: the world is split into vertical strips (spatial domain decomposition) and every strip is
+# stepped by a worker process. The agent state lives in one shared memory block, so nothing is pickled per frame:
+# the workers read the current buffer and write the next one (double buffering), each writing only the agents it
+# owns. An agent belongs to the strip its location is in, so agents that cross a strip border migrate to the
+# neighbouring shard on the next frame. To separate from agents on the other side of the border, every shard also
+# reads a halo: the agents of the neighbouring strips within the separation distance of its borders.
+#
+# The wander angles are drawn from the random generator of the flock in the main process, so the results are the
+# same for a fixed seed and number of workers. The obstacles of the flock and its distance field (field.py) are sent
+# to the workers as rectangles with every frame, and a worker builds the field again only when they changed. The
+# perceptrons are not sharded: a flock steered by them is stepped in one process.
+
+
+# ------------------------------------------------------------------
+# layout of the shared memory block: name -> shape. location, velocity and wander_theta are double buffered:
+def state_layout(n):
+    return {
+        'location': (2, n, 2),
+        'velocity': (2, n, 2),
+        'wander_theta': (2, n),
+        'acceleration': (n, 2),
+        'max_speed': (n,),
+        'max_force': (n,),
+        'mass': (n,),
+        'noise': (n,),  # the wander angle changes of the current frame
+    }
+
+
+# numpy arrays over the buffer of the shared memory block, one per field of the layout:
+def state_arrays(buffer, n):
+    arrays, offset = {}, 0
+    for name, shape in state_layout(n).items():
+        size = int(np.prod(shape))
+        arrays[name] = np.ndarray(shape, dtype=np.float64, buffer=buffer, offset=offset * 8)
+        offset += size
+    return arrays
+
+
+def state_size(n):
+    return sum(int(np.prod(shape)) for shape in state_layout(n).values()) * 8
+
+
+# ------------------------------------------------------------------
+# worker process side: attach to the shared block once (pool initializer), then step shards on request
+_worker = {}
+
+
+def _attach(name, n, width, height):
+    block = shared_memory.SharedMemory(name=name)
+    _worker.update(block=block, arrays=state_arrays(block.buf, n), width=width, height=height)
+
+
+# strip index of every x coordinate (agents outside the world belong to the first or last strip):
+def strip_of(x, width, shards):
+    return np.clip((x * shards // width).astype(np.intp), 0, shards - 1)
+
+
+# the obstacles and the distance field of the flock in a worker, from environment() of the main process (built
+# again only when it changed):
+def _environment(environment):
+    if _worker.get('environment', (None,))[0] != environment:
+        obstacles, field = environment
+        obstacles = [Rectangle(*rectangle) for rectangle in obstacles]
+        if field is not None:
+            reach, cell_size, rectangles = field
+            field = DistanceField(_worker['width'], _worker['height'], reach, cell_size,
+                                  [Rectangle(*rectangle) for rectangle in rectangles])
+        _worker['environment'] = (environment, obstacles, field)
+    return _worker['environment'][1:]
+
+
+# step the agents of one strip from buffer current into the other buffer. Returns (shard, owned, halo) counts:
+def step_shard(shard, shards, current, food=None, environment=((), None)):
+    arrays, width, height = _worker['arrays'], _worker['width'], _worker['height']
+    location = arrays['location'][current]
+    x = location[:, 0]
+
+    owned = strip_of(x, width, shards) == shard
+    left, right = width * shard / shards, width * (shard + 1) / shards
+    halo = ~owned & (x >= left - Flock.SEPARATION_DISTANCE) & (x < right + Flock.SEPARATION_DISTANCE)
+    local = np.flatnonzero(owned | halo)
+
+    # step the owned agents together with the halo (the halo results are thrown away):
+    flock = Flock.from_arrays(width, height, location[local], arrays['velocity'][current][local],
+                              arrays['acceleration'][local], arrays['max_speed'][local], arrays['max_force'][local],
+                              arrays['mass'][local], arrays['wander_theta'][current][local], brains=False)
+    flock.obstacles, flock.field = _environment(environment)
+    if food is not None:
+        food = FoodPoint(*food)
+    flock.update(food, noise=arrays['noise'][local])
+
+    mine = owned[local]
+    rows = local[mine]
+    following = 1 - current
+    arrays['location'][following][rows] = flock.location[mine]
+    arrays['velocity'][following][rows] = flock.velocity[mine]
+    arrays['wander_theta'][following][rows] = flock.wander_theta[mine]
+    arrays['acceleration'][rows] = flock.acceleration[mine]
+    return shard, len(rows), len(local) - len(rows)
+
+
+# the food position sent to the workers (Flock.update() reads .x and .y):
+class FoodPoint:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+
+# an obstacle sent to the workers (Flock and DistanceField read x, y, size_x and size_y):
+class Rectangle:
+    def __init__(self, x, y, size_x, size_y):
+        self.x = x
+        self.y = y
+        self.size_x = size_x
+        self.size_y = size_y
+
+
+# ------------------------------------------------------------------
+# main process side: steps a Flock with a pool of worker processes. The flock stays the state everyone else sees
+# (views, drawing): step() copies it into the shared block, lets the workers step the strips and copies the result
+# back, two bulk copies per frame.
+class ShardedFlock:
+    def __init__(self, flock, workers):
+        self.flock = flock
+        self.shards = workers
+        n = len(flock)
+        self.block = shared_memory.SharedMemory(create=True, size=max(state_size(n), 8))
+        self.arrays = state_arrays(self.block.buf, n)
+        self.pool = ProcessPoolExecutor(workers, initializer=_attach,
+                                        initargs=(self.block.name, n, flock.width, flock.height))
+        self.ticks = 0
+        self.migrations = 0  # number of agents that moved to another shard
+        self.halo = 0  # number of halo agents read in the last frame
+
+    def push(self):
+        a, f = self.arrays, self.flock
+        a['location'][0] = f.location
+        a['velocity'][0] = f.velocity
+        a['wander_theta'][0] = f.wander_theta
+        a['acceleration'][:] = f.acceleration
+        a['max_speed'][:] = f.max_speed
+        a['max_force'][:] = f.max_force
+        a['mass'][:] = f.mass
+
+    def pull(self):
+        a, f = self.arrays, self.flock
+        f.location[:] = a['location'][1]
+        f.velocity[:] = a['velocity'][1]
+        f.wander_theta[:] = a['wander_theta'][1]
+        f.acceleration[:] = a['acceleration']
+
+    # the obstacles and the distance field of the flock as rectangles for the workers: ((x, y, size_x, size_y), ...)
+    # and (reach, cell_size, rectangles of the field) or None
+    def environment(self):
+        obstacles = tuple((o.x, o.y, o.size_x, o.size_y) for o in self.flock.obstacles)
+        field = self.flock.field
+        if field is not None:
+            rectangles = tuple((x0, y0, x1 - x0, y1 - y0) for key, (x0, y0, x1, y1, _) in field.sources.items()
+                               if key not in BORDERS)
+            field = (field.reach, field.cell_size, rectangles)
+        return obstacles, field
+
+    # one frame: the same as Flock.step(), with the strips stepped in parallel. The perceptrons are not sharded:
+    def step(self, food=None, draw=True, perceptron=False):
+        if perceptron:
+            raise ValueError("a sharded flock has no perceptrons: step the flock itself with perceptron=True")
+        self.push()
+        if food is None:
+            self.arrays['noise'][:] = self.flock.wander_noise()
+        before = strip_of(self.flock.location[:, 0], self.flock.width, self.shards)
+
+        point = None if food is None else (food.x, food.y)
+        environment = self.environment()
+        futures = [self.pool.submit(step_shard, shard, self.shards, 0, point, environment)
+                   for shard in range(self.shards)]
+        self.halo = sum(future.result()[2] for future in futures)
+
+        self.pull()
+        if self.flock.recorder is not None:
+            self.flock.recorder.record(self.flock)
+        after = strip_of(self.flock.location[:, 0], self.flock.width, self.shards)
+        self.migrations += int(np.count_nonzero(before != after))
+        self.ticks += 1
+        if draw:
+            self.flock.draw()
+
+    def close(self):
+        self.pool.shutdown()
+        self.arrays = None
+        self.block.close()
+        self.block.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
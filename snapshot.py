@@ -0,0 +1,125 @@
+import json
+import os
+import random as rand
+import threading
+import numpy as np
+from flock import Flock
+from NeuralNetwork import NeuralNetworkPopulation
+from Perceptron import PerceptronPopulation
+
+# Binary snapshots of the whole ecosystem: agent kinematics, wander angles, traits, perceptron weights, neural network
+# weights and biases and the random generator states, stored as the flock arrays in one uncompressed .npz file.
+# Saving and loading are bulk array copies instead of pickling one object per butterfly.
+
+FORMAT_VERSION = 1
+AGENT_ARRAYS = ('location', 'velocity', 'acceleration', 'max_speed', 'max_force', 'mass', 'wander_theta')
+NETWORK_ARRAYS = ('weights_IH', 'weights_HO', 'bias_H', 'bias_O')
+
+
+# ------------------------------------------------------------------
+# the snapshot of a flock as a dict of arrays (copies, so the flock can go on while they are written).
+# networks is an optional NeuralNetworkPopulation with one network per agent:
+def snapshot_arrays(flock, networks=None):
+    arrays = {name: getattr(flock, name).copy() for name in AGENT_ARRAYS}
+    arrays['world'] = np.array([flock.width, flock.height], dtype=float)
+    if flock.brains:
+        arrays['perceptron_weights'] = flock.brains.weights.copy()
+        arrays['perceptron_rate'] = np.array(flock.brains.c)
+    if networks is not None:
+        for name in NETWORK_ARRAYS:
+            arrays['nn_' + name] = getattr(networks, name).copy()
+        arrays['nn_rate'] = np.array(networks.learning_rate)
+    # random generator states (the flock generator, numpy's and python's global ones) as JSON text:
+    arrays['rng_state'] = np.array(json.dumps({
+        'flock': flock.rng.bit_generator.state,
+        'numpy': [value.tolist() if isinstance(value, np.ndarray) else value for value in np.random.get_state()],
+        'python': rand.getstate(),
+    }))
+    arrays['version'] = np.array(FORMAT_VERSION)
+    return arrays
+
+
+# write the arrays to path, through a temporary file so a crash never leaves a half written snapshot:
+def write_arrays(path, arrays):
+    temporary = path + '.tmp'
+    with open(temporary, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporary, path)
+
+
+def save_snapshot(path, flock, networks=None):
+    write_arrays(path, snapshot_arrays(flock, networks))
+
+
+# ------------------------------------------------------------------
+# load a snapshot: returns the flock (drawn on canvas if one is given) and the NeuralNetworkPopulation (or None).
+# The random generators continue where they were when the snapshot was taken:
+def load_snapshot(path, canvas=None):
+    with np.load(path) as data:
+        if int(data['version']) != FORMAT_VERSION:
+            raise ValueError(f"{path}: snapshot format {int(data['version'])}, expected {FORMAT_VERSION}")
+        width, height = data['world'].tolist()
+        brains = False
+        if 'perceptron_weights' in data:
+            brains = PerceptronPopulation(0, data['perceptron_weights'].shape[1], float(data['perceptron_rate']))
+            brains.weights = data['perceptron_weights']
+        flock = Flock.from_arrays(int(width), int(height), **{name: data[name] for name in AGENT_ARRAYS},
+                                  brains=brains)
+
+        networks = None
+        if 'nn_weights_IH' in data:
+            shape = data['nn_weights_IH'].shape
+            networks = NeuralNetworkPopulation(0, shape[2], shape[1], data['nn_weights_HO'].shape[1],
+                                               float(data['nn_rate']))
+            for name in NETWORK_ARRAYS:
+                setattr(networks, name, data['nn_' + name])
+
+        state = json.loads(str(data['rng_state']))
+    flock.rng.bit_generator.state = state['flock']
+    np.random.set_state(tuple(np.array(value, dtype=np.uint32) if i == 1 else value
+                              for i, value in enumerate(state['numpy'])))
+    rand.setstate(tuple(tuple(value) if isinstance(value, list) else value for value in state['python']))
+
+    if canvas is not None:
+        flock.attach(canvas)
+    return flock, networks
+
+
+# ------------------------------------------------------------------
+# periodic checkpoints that don't stall the frame loop: call tick() once per frame. Every `every` frames the arrays
+# are copied (a few memcpy) and written by a background thread. If the previous checkpoint is still being written
+# the new one is skipped instead of waiting.
+class Checkpointer:
+    def __init__(self, flock, path, every=1000, networks=None):
+        self.flock = flock
+        self.path = path  # may contain {tick}, e.g. 'checkpoint-{tick}.npz'
+        self.every = every
+        self.networks = networks
+        self.ticks = 0
+        self.saved = 0
+        self.skipped = 0
+        self.thread = None
+
+    def tick(self):
+        self.ticks += 1
+        if self.ticks % self.every == 0:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self.thread is not None and self.thread.is_alive():
+            self.skipped += 1
+            return False
+        arrays = snapshot_arrays(self.flock, self.networks)
+        path = self.path.format(tick=self.ticks)
+        self.thread = threading.Thread(target=self._write, args=(path, arrays), daemon=True)
+        self.thread.start()
+        return True
+
+    def _write(self, path, arrays):
+        write_arrays(path, arrays)
+        self.saved += 1
+
+    # wait for the checkpoint being written, if any:
+    def wait(self):
+        if self.thread is not None:
+            self.thread.join()
@@ -0,0 +1,276 @@
+import numpy as np
+from math import ceil, floor
+
+# Uniform grid spatial indexes for radius queries. With the cell size equal to the query radius only the 3 x 3
+# block of cells around a point has to be searched, so a neighbour query costs the local density instead of N.
+
+
+# ------------------------------------------------------------------
+# object index for the scalar Butterfly path: objects with a .location PVector are kept in a dict of cells and
+# moved between cells incrementally when they move (update() after every Butterfly.move()):
+class SpatialHash:
+    def __init__(self, cell_size, objects=()):
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row) -> {object: None}, an insertion ordered set
+        self.where = {}  # object -> (column, row)
+        for obj in objects:
+            self.insert(obj)
+
+    def __len__(self):
+        return len(self.where)
+
+    def __iter__(self):
+        return iter(self.where)
+
+    def cell(self, x, y):
+        return floor(x / self.cell_size), floor(y / self.cell_size)
+
+    def insert(self, obj):
+        key = self.cell(obj.location.x, obj.location.y)
+        self.cells.setdefault(key, {})[obj] = None
+        self.where[obj] = key
+
+    def remove(self, obj):
+        key = self.where.pop(obj)
+        cell = self.cells[key]
+        del cell[obj]
+        if not cell:
+            del self.cells[key]
+
+    # re-file the object if it has moved into another cell:
+    def update(self, obj):
+        key = self.cell(obj.location.x, obj.location.y)
+        if key != self.where[obj]:
+            self.remove(obj)
+            self.cells.setdefault(key, {})[obj] = None
+            self.where[obj] = key
+
+    # all objects in the cells overlapping the square around location. The caller checks the exact distance:
+    def near(self, location, radius):
+        reach = ceil(radius / self.cell_size)
+        column, row = self.cell(location.x, location.y)
+        for i in range(column - reach, column + reach + 1):
+            for j in range(row - reach, row + reach + 1):
+                cell = self.cells.get((i, j))
+                if cell:
+                    yield from cell
+
+
+# ------------------------------------------------------------------
+# the (column, row) offsets of the cells on the square ring at distance k around a cell (k = 0: the cell itself):
+def ring(k):
+    if k == 0:
+        return [(0, 0)]
+    return ([(dc, dr) for dc in range(-k, k + 1) for dr in (-k, k)] +
+            [(dc, dr) for dc in (-k, k) for dr in range(-k + 1, k)])
+
+
+# ------------------------------------------------------------------
+# array index for the flock engine: rebuilt every frame from an (N, 2) array of points with one sort. Points are
+# stored sorted by cell (order), so the points of a cell are order[starts[cell]:starts[cell] + counts[cell]]:
+class SpatialGrid:
+    def __init__(self, cell_size, width, height):
+        self.cell_size = cell_size
+        self.columns = max(1, ceil(width / cell_size))
+        self.rows = max(1, ceil(height / cell_size))
+        self.points = np.zeros((0, 2))
+        self.checks = 0
+
+    def cells_of(self, points):
+        # points outside the world are clipped into the border cells (this only brings cells closer together,
+        # so no neighbour can be missed):
+        column = np.clip(np.floor(points[:, 0] / self.cell_size).astype(np.intp), 0, self.columns - 1)
+        row = np.clip(np.floor(points[:, 1] / self.cell_size).astype(np.intp), 0, self.rows - 1)
+        return column, row
+
+    def rebuild(self, points):
+        self.points = points
+        self.column, self.row = self.cells_of(points)
+        keys = self.row * self.columns + self.column
+        self.order = np.argsort(keys, kind="stable")
+        self.counts = np.bincount(keys, minlength=self.columns * self.rows)
+        self.starts = np.cumsum(self.counts) - self.counts
+
+    # candidate (query, point) index pairs: every point in the cells within reach of each query cell:
+    def candidates(self, column, row, reach=1):
+        return self.candidates_at(column, row, [(dc, dr) for dc in range(-reach, reach + 1)
+                                                for dr in range(-reach, reach + 1)])
+
+    # the same for the cells at the (column, row) offsets from each query cell, all offsets in one pass:
+    def candidates_at(self, column, row, offsets):
+        offsets = np.asarray(offsets, dtype=np.intp).reshape(-1, 2)
+        c = (column[:, None] + offsets[:, 0]).ravel()
+        r = (row[:, None] + offsets[:, 1]).ravel()
+        valid = np.flatnonzero((c >= 0) & (c < self.columns) & (r >= 0) & (r < self.rows))
+        key = r.take(valid) * self.columns + c.take(valid)
+        count = self.counts.take(key)
+        total = int(count.sum())
+        # expand every (query, cell) into one entry per point of the cell:
+        first = np.repeat(self.starts.take(key) - (np.cumsum(count) - count), count)
+        queries = np.repeat(valid // len(offsets), count)
+        return queries, self.order.take(first + np.arange(total))
+
+    # all ordered pairs (i, j), i != j, of indexed points closer than radius, with the difference vectors
+    # (point i - point j) and the squared distances:
+    def pairs(self, radius):
+        i, j = self.candidates(self.column, self.row, ceil(radius / self.cell_size))
+        self.checks = len(i)  # number of distances computed (for the profiler)
+        x, y = self.points[:, 0], self.points[:, 1]
+        dx = x.take(i) - x.take(j)
+        dy = y.take(i) - y.take(j)
+        d2 = dx * dx + dy * dy
+        close = np.flatnonzero((d2 > 0) & (d2 < radius * radius))  # more than 0 so not itself
+        return i.take(close), j.take(close), np.column_stack((dx.take(close), dy.take(close))), d2.take(close)
+
+    # the nearest indexed point within radius of every query point (an (N, 2) array) at once, only among the points
+    # where valid is True (all if None): returns the point indices (-1 where there is none) and the squared distances
+    # (inf where there is none). With others=True the queries are the indexed points themselves, and the nearest
+    # other point is returned. Rings of cells are searched outwards from every query until the nearest point found
+    # can't be beaten by the next ring:
+    def nearest(self, queries, radius, valid=None, others=False):
+        n = len(queries)
+        best = np.full(n, -1, dtype=np.intp)
+        best_d2 = np.full(n, np.inf)
+        if not len(self.points):
+            return best, best_d2
+        r2 = radius * radius
+        column, row = self.cells_of(queries)
+        active = np.arange(n)  # the queries that may still find a nearer point
+        for k in range(ceil(radius / self.cell_size) + 1):
+            i, j = self.candidates_at(column.take(active), row.take(active), ring(k))
+            i = active.take(i)
+            if valid is not None:
+                keep = valid.take(j)
+                i, j = i[keep], j[keep]
+            if others:
+                keep = i != j
+                i, j = i[keep], j[keep]
+            diff = self.points.take(j, axis=0) - queries.take(i, axis=0)
+            d2 = diff[:, 0] ** 2 + diff[:, 1] ** 2
+            close = d2 < np.minimum(best_d2.take(i), r2)
+            i, j, d2 = i[close], j[close], d2[close]
+            if len(i):
+                # the candidates come grouped by query: the nearest one of every group is the first entry equal to
+                # the minimum of the group
+                starts = np.concatenate(([True], i[1:] != i[:-1]))
+                group = np.cumsum(starts) - 1
+                nearest = np.flatnonzero(d2 == np.minimum.reduceat(d2, np.flatnonzero(starts))[group])
+                nearest = nearest[np.concatenate(([True], group[nearest[1:]] != group[nearest[:-1]]))]
+                best[i[nearest]], best_d2[i[nearest]] = j[nearest], d2[nearest]
+            # the cells of the next ring are at least k cells away:
+            reach = k * self.cell_size
+            active = active[best_d2.take(active) > reach * reach]
+            if not len(active):
+                break
+        return best, best_d2
+
+    # indices of the indexed points closer than radius to the point (x, y):
+    def query(self, x, y, radius):
+        column, row = self.cells_of(np.array([[x, y]], dtype=float))
+        _, j = self.candidates(column, row, ceil(radius / self.cell_size))
+        diff = self.points[j] - (x, y)
+        return j[diff[:, 0] ** 2 + diff[:, 1] ** 2 < radius * radius]
+
+
+# ------------------------------------------------------------------
+# incremental index of points that appear and disappear (food patches): every point has a slot, removed slots are
+# reused. The alive points are filed in a SpatialGrid when the index is rebuilt. Between rebuilds a removal is only
+# a tombstone (the slot is masked out of the results) and new points wait in a pending list that is searched by
+# brute force, so inserting and removing cost O(1) and the grid is rebuilt once enough changes have piled up.
+# The grid cells are sized for a few points each (at most max_cell), so the ring search of SpatialGrid.nearest()
+# stops after a ring or two.
+class PointIndex:
+    REBUILD_PENDING = 64  # rebuild when this many points are waiting outside the grid
+    REBUILD_DEAD = 0.25  # ... or when this fraction of the grid is tombstones
+    POINTS_PER_CELL = 2  # average number of points per grid cell
+
+    def __init__(self, max_cell, width, height, capacity=64):
+        self.max_cell = max_cell
+        self.width = width
+        self.height = height
+        self.grid = SpatialGrid(max_cell, width, height)
+        self.points = np.zeros((capacity, 2))
+        self.alive = np.zeros(capacity, dtype=bool)
+        self.indexed = np.zeros(capacity, dtype=bool)  # alive and filed in the grid at its current position
+        self.free = list(range(capacity - 1, -1, -1))  # free slots, the lowest one last
+        self.pending = []  # slots inserted since the last rebuild
+        self.slots = np.zeros(0, dtype=np.intp)  # slot of every point of the grid
+        self.dead = 0  # tombstones in the grid
+        self.rebuilds = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive))
+
+    def insert(self, x, y):
+        if not self.free:
+            self._grow()
+        slot = self.free.pop()
+        self.points[slot] = x, y
+        self.alive[slot] = True
+        self.indexed[slot] = False
+        self.pending.append(slot)
+        if len(self.pending) > self.REBUILD_PENDING:
+            self.rebuild()
+        return slot
+
+    def remove(self, slot):
+        if not self.alive[slot]:
+            raise KeyError(slot)
+        self.alive[slot] = False
+        if self.indexed[slot]:
+            self.indexed[slot] = False
+            self.dead += 1
+            if self.dead > self.REBUILD_DEAD * len(self.slots):
+                self.rebuild()
+        else:
+            self.pending.remove(slot)
+        self.free.append(slot)
+
+    def _grow(self):
+        capacity = len(self.points)
+        size = max(2 * capacity, 64)
+        for name in ('points', 'alive', 'indexed'):
+            old = getattr(self, name)
+            new = np.zeros((size,) + old.shape[1:], dtype=old.dtype)
+            new[:capacity] = old
+            setattr(self, name, new)
+        self.free = list(range(size - 1, capacity - 1, -1))
+
+    # file all the alive points in a grid with cells for the current density:
+    def rebuild(self):
+        self.slots = np.flatnonzero(self.alive)
+        cell = min(self.max_cell, max(1.0, (self.width * self.height * self.POINTS_PER_CELL / max(len(self.slots), 1)) ** 0.5))
+        if cell != self.grid.cell_size:
+            self.grid = SpatialGrid(cell, self.width, self.height)
+        self.grid.rebuild(self.points[self.slots])
+        self.indexed[:] = self.alive
+        self.pending = []
+        self.dead = 0
+        self.rebuilds += 1
+
+    # ------------------------------------------------------------------
+    # the nearest point within radius of every query point (an (N, 2) array) at once: returns the slots (-1 where
+    # there is none) and the squared distances (inf where there is none)
+    def nearest(self, queries, radius):
+        n = len(queries)
+        best = np.full(n, -1, dtype=np.intp)
+        best_d2 = np.full(n, np.inf)
+        r2 = radius * radius
+        # filing the pending points is cheaper than comparing them with many queries:
+        if len(self.pending) * n > 8 * (len(self.slots) + 64):
+            self.rebuild()
+
+        if len(self.slots) > self.dead:
+            j, d2 = self.grid.nearest(queries, radius, self.indexed.take(self.slots))
+            found = j >= 0
+            best[found], best_d2[found] = self.slots.take(j[found]), d2[found]
+
+        if self.pending:
+            pending = np.array(self.pending, dtype=np.intp)
+            diff = self.points[pending][None, :, :] - queries[:, None, :]  # (N, pending, 2)
+            d2 = diff[:, :, 0] ** 2 + diff[:, :, 1] ** 2
+            nearest = d2.argmin(axis=1)
+            d2 = d2[np.arange(n), nearest]
+            better = (d2 < r2) & (d2 < best_d2)
+            best[better], best_d2[better] = pending[nearest[better]], d2[better]
+        return best, best_d2
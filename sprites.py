@@ -0,0 +1,94 @@
+import os
+from collections import OrderedDict
+from PIL import Image, ImageDraw
+
+# Process-wide sprite cache: the butterfly png is decoded once, and the resized images are memoized by their pixel
+# size. Butterfly masses are rounded to a few integer sizes, so the number of decodes, resizes and Tk images depends
+# on the number of distinct sizes instead of the number of butterflies.
+
+SPRITE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'butterfly.png')
+
+
+# ------------------------------------------------------------------
+# LRU cache of sprites. image(size) returns the resized Pillow image and photo(size) the Tk PhotoImage of it.
+# Evicting a PhotoImage only drops the reference of the cache: butterflies keep their own reference to the image
+# they are drawn with, so it stays alive on the canvas as long as they do.
+class SpriteCache:
+    def __init__(self, path=SPRITE_PATH, max_size=64):
+        self.path = path
+        self.max_size = max_size  # maximum number of sizes kept, per cache (images and photos)
+        self.source = None  # the decoded source image
+        self.images = OrderedDict()  # size -> resized Pillow image, least recently used first
+        self.photos = OrderedDict()  # size -> ImageTk.PhotoImage
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.decodes = 0
+
+    # decode the png file (only once):
+    def source_image(self):
+        if self.source is None:
+            with Image.open(self.path) as image:
+                self.source = image.convert('RGBA')
+            self.decodes += 1
+        return self.source
+
+    # look up size in one of the LRU dicts, creating the entry with make(size) on a miss:
+    def _get(self, cache, size, make):
+        if size in cache:
+            self.hits += 1
+            cache.move_to_end(size)
+            return cache[size]
+        self.misses += 1
+        value = cache[size] = make(size)
+        if len(cache) > self.max_size:
+            cache.popitem(last=False)
+            self.evictions += 1
+        return value
+
+    def image(self, size):
+        return self._get(self.images, size, lambda size: self.source_image().resize((size, size)))
+
+    def photo(self, size):
+        from PIL import ImageTk  # only windowed runs need tkinter
+        return self._get(self.photos, size, lambda size: ImageTk.PhotoImage(self.image(size)))
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'decodes': self.decodes,
+                'images': len(self.images), 'photos': len(self.photos)}
+
+    def clear(self):
+        self.images.clear()
+        self.photos.clear()
+
+
+# ------------------------------------------------------------------
+# the wasp sprite is drawn instead of decoded: a yellow body with black stripes and grey wings, seen from above and
+# heading right like the butterfly png
+class WaspSpriteCache(SpriteCache):
+    def __init__(self, max_size=64):
+        super().__init__(None, max_size)
+
+    def source_image(self):
+        if self.source is None:
+            image = Image.new('RGBA', (64, 64), (0, 0, 0, 0))
+            draw = ImageDraw.Draw(image)
+            draw.ellipse((18, 6, 40, 30), fill=(200, 200, 210, 200))  # wings
+            draw.ellipse((18, 34, 40, 58), fill=(200, 200, 210, 200))
+            draw.ellipse((6, 22, 50, 42), fill=(240, 200, 20, 255))  # abdomen and thorax
+            for x in (16, 26, 36):
+                draw.rectangle((x, 23, x + 4, 41), fill=(20, 20, 20, 255))
+            draw.ellipse((48, 25, 60, 39), fill=(20, 20, 20, 255))  # head
+            self.source = image
+            self.decodes += 1
+        return self.source
+
+
+# the caches shared by all the butterflies and all the wasps of the process:
+sprite_cache = SpriteCache()
+wasp_cache = WaspSpriteCache()
+
+
+# size in pixels of the sprite of a butterfly with this mass:
+def sprite_size(mass):
+    return int(mass * 10)  # size equivalent to mass
@@ -0,0 +1,227 @@
+# Parameter sweeps over headless worlds: every run is an independent, seeded flock of butterflies stepped without a
+# display, the runs are spread over a process pool and the metrics of every run are appended to one CSV file (one
+# column per parameter, per setting and per metric) as soon as it finishes. Runs that are already in the file with
+# the same settings (butterflies, ticks, world size) are skipped, so an interrupted sweep continues where it stopped
+# when it is started again with the same arguments.
+#   python sweep.py results.csv --param MAX_SPEED=2,3,4 --param SEPARATION_DISTANCE=40,80 --seeds 3
+#   python sweep.py results.csv --param MAX_FORCE=0.1:0.4 --param WANDER_CHANGE=0.1:0.6 --sample 50
+# A parameter is a trait of config.py (MAX_SPEED, MAX_FORCE, MEAN_MASS and their spreads) or a Flock constant.
+import argparse
+import concurrent.futures
+import csv
+import itertools
+import os
+import time
+import numpy as np
+from config import *
+from spatial import SpatialGrid
+
+# the trait means and spreads of butterfly_traits_array() by parameter name, and the Flock constants that can be swept:
+TRAITS = {'MAX_SPEED': 'speed', 'MAX_FORCE': 'force', 'MEAN_MASS': 'mass',
+          'SPEED_SPREAD': 'speed_spread', 'FORCE_SPREAD': 'force_spread', 'MASS_SPREAD': 'mass_spread'}
+CONSTANTS = ('DISTANCE_FROM_BORDER', 'CLOSE_ENOUGH', 'WANDER_R', 'WANDER_D', 'WANDER_CHANGE', 'SEPARATION_DISTANCE')
+SETTINGS = ('n', 'ticks', 'food_ticks', 'width', 'height')  # the fixed settings of a sweep, part of every run
+METRICS = ('mean_speed', 'nearest_neighbour', 'boundary_hits', 'time_to_food', 'reached_food', 'seconds')
+
+SAMPLE_EVERY = 10  # ticks between the nearest neighbour samples
+FOOD_SHARE = 0.5  # time to food: ticks until this share of the butterflies is close to the food
+FOOD_MARGIN = 100  # the food is offered at least this far from the borders
+
+
+# ------------------------------------------------------------------
+# "2,3,4" -> [2.0, 3.0, 4.0] (grid values), "2:4" -> (2.0, 4.0) (a range to sample uniformly):
+def parse_values(text):
+    if ':' in text:
+        low, high = text.split(':')
+        return float(low), float(high)
+    return [float(value) for value in text.split(',')]
+
+
+# "NAME=values" -> (NAME, values):
+def parse_param(text):
+    name, _, values = text.partition('=')
+    if name not in TRAITS and name not in CONSTANTS:
+        raise ValueError(f"unknown parameter {name!r}, expected one of {', '.join(list(TRAITS) + list(CONSTANTS))}")
+    return name, parse_values(values)
+
+
+# every combination of the grid values, once per seed. Ranges are not allowed in a grid:
+def grid_runs(params, seeds):
+    names = list(params)
+    for name in names:
+        if isinstance(params[name], tuple):
+            raise ValueError(f"{name} is a range: use --sample to sample it")
+    return [dict(zip(names, values), seed=seed)
+            for values in itertools.product(*(params[name] for name in names)) for seed in range(seeds)]
+
+
+# n random parameter sets, drawn uniformly from the ranges (or from the listed values), once per seed. The same
+# sample_seed gives the same runs, so a sampled sweep can be resumed:
+def sample_runs(params, n, seeds, sample_seed=0):
+    rng = np.random.default_rng(sample_seed)
+    runs = []
+    for i in range(n):
+        values = {name: float(rng.uniform(*values)) if isinstance(values, tuple) else float(rng.choice(values))
+                  for name, values in params.items()}
+        runs.extend(dict(values, seed=seed) for seed in range(seeds))
+    return runs
+
+
+# the identity of a run in the results file (its parameters, seed and settings):
+def run_key(run):
+    return ';'.join(f"{name}={run[name]!r}" for name in sorted(run))
+
+
+# ------------------------------------------------------------------
+# nearest neighbour distance of every butterfly (inf if it is alone):
+def nearest_neighbours(flock):
+    grid = SpatialGrid(flock.SEPARATION_DISTANCE, flock.width, flock.height)
+    grid.rebuild(flock.location.copy())
+    _, d2 = grid.nearest(flock.location, np.hypot(flock.width, flock.height), others=True)
+    return np.sqrt(d2)
+
+
+# one run: n butterflies wander for ticks frames (mean speed, nearest neighbour distance, bounces off the edges),
+# then food is offered at a random point and the time until FOOD_SHARE of them are within CLOSE_ENOUGH of it is
+# measured (NaN if that takes more than food_ticks). Runs in the worker processes:
+def run_world(run, n, ticks, food_ticks, width, height):
+    from flock import Flock
+    from headless import HeadlessCanvas
+    from PVector import PVector
+    start = time.perf_counter()
+    seed = int(run['seed'])
+    rng = np.random.default_rng(seed)
+    traits = butterfly_traits_array(rng, n, **{TRAITS[name]: value for name, value in run.items() if name in TRAITS})
+    flock = Flock(HeadlessCanvas(width, height), *traits, seed=seed)
+    for name in CONSTANTS:
+        if name in run:
+            setattr(flock, name, run[name])
+    flock.grid = SpatialGrid(flock.SEPARATION_DISTANCE, width, height)  # cells as big as the separation distance
+
+    speeds, distances = [], []
+    for tick in range(ticks):
+        flock.update()
+        speeds.append(np.hypot(flock.velocity[:, 0], flock.velocity[:, 1]).mean())
+        if tick % SAMPLE_EVERY == 0 and n > 1:
+            distances.append(nearest_neighbours(flock).mean())
+    boundary_hits = flock.bounces
+
+    x, y = rng.uniform((FOOD_MARGIN, FOOD_MARGIN), (width - FOOD_MARGIN, height - FOOD_MARGIN))
+    food = PVector(x, y)
+    time_to_food, reached = float('nan'), 0.0
+    for tick in range(food_ticks):
+        flock.update(food)
+        close = np.hypot(flock.location[:, 0] - x, flock.location[:, 1] - y) < flock.CLOSE_ENOUGH
+        reached = float(close.mean())
+        if reached >= FOOD_SHARE:
+            time_to_food = tick + 1
+            break
+
+    return {'mean_speed': float(np.mean(speeds)) if speeds else float('nan'),
+            'nearest_neighbour': float(np.mean(distances)) if distances else float('nan'),
+            'boundary_hits': boundary_hits, 'time_to_food': time_to_food, 'reached_food': reached,
+            'seconds': time.perf_counter() - start}
+
+
+# ------------------------------------------------------------------
+# the keys of the runs already in the results file. Rows that are incomplete (the sweep was stopped while writing
+# one) or whose metrics don't parse are not done:
+def completed(path):
+    if not os.path.exists(path):
+        return set()
+    done = set()
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            try:
+                [float(row[name]) for name in METRICS]
+            except (KeyError, TypeError, ValueError):
+                continue
+            if row.get('run'):
+                done.add(row['run'])
+    return done
+
+
+# run the runs that are not in the results file yet on workers processes (0: in this process) and append a row per
+# run as they finish. Returns the number of runs done now:
+def sweep(runs, path, workers=0, n=200, ticks=500, food_ticks=1000, width=WIDTH, height=HEIGHT, log=print):
+    settings = dict(n=n, ticks=ticks, food_ticks=food_ticks, width=width, height=height)
+    runs = [dict(run, **settings) for run in runs]
+    names = sorted({name for run in runs for name in run} - set(SETTINGS)) + list(SETTINGS)
+    done = completed(path)
+    pending = [run for run in runs if run_key(run) not in done]
+    log(f"{len(runs)} runs, {len(runs) - len(pending)} done already, {len(pending)} to run")
+    if not pending:
+        return 0
+
+    columns = ['run'] + names + list(METRICS)
+    new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+    if not new_file:
+        # the rows are appended under the header of the file:
+        with open(path, newline='') as file:
+            header = next(csv.reader(file))
+        missing = set(columns) - set(header)
+        if missing:
+            raise ValueError(f"{path} has no column for {', '.join(sorted(missing))}: use another results file")
+        columns = header
+        with open(path, 'rb') as file:
+            file.seek(-1, os.SEEK_END)
+            complete = file.read(1) == b'\n'
+    with open(path, 'a', newline='') as file:
+        if not new_file and not complete:
+            file.write('\r\n')  # end the row that was cut off, csv writes \r\n line ends
+        writer = csv.DictWriter(file, columns, extrasaction='ignore')
+        if new_file:
+            writer.writeheader()
+
+        def write(run, metrics):
+            writer.writerow(dict(run, run=run_key(run), **metrics))
+            file.flush()  # every finished run is on disk, whatever happens next
+
+        if workers == 0:
+            for i, run in enumerate(pending):
+                write(run, run_world(run, n, ticks, food_ticks, width, height))
+                log(f"{i + 1}/{len(pending)} {run_key(run)}")
+            return len(pending)
+
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = {executor.submit(run_world, run, n, ticks, food_ticks, width, height): run for run in pending}
+            for i, future in enumerate(concurrent.futures.as_completed(futures)):
+                run = futures[future]
+                write(run, future.result())
+                log(f"{i + 1}/{len(pending)} {run_key(run)}")
+    return len(pending)
+
+
+# ------------------------------------------------------------------
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep the butterfly parameters over seeded headless worlds")
+    parser.add_argument("results", help="CSV file the metrics are appended to (existing runs are skipped)")
+    parser.add_argument("--param", "-p", action="append", default=[], type=parse_param, metavar="NAME=VALUES",
+                        help="values of a parameter: a list (2,3,4) or, with --sample, a range (2:4)")
+    parser.add_argument("--sample", type=int, default=0, help="sample this many random parameter sets")
+    parser.add_argument("--sample-seed", type=int, default=0, help="random seed of the sampled parameter sets")
+    parser.add_argument("--seeds", type=int, default=1, help="worlds (seeds 0, 1, ...) per parameter set")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes (0: no pool)")
+    parser.add_argument("--butterflies", "-n", type=int, default=200)
+    parser.add_argument("--ticks", "-k", type=int, default=500, help="frames of wandering before the food")
+    parser.add_argument("--food-ticks", type=int, default=1000, help="frames allowed to reach the food")
+    parser.add_argument("--width", type=int, default=WIDTH)
+    parser.add_argument("--height", type=int, default=HEIGHT)
+    args = parser.parse_args(argv)
+
+    params = dict(args.param)
+    try:
+        runs = sample_runs(params, args.sample, args.seeds, args.sample_seed) if args.sample else grid_runs(params, args.seeds)
+    except ValueError as error:
+        parser.error(str(error))
+    start = time.perf_counter()
+    try:
+        count = sweep(runs, args.results, args.workers, args.butterflies, args.ticks, args.food_ticks,
+                      args.width, args.height)
+    except ValueError as error:
+        parser.error(str(error))
+    print(f"{count} runs in {time.perf_counter() - start:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
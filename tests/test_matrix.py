@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from Matrix import Matrix
+from NeuralNetwork import NeuralNetwork
+
+WEIGHTS = ('weights_IH', 'weights_HO', 'bias_H', 'bias_O')
+
+
+# a matrix backend network and a numpy backend one with the same weights:
+def twin_networks():
+    matrix = NeuralNetwork(2, 8, 2, 0.1, backend='matrix')
+    numpy = NeuralNetwork(2, 8, 2, 0.1, backend='numpy')
+    for name in WEIGHTS:
+        setattr(numpy, name, np.array(getattr(matrix, name)))
+    return matrix, numpy
+
+
+def test_backends_predict_the_same():
+    matrix, numpy = twin_networks()
+    inputs = np.random.default_rng(0).random((20, 2))
+    np.testing.assert_allclose(np.asarray(matrix.predict_batch(inputs)), numpy.predict_batch(inputs), atol=1e-12)
+    np.testing.assert_allclose(np.asarray(matrix.predict(list(inputs[0]))), numpy.predict(inputs[0]), atol=1e-12)
+
+
+def test_backends_train_the_same():
+    matrix, numpy = twin_networks()
+    rng = np.random.default_rng(1)
+    inputs, targets = rng.random((30, 2)), rng.random((30, 2))
+    for x, t in zip(inputs, targets):
+        matrix.train(list(x), list(t))
+        numpy.train(x, t)
+    matrix.train_batch(inputs, targets)
+    numpy.train_batch(inputs, targets)
+    for name in WEIGHTS:
+        np.testing.assert_allclose(np.asarray(getattr(matrix, name)), getattr(numpy, name), atol=1e-12)
+
+
+# ------------------------------------------------------------------
+def test_matrix_rows_write_through():
+    m = Matrix.from_list([[1, 2], [3, 4]])
+    m.matrix[0][1] = 9
+    m.matrix[1] = [7, 8]
+    m.T.matrix[0][1] = 5  # element (1, 0) of m
+    assert m.tolist() == [[1, 9], [5, 8]]
+
+
+def test_numpy_view_shares_memory_and_pins_the_buffer():
+    m = Matrix.from_list([[1, 2, 3], [4, 5, 6]])
+    view = np.asarray(m)
+    view[0, 1] = 9
+    assert m[0, 1] == 9
+    np.testing.assert_array_equal(np.asarray(m.T), view.T)
+    np.testing.assert_array_equal(np.asarray(m[1:]), view[1:])
+    with pytest.raises(BufferError):
+        m.data.extend([0.0] * 1000)  # would move the memory under the view
+    del view
+    m.data.extend([0.0])
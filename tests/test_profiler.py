@@ -0,0 +1,40 @@
+from butterfly import Butterfly, step_butterflies
+from headless import create_ecosystem
+from profiler import FrameProfiler
+from PVector import PVector
+from spatial import SpatialHash
+
+
+def test_uninstall_restores_the_methods():
+    canvas, _, step = create_ecosystem(20, seed=1)
+    init, apply_force = PVector.__init__, Butterfly.apply_force
+    profiler = FrameProfiler()
+    profiler.install(canvas)
+    assert PVector.__init__ is not init
+    profiler.uninstall()
+    assert PVector.__init__ is init and Butterfly.apply_force is apply_force
+    assert 'move' not in vars(canvas) and 'coords' not in vars(canvas)
+
+
+# a second profiler gets the counts from when it is installed on, the first one none after that:
+def test_hooks_count_for_the_active_profiler():
+    canvas, _, step = create_ecosystem(20, seed=1)
+    first = FrameProfiler()
+    first.install(canvas)
+    step()
+    counted = dict(first.counters)
+    assert counted['pvector_allocations'] > 0
+    second = FrameProfiler()
+    second.install(canvas)
+    step()
+    second.uninstall()
+    assert first.counters == counted
+    assert second.counters['pvector_allocations'] > 0 and second.counters['force_applications'] > 0
+
+
+def test_profiled_frame_times_the_phases():
+    canvas, butterflies, _ = create_ecosystem(20, seed=1)
+    profiler = FrameProfiler()
+    step_butterflies(butterflies, SpatialHash(80, butterflies), PVector(300, 300), profiler=profiler)
+    assert {'seek', 'boundaries', 'separate', 'move', 'bounce'} <= set(profiler.phases)
+    assert profiler.counters['neighbour_checks'] > 0
@@ -0,0 +1,9 @@
+from PVector import PVector
+
+
+# vectors change, so they compare and hash by identity and can be kept in sets and as dict keys:
+def test_vectors_are_hashable_by_identity():
+    a, b = PVector(1, 2), PVector(1, 2)
+    assert a != b and a == a
+    assert len({a, b}) == 2
+    assert {a: 'a'}[a] == 'a'
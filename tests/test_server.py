@@ -0,0 +1,35 @@
+import json
+import pytest
+from headless import create_ecosystem
+from server import SimulationServer
+
+
+@pytest.fixture
+def server():
+    _, views, _ = create_ecosystem(20, seed=1, flock=True)
+    return SimulationServer(views[0].flock)
+
+
+@pytest.mark.parametrize('message', [
+    'not json', b'\xff\xfe', '[1, 2]', '"food"', '{}', '{"cmd": "unknown"}',
+    '{"cmd": "food", "x": 5}', '{"cmd": "food", "x": "a", "y": 1}', '{"cmd": "food", "x": [1], "y": 1}',
+    '{"cmd": "food", "x": NaN, "y": 1}', '{"cmd": "obstacle", "x": 1, "y": 2, "width": 3}',
+    '{"cmd": "obstacle", "x": 1, "y": 2, "width": 3, "height": Infinity}',
+    '{"cmd": "obstacle", "x": 1, "y": 2, "width": null, "height": 4}',
+])
+def test_invalid_commands_are_ignored(server, message):
+    server.command(message)
+    assert server.food is None
+    assert len(server.flock.obstacles) == 0
+
+
+def test_valid_commands(server):
+    server.command(json.dumps({"cmd": "food", "x": 5, "y": 6}))
+    assert (server.food.x, server.food.y) == (5, 6)
+    server.command(json.dumps({"cmd": "food"}))
+    assert server.food is None
+    server.command(json.dumps({"cmd": "obstacle", "x": 1, "y": 2, "width": 3, "height": 4}))
+    (obstacle,) = server.flock.obstacles
+    assert (obstacle.x, obstacle.y, obstacle.size_x, obstacle.size_y) == (1, 2, 3, 4)
+    server.command(json.dumps({"cmd": "clear_obstacles"}))
+    assert len(server.flock.obstacles) == 0
@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+from headless import create_ecosystem
+from PVector import PVector
+from shards import ShardedFlock
+from world import Obstacle
+
+
+# a seeded flock with two obstacles (and their distance field if field=True), stepped by ticks frames in this
+# process (workers=0) or by a ShardedFlock. The food is offered in the second half:
+def run(workers, field, n=300, ticks=60):
+    canvas, views, _ = create_ecosystem(n, seed=3, flock=True)
+    flock = views[0].flock
+    flock.add_obstacle(Obstacle(canvas, 500, 200, 40, 400, 'blue'))
+    flock.add_obstacle(Obstacle(canvas, 200, 300, 300, 30, 'blue'))
+    if field:
+        flock.use_field()
+    food = PVector(1000, 400)
+    if workers:
+        with ShardedFlock(flock, workers) as sharded:
+            for tick in range(ticks):
+                sharded.step(food if tick >= ticks // 2 else None, draw=False)
+    else:
+        for tick in range(ticks):
+            flock.update(food if tick >= ticks // 2 else None)
+    return flock
+
+
+@pytest.mark.parametrize('field', [False, True])
+def test_sharded_flock_steps_like_one_process(field):
+    single, sharded = run(0, field), run(2, field)
+    np.testing.assert_allclose(sharded.location, single.location)
+    np.testing.assert_allclose(sharded.velocity, single.velocity)
+
+
+def test_sharded_flock_refuses_perceptrons():
+    canvas, views, _ = create_ecosystem(20, seed=1, flock=True)
+    with ShardedFlock(views[0].flock, 2) as sharded:
+        with pytest.raises(ValueError):
+            sharded.step(PVector(100, 100), draw=False, perceptron=True)
@@ -0,0 +1,40 @@
+import numpy as np
+from headless import create_ecosystem
+from NeuralNetwork import NeuralNetworkPopulation
+from snapshot import AGENT_ARRAYS, NETWORK_ARRAYS, load_snapshot, save_snapshot
+
+
+def flock_of(n=50, seed=2):
+    _, views, _ = create_ecosystem(n, seed=seed, flock=True)
+    flock = views[0].flock
+    for _ in range(10):
+        flock.update()
+    return flock
+
+
+def test_snapshot_round_trip(tmp_path):
+    flock = flock_of()
+    networks = NeuralNetworkPopulation(len(flock), 2, 8, 2, 0.1)
+    path = str(tmp_path / 'flock.npz')
+    save_snapshot(path, flock, networks)
+    loaded, loaded_networks = load_snapshot(path)
+
+    assert (loaded.width, loaded.height) == (flock.width, flock.height)
+    for name in AGENT_ARRAYS:
+        np.testing.assert_array_equal(getattr(loaded, name), getattr(flock, name))
+    np.testing.assert_array_equal(loaded.brains.weights, flock.brains.weights)
+    for name in NETWORK_ARRAYS:
+        np.testing.assert_array_equal(getattr(loaded_networks, name), getattr(networks, name))
+
+
+# the random generators are restored too, so a loaded flock goes on exactly like the saved one:
+def test_snapshot_continues_the_same_run(tmp_path):
+    flock = flock_of()
+    path = str(tmp_path / 'flock.npz')
+    save_snapshot(path, flock)
+    loaded, _ = load_snapshot(path)
+    for _ in range(20):
+        flock.update()
+        loaded.update()
+    np.testing.assert_array_equal(loaded.location, flock.location)
+    np.testing.assert_array_equal(loaded.wander_theta, flock.wander_theta)
@@ -0,0 +1,18 @@
+import numpy as np
+from headless import HeadlessCanvas
+from viewport import ChunkedWorld, Viewport
+
+
+# whatever the viewport does, no agent is ahead of the world or more than max_lag frames behind it:
+def test_chunked_world_lag_is_bounded():
+    viewport = Viewport(400, 300, 4000, 3000)
+    world = ChunkedWorld.random(HeadlessCanvas(400, 300), viewport, 2000, seed=1, max_lag=4)
+    rng = np.random.default_rng(0)
+    for tick in range(60):
+        if tick % 5 == 0:
+            viewport.centre_on(*rng.uniform((0, 0), (4000, 3000)))
+        world.update(dt=0.5 if tick % 2 else 1)
+        lag = world.lag()
+        assert lag.min() >= 0
+        assert lag.max() < 4  # max_lag steps of at most one frame
+    assert world.stepped < 60 * len(world)
@@ -0,0 +1,57 @@
+from time import perf_counter
+
+# Fixed timestep loop: the simulation advances in steps of a fixed length of simulated time, however often the Tk
+# callback fires. Every callback adds the real time elapsed to an accumulator and runs as many steps as fit into it,
+# so a late frame is made up with more steps instead of slowing the ecosystem down. A step can be split into
+# sub-steps (integrated with dt = 1 / substeps, in units of the original frame), and the positions drawn are
+# interpolated between the last two steps with the remainder of the accumulator. At most max_steps steps run per
+# callback: when the process can't keep up, the rest of the time is dropped and the ecosystem slows down instead of
+# spiralling into ever longer frames.
+
+
+class FixedTimestep:
+    def __init__(self, step, substeps=1, max_steps=5, clock=perf_counter):
+        self.step = step  # simulated seconds per step
+        self.substeps = substeps
+        self.dt = 1 / substeps  # the time step of one sub-step, in original frames (1: one move per step)
+        self.max_steps = max_steps
+        self.clock = clock
+        self.accumulator = 0.0  # real time not simulated yet
+        self.last = None  # clock at the last advance()
+        self.steps = 0  # steps run
+        self.dropped = 0.0  # real time dropped by the catch-up cap
+        self.capped = 0  # number of callbacks that hit the cap
+
+    # add the time elapsed since the last call (or the given elapsed seconds) and return the number of steps to run
+    # now and the interpolation factor between the states before and after the last step (0..1). The first call runs
+    # one step:
+    def advance(self, elapsed=None):
+        now = self.clock()
+        if elapsed is None:
+            elapsed = self.step if self.last is None else now - self.last
+        self.last = now
+        self.accumulator += elapsed
+        steps = int(self.accumulator // self.step)
+        if steps > self.max_steps:
+            self.dropped += self.accumulator - self.max_steps * self.step
+            self.accumulator = self.max_steps * self.step
+            self.capped += 1
+            steps = self.max_steps
+        self.accumulator -= steps * self.step
+        self.steps += steps
+        return steps, self.accumulator / self.step
+
+    # one callback of the loop: simulate(dt) is called for every sub-step, remember() (if any) before the last step
+    # so it can keep the state to interpolate from, and render(alpha) once at the end. Returns the number of steps:
+    def run(self, simulate, render, remember=None):
+        steps, alpha = self.advance()
+        for step in range(steps):
+            if remember is not None and step == steps - 1:
+                remember()
+            for substep in range(self.substeps):
+                simulate(self.dt)
+        render(alpha)
+        return steps
+
+    def stats(self):
+        return {'steps': self.steps, 'dropped': self.dropped, 'capped': self.capped}
@@ -0,0 +1,244 @@
+import multiprocessing
+import threading
+import numpy as np
+from multiprocessing import shared_memory
+from NeuralNetwork import NeuralNetwork
+
+# Background training of the butterfly NeuralNetwork. The agents only predict in the frame loop and push their
+# (inputs, target) experiences into a bounded replay buffer. A trainer (a thread, or a process so it doesn't share
+# the interpreter with the frame loop) trains its own copy of the network on random mini-batches of the buffer and
+# publishes the weights now and then into the back half of a double buffer, swapping it to the front when the copy
+# is complete. Once per frame the agents' network pulls the front weights if they changed, so every frame predicts
+# with one consistent set of weights however much training happens meanwhile.
+#
+# All the shared state is one float64 block (shared memory for a process trainer), laid out like shards.py:
+HEAD, VERSION, FRONT, STEPS = range(4)  # the counters of the 'state' field: experiences pushed, weights published,
+                                        # front half of the weights, training steps
+
+
+def training_layout(capacity, nr_inputs, nr_outputs, nr_weights):
+    return {
+        'inputs': (capacity, nr_inputs),
+        'targets': (capacity, nr_outputs),
+        'weights': (2, nr_weights),
+        'state': (4,),
+    }
+
+
+# numpy arrays over the buffer, one per field of the layout:
+def training_arrays(buffer, layout):
+    arrays, offset = {}, 0
+    for name, shape in layout.items():
+        arrays[name] = np.ndarray(shape, dtype=np.float64, buffer=buffer, offset=offset * 8)
+        offset += int(np.prod(shape))
+    return arrays
+
+
+def training_size(layout):
+    return sum(int(np.prod(shape)) for shape in layout.values()) * 8
+
+
+# ------------------------------------------------------------------
+# the weights and biases of a (numpy backend) network as one flat vector, and back, in place:
+def get_weights(nn):
+    return np.concatenate((nn.weights_IH.ravel(), nn.weights_HO.ravel(), nn.bias_H.ravel(), nn.bias_O.ravel()))
+
+
+def set_weights(nn, flat):
+    offset = 0
+    for matrix in (nn.weights_IH, nn.weights_HO, nn.bias_H, nn.bias_O):
+        matrix[...] = flat[offset:offset + matrix.size].reshape(matrix.shape)
+        offset += matrix.size
+
+
+def weight_count(nr_inputs, nr_hidden, nr_outputs):
+    return nr_hidden * nr_inputs + nr_outputs * nr_hidden + nr_hidden + nr_outputs
+
+
+# ------------------------------------------------------------------
+# bounded ring of experiences: when it is full the oldest ones are overwritten
+class ReplayBuffer:
+    def __init__(self, inputs, targets, state, lock):
+        self.inputs = inputs
+        self.targets = targets
+        self.state = state
+        self.lock = lock
+        self.capacity = len(inputs)
+
+    def __len__(self):
+        return min(int(self.state[HEAD]), self.capacity)
+
+    # one experience, or a batch (one per row):
+    def push(self, inputs, targets):
+        inputs = np.asarray(inputs, dtype=float).reshape(-1, self.inputs.shape[1])
+        targets = np.asarray(targets, dtype=float).reshape(-1, self.targets.shape[1])
+        with self.lock:
+            head = int(self.state[HEAD])
+            rows = (head + np.arange(len(inputs))) % self.capacity
+            self.inputs[rows] = inputs
+            self.targets[rows] = targets
+            self.state[HEAD] = head + len(inputs)
+
+    # batch_size random experiences (copies):
+    def sample(self, batch_size, rng):
+        with self.lock:
+            rows = rng.integers(0, len(self), batch_size)
+            return self.inputs[rows], self.targets[rows]
+
+
+# ------------------------------------------------------------------
+# two copies of the weights: the trainer writes the back one and swaps, readers copy the front one. Both the swap and
+# the copy hold the lock, and the trainer never writes the front copy, so a reader never sees half an update.
+class DoubleBufferedWeights:
+    def __init__(self, weights, state, lock):
+        self.weights = weights
+        self.state = state
+        self.lock = lock
+
+    # only one publisher (the trainer), so the front index can be read without the lock:
+    def publish(self, flat):
+        back = 1 - int(self.state[FRONT])
+        self.weights[back] = flat
+        with self.lock:
+            self.state[FRONT] = back
+            self.state[VERSION] += 1
+
+    # copy the front weights into out if they are newer than version. Returns the version of out:
+    def pull(self, out, version):
+        with self.lock:
+            current = int(self.state[VERSION])
+            if current != version:
+                out[:] = self.weights[int(self.state[FRONT])]
+            return current
+
+
+# ------------------------------------------------------------------
+# the trainer: train a private network on mini-batches until stop is set, publishing every publish_every steps
+def train_loop(buffer, weights, shape, learning_rate, batch_size, publish_every, stop, seed=None):
+    rng = np.random.default_rng(seed)
+    learner = NeuralNetwork(*shape, learning_rate, backend='numpy')
+    flat = np.empty(weights.weights.shape[1])
+    weights.pull(flat, -1)
+    set_weights(learner, flat)
+    steps = int(buffer.state[STEPS])
+    while not stop.is_set():
+        if len(buffer) < batch_size:
+            stop.wait(0.01)  # not enough experience yet
+            continue
+        learner.train_batch(*buffer.sample(batch_size, rng))
+        steps += 1
+        buffer.state[STEPS] = steps
+        if steps % publish_every == 0:
+            weights.publish(get_weights(learner))
+
+
+# process trainer: attach to the shared block and run the loop
+def _train_process(name, layout, buffer_lock, weights_lock, shape, learning_rate, batch_size, publish_every, stop, seed):
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        arrays = training_arrays(block.buf, layout)
+        buffer = ReplayBuffer(arrays['inputs'], arrays['targets'], arrays['state'], buffer_lock)
+        weights = DoubleBufferedWeights(arrays['weights'], arrays['state'], weights_lock)
+        train_loop(buffer, weights, shape, learning_rate, batch_size, publish_every, stop, seed)
+        del arrays, buffer, weights
+    finally:
+        block.close()
+
+
+# ------------------------------------------------------------------
+# the whole pipeline. network is the network the agents predict with (give it to them as their .nn, and the
+# pipeline as their .experience); refresh() once per frame brings in the newest published weights. The single
+# experiences that the agents push during a frame are collected in lists and written to the buffer in one batch
+# by refresh(), so pushing costs a list append in the frame loop.
+class TrainingPipeline:
+    def __init__(self, nr_inputs, nr_hidden, nr_outputs, learning_rate, capacity=10000, batch_size=64,
+                 publish_every=10, process=False, seed=None):
+        self.shape = (nr_inputs, nr_hidden, nr_outputs)
+        self.learning_rate = learning_rate
+        self.batch_size = batch_size
+        self.publish_every = publish_every
+        self.process = process
+        self.seed = seed
+        self.network = NeuralNetwork(nr_inputs, nr_hidden, nr_outputs, learning_rate, backend='numpy')
+
+        self.layout = training_layout(capacity, nr_inputs, nr_outputs, weight_count(*self.shape))
+        size = training_size(self.layout)
+        if process:
+            self.block = shared_memory.SharedMemory(create=True, size=size)
+            memory = self.block.buf
+            self.buffer_lock, self.weights_lock = multiprocessing.Lock(), multiprocessing.Lock()
+            self.stopping = multiprocessing.Event()
+        else:
+            self.block = None
+            memory = bytearray(size)
+            self.buffer_lock, self.weights_lock = threading.Lock(), threading.Lock()
+            self.stopping = threading.Event()
+        self.arrays = training_arrays(memory, self.layout)
+        self.buffer = ReplayBuffer(self.arrays['inputs'], self.arrays['targets'], self.arrays['state'], self.buffer_lock)
+        self.weights = DoubleBufferedWeights(self.arrays['weights'], self.arrays['state'], self.weights_lock)
+
+        # the trainer starts from the weights of the network:
+        self.flat = get_weights(self.network)
+        self.weights.publish(self.flat)
+        self.version = int(self.arrays['state'][VERSION])
+        self.worker = None
+        self.pending_inputs, self.pending_targets = [], []
+
+    def __len__(self):
+        return len(self.buffer)
+
+    # one experience (sequences of nr_inputs and nr_outputs numbers), buffered at the next refresh():
+    def push(self, inputs, targets):
+        self.pending_inputs.append(inputs)
+        self.pending_targets.append(targets)
+
+    # experiences as rows of arrays, buffered now:
+    def push_batch(self, inputs, targets):
+        self.buffer.push(inputs, targets)
+
+    def flush(self):
+        if self.pending_inputs:
+            self.buffer.push(self.pending_inputs, self.pending_targets)
+            self.pending_inputs, self.pending_targets = [], []
+
+    # buffer the pushed experiences and bring the newest published weights into the network. Returns True if they
+    # changed:
+    def refresh(self):
+        self.flush()
+        version = self.weights.pull(self.flat, self.version)
+        if version == self.version:
+            return False
+        set_weights(self.network, self.flat)
+        self.version = version
+        return True
+
+    def start(self):
+        args = (self.shape, self.learning_rate, self.batch_size, self.publish_every, self.stopping, self.seed)
+        if self.process:
+            self.worker = multiprocessing.Process(target=_train_process, daemon=True,
+                                                  args=(self.block.name, self.layout, self.buffer_lock,
+                                                        self.weights_lock) + args)
+        else:
+            self.worker = threading.Thread(target=train_loop, daemon=True, args=(self.buffer, self.weights) + args)
+        self.worker.start()
+        return self
+
+    def stop(self):
+        self.stopping.set()
+        if self.worker is not None:
+            self.worker.join()
+            self.worker = None
+        self.stopping.clear()
+
+    def close(self):
+        self.stop()
+        if self.block is not None:
+            del self.arrays, self.buffer, self.weights
+            self.block.close()
+            self.block.unlink()
+            self.block = None
+
+    def stats(self):
+        state = self.arrays['state']
+        return {'experiences': int(state[HEAD]), 'buffered': len(self.buffer), 'steps': int(state[STEPS]),
+                'published': int(state[VERSION]), 'pulled': self.version}
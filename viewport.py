@@ -0,0 +1,320 @@
+import copy
+import numpy as np
+from math import ceil
+from config import *
+from flock import Flock
+from render import CompositeRenderer
+from sprites import sprite_cache, sprite_size
+
+# Worlds larger than the window. The flock lives in world coordinates (any width x height) and the window is a
+# Viewport onto it that can be panned and zoomed:
+#   Viewport:          the camera, world <-> screen coordinates, mouse and keyboard bindings
+#   ViewportRenderer:  canvas items only for the agents inside the viewport, from a pool of hidden items
+#   ViewportCompositeRenderer: only the agents inside the viewport composited into one frame of the window size
+#   ChunkedWorld:      the world divided into square chunks. The agents in and around the viewport are stepped every
+#                      frame, the others in turns, each one every max_lag frames (level of detail). Every agent is
+#                      stepped by the time since it was stepped last, so an agent off-screen is never more than
+#                      max_lag frames behind and never ahead, wherever it moves.
+# Drawing and stepping then cost the agents in view plus 1 / max_lag of the others, instead of all of them.
+SPRITE_MARGIN = 32  # world units around the viewport where the agents are still drawn (half the largest sprite)
+
+
+# ------------------------------------------------------------------
+# the camera: the world point at the top left corner of the window and the zoom (screen pixels per world unit)
+class Viewport:
+    def __init__(self, width, height, world_width, world_height, x=0, y=0, zoom=1, max_zoom=4):
+        self.width = width  # window size in pixels
+        self.height = height
+        self.world_width = world_width
+        self.world_height = world_height
+        self.min_zoom = min(1, width / world_width, height / world_height)  # the whole world fits the window
+        self.max_zoom = max_zoom
+        self.x, self.y, self.zoom = x, y, zoom
+        self.clamp()
+
+    # keep the view inside the world (centred on it where the world is smaller than the window):
+    def clamp(self):
+        self.zoom = min(max(self.zoom, self.min_zoom), self.max_zoom)
+        span_x, span_y = self.width / self.zoom, self.height / self.zoom
+        self.x = (self.world_width - span_x) / 2 if span_x >= self.world_width else \
+            min(max(self.x, 0), self.world_width - span_x)
+        self.y = (self.world_height - span_y) / 2 if span_y >= self.world_height else \
+            min(max(self.y, 0), self.world_height - span_y)
+
+    # move the view by dx, dy screen pixels:
+    def pan(self, dx, dy):
+        self.x += dx / self.zoom
+        self.y += dy / self.zoom
+        self.clamp()
+
+    # zoom by factor, keeping the world point under the screen point (sx, sy) where it is:
+    def zoom_at(self, factor, sx, sy):
+        wx, wy = self.to_world(sx, sy)
+        self.zoom *= factor
+        self.clamp()
+        self.x, self.y = wx - sx / self.zoom, wy - sy / self.zoom
+        self.clamp()
+
+    # look at the world point (x, y):
+    def centre_on(self, x, y):
+        self.x, self.y = x - self.width / self.zoom / 2, y - self.height / self.zoom / 2
+        self.clamp()
+
+    # the world rectangle in view: x0, y0, x1, y1
+    def bounds(self):
+        return self.x, self.y, self.x + self.width / self.zoom, self.y + self.height / self.zoom
+
+    def to_screen(self, points):
+        return (points - (self.x, self.y)) * self.zoom
+
+    def to_world(self, sx, sy):
+        return self.x + sx / self.zoom, self.y + sy / self.zoom
+
+    # indices of the points (N x 2, world coordinates) in view, margin world units around it included:
+    def visible(self, points, margin=0):
+        x0, y0, x1, y1 = self.bounds()
+        x, y = points[:, 0], points[:, 1]
+        return np.flatnonzero((x >= x0 - margin) & (x <= x1 + margin) & (y >= y0 - margin) & (y <= y1 + margin))
+
+    # ------------------------------------------------------------------
+    # pan with the right button dragged or the arrow keys, zoom with the mouse wheel:
+    def bind(self, canvas, step=50):
+        drag = {}
+
+        def press(event):
+            drag['x'], drag['y'] = event.x, event.y
+
+        def motion(event):
+            self.pan(drag['x'] - event.x, drag['y'] - event.y)
+            press(event)
+
+        def wheel(event):
+            up = event.num == 4 or getattr(event, 'delta', 0) > 0
+            self.zoom_at(1.25 if up else 0.8, event.x, event.y)
+
+        canvas.bind('<ButtonPress-3>', press)
+        canvas.bind('<B3-Motion>', motion)
+        canvas.bind('<MouseWheel>', wheel)  # Windows and macOS
+        canvas.bind('<Button-4>', wheel)  # X11
+        canvas.bind('<Button-5>', wheel)
+        for key, dx, dy in (('<Left>', -step, 0), ('<Right>', step, 0), ('<Up>', 0, -step), ('<Down>', 0, step)):
+            canvas.bind_all(key, lambda event, dx=dx, dy=dy: self.pan(dx, dy))
+
+
+# ------------------------------------------------------------------
+# canvas items only for the agents in view: an agent coming into view gets a hidden item from the pool (or a new
+# one), an agent leaving it gives its item back, so the canvas has as many items as the most agents seen at once.
+# The sprites are sized for the zoom. The items of all the agents are given back when the agents or the zoom change.
+class ViewportRenderer:
+    kind = 'viewport'
+
+    def __init__(self, viewport, canvas, masses, cache=sprite_cache):
+        self.viewport = viewport
+        self.canvas = canvas
+        self.cache = cache
+        self.masses = masses
+        self.shown = {}  # agent -> (item, sprite size)
+        self.pool = []  # (item, sprite size) of the hidden items
+        self.images = {}  # sprite size -> PhotoImage, referenced as long as items may show it
+        self.zoom = viewport.zoom
+
+    def set_masses(self, masses):
+        self.masses = masses
+        self.release(list(self.shown))
+
+    def release(self, agents):
+        for agent in agents:
+            item, size = self.shown.pop(agent)
+            self.canvas.itemconfigure(item, state='hidden')
+            self.pool.append((item, size))
+
+    def item_for(self, agent, x, y):
+        size = sprite_size(self.masses[agent] * self.zoom)
+        if self.pool:
+            item, shown_size = self.pool.pop()
+            if shown_size != size:
+                self.canvas.itemconfigure(item, image=self.image(size), state='normal')
+            else:
+                self.canvas.itemconfigure(item, state='normal')
+        elif getattr(self.canvas, 'headless', False):
+            item = self.canvas.create_image(x, y)
+        else:
+            item = self.canvas.create_image(x, y, image=self.image(size))
+        self.shown[agent] = item, size
+        return item
+
+    def image(self, size):
+        if size not in self.images:
+            self.images[size] = None if getattr(self.canvas, 'headless', False) else self.cache.photo(size)
+        return self.images[size]
+
+    def draw(self, location):
+        viewport = self.viewport
+        if viewport.zoom != self.zoom:
+            self.zoom = viewport.zoom
+            self.release(list(self.shown))
+        agents = viewport.visible(location, SPRITE_MARGIN)
+        screen = viewport.to_screen(location[agents])
+        visible = agents.tolist()
+        self.release(set(self.shown).difference(visible))
+        items = [self.shown[agent][0] if agent in self.shown else self.item_for(agent, x, y)
+                 for agent, (x, y) in zip(visible, screen.tolist())]
+
+        # all the coords in one Tcl script, as BatchedCanvasRenderer:
+        tk = getattr(self.canvas, 'tk', None)
+        if tk is None:
+            for item, (x, y) in zip(items, screen.tolist()):
+                self.canvas.coords(item, x, y)
+        elif items:
+            path = str(self.canvas)
+            tk.eval("\n".join([f"{path} coords {item} {x:.2f} {y:.2f}"
+                               for item, (x, y) in zip(items, screen.tolist())]))
+
+
+# ------------------------------------------------------------------
+# the agents in view composited into one frame of the window size, with the sprites sized for the zoom:
+class ViewportCompositeRenderer(CompositeRenderer):
+    kind = 'viewport_composite'
+
+    def __init__(self, viewport, canvas, masses, cache=sprite_cache):
+        super().__init__(canvas, np.zeros(0), viewport.width, viewport.height, cache=cache)
+        self.viewport = viewport
+        self.masses = masses
+
+    def set_masses(self, masses):
+        self.masses = masses
+
+    def composite(self, location):
+        viewport = self.viewport
+        agents = viewport.visible(location, SPRITE_MARGIN)
+        self.sprites.set_masses(self.masses[agents] * viewport.zoom)
+        return super().composite(viewport.to_screen(location[agents]))
+
+
+# ------------------------------------------------------------------
+# a flock in a world of any size, seen through a viewport and stepped with level of detail. The chunks in view and
+# margin chunks around it are stepped every frame; the other chunks are split into max_lag turns (by chunk) and the
+# chunks of a turn are stepped every max_lag frames with a time step of max_lag frames, so they keep up on average
+# and an agent is never more than max_lag frames behind when it comes into view. max_lag = 1 steps every agent every
+# frame. An agent is only stepped with the others stepped at the same time: it doesn't see (separate from) the agents
+# of chunks that are not stepped in that frame.
+class ChunkedWorld:
+    def __init__(self, flock, viewport, chunk_size=CHUNK_SIZE, max_lag=MAX_LAG, margin=1):
+        self.flock = flock
+        self.viewport = viewport
+        self.chunk_size = chunk_size
+        self.max_lag = max_lag
+        self.margin = margin  # chunks around the viewport that are stepped every frame
+        self.columns = max(1, ceil(flock.width / chunk_size))
+        self.rows = max(1, ceil(flock.height / chunk_size))
+        self.tick = 0
+        self.time = 0.0  # simulated frames (the sum of the time steps)
+        self.clock = np.zeros(len(flock))  # the time every agent is simulated up to
+        self.stepped = 0  # agent steps so far (stepping every agent every frame: ticks x agents)
+
+    # n butterflies with random traits at random locations in a world of width x height, drawn in the viewport on
+    # the canvas (renderer 'canvas': items for the agents in view, 'composite': one frame):
+    @classmethod
+    def random(cls, canvas, viewport, n, seed=None, renderer='canvas', **options):
+        rng = np.random.default_rng(seed)
+        max_speed, max_force, mass = butterfly_traits_array(rng, n)
+        location = rng.uniform((0, 0), (viewport.world_width, viewport.world_height), (n, 2))
+        flock = Flock.from_arrays(viewport.world_width, viewport.world_height, location, np.zeros((n, 2)),
+                                  np.zeros((n, 2)), max_speed, max_force, mass, np.zeros(n), brains=False, seed=seed,
+                                  canvas=canvas)
+        world = cls(flock, viewport, **options)
+        world.use_renderer(renderer)
+        return world
+
+    def __len__(self):
+        return len(self.flock)
+
+    def use_renderer(self, kind='canvas'):
+        flock = self.flock
+        if kind == 'canvas':
+            flock.renderer = ViewportRenderer(self.viewport, flock.canvas, flock.mass, flock.sprites)
+        elif kind == 'composite':
+            flock.renderer = ViewportCompositeRenderer(self.viewport, flock.canvas, flock.mass, flock.sprites)
+        else:
+            raise ValueError(f"unknown viewport renderer {kind!r}")
+        return flock.renderer
+
+    # ------------------------------------------------------------------
+    # the chunk (row * columns + column) of every point:
+    def chunks_of(self, points):
+        column = np.clip((points[:, 0] // self.chunk_size).astype(np.intp), 0, self.columns - 1)
+        row = np.clip((points[:, 1] // self.chunk_size).astype(np.intp), 0, self.rows - 1)
+        return row * self.columns + column
+
+    # True for the chunks in view or within margin chunks of it:
+    def near_chunks(self):
+        x0, y0, x1, y1 = self.viewport.bounds()
+        c0, c1 = max(int(x0 // self.chunk_size) - self.margin, 0), int(x1 // self.chunk_size) + self.margin + 1
+        r0, r1 = max(int(y0 // self.chunk_size) - self.margin, 0), int(y1 // self.chunk_size) + self.margin + 1
+        near = np.zeros((self.rows, self.columns), dtype=bool)
+        near[r0:r1, c0:c1] = True
+        return near.ravel()
+
+    # the agents to step now: the ones near the view, and the far ones whose turn it is. The turn of an agent is its
+    # index modulo max_lag (not its chunk, which changes as it moves), so a far agent is due every max_lag frames
+    def due(self):
+        chunks = self.chunks_of(self.flock.location)
+        if self.max_lag <= 1:
+            return np.arange(len(chunks)), np.zeros(0, dtype=np.intp)
+        near = self.near_chunks()[chunks]
+        turn = np.arange(len(chunks)) % self.max_lag == self.tick % self.max_lag
+        return np.flatnonzero(near), np.flatnonzero(~near & turn)
+
+    # ------------------------------------------------------------------
+    # one frame (or a sub-step of dt frames) of the flock with level of detail. The due agents are stepped by the
+    # time since their last step: dt for the agents that stay near the view, up to max_lag * dt for the far ones
+    def update(self, food=None, dt=1):
+        if len(self.clock) != len(self.flock):  # agents were removed or added: they start from now
+            self.clock = np.full(len(self.flock), self.time)
+        near, far = self.due()
+        self.time += dt
+        agents = np.concatenate((near, far))
+        lag = np.round(self.time - self.clock[agents], 9)
+        for step in np.unique(lag).tolist():
+            self.step_agents(agents[lag == step], food, step)
+        self.clock[agents] = self.time
+        self.tick += 1
+
+    # how many frames every agent is behind the world:
+    def lag(self):
+        return self.time - self.clock
+
+    def step(self, food=None):
+        self.update(food)
+        self.draw()
+
+    def draw(self, alpha=None):
+        self.flock.draw(alpha)
+
+    def remember(self):
+        self.flock.remember()
+
+    # Flock.update() of the agents at the indices only: a shallow copy of the flock over copies of their rows is
+    # stepped and the rows are written back
+    def step_agents(self, agents, food, dt):
+        flock = self.flock
+        if not len(agents):
+            return
+        self.stepped += len(agents)
+        if len(agents) == len(flock):
+            flock.update(food, dt=dt)
+            return
+        part = copy.copy(flock)
+        part.recorder = None
+        part.bounces = 0
+        arrays = flock.agent_arrays()
+        if flock.brains is not False:
+            part.brains = copy.copy(flock.brains)
+        for owner, name in arrays:
+            target = part if owner is flock else part.brains
+            setattr(target, name, getattr(owner, name)[agents])
+        part.update(food, dt=dt)
+        for owner, name in arrays:
+            source = part if owner is flock else part.brains
+            getattr(owner, name)[agents] = getattr(source, name)
+        flock.bounces += part.bounces
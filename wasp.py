@@ -0,0 +1,209 @@
+import numpy as np
+from time import perf_counter
+from config import *
+from flock import *
+from spatial import SpatialGrid, SpatialHash
+from sprites import wasp_cache
+
+# Wasps: predators that pursue the nearest butterfly within their perception radius and catch it when they get
+# close enough; the caught butterfly is removed from the ecosystem. Butterflies flee from the nearest wasp with
+# seek(..., direction='avoid').
+#   Wasp, step_wasps():    one wasp at a time, for the scalar Butterfly path of main.py
+#   WaspSwarm, step_predators(): all the wasps in flock arrays, for thousands of wasps and tens of thousands of
+#                          butterflies. The nearest prey of every wasp and the nearest wasp of every butterfly are
+#                          found with one batched grid query each (SpatialGrid.nearest()), and the caught butterflies
+#                          are swap-removed from the Flock (Flock.remove()), hiding their canvas items for reuse.
+PERCEPTION = 200  # distance at which a wasp notices a butterfly
+CAPTURE_DISTANCE = 15  # distance at which a wasp catches the butterfly it pursues
+FLEE_DISTANCE = 100  # distance from a wasp at which a butterfly flees
+MAX_LEAD = 20  # pursuit: at most this many frames ahead of the prey
+
+
+# ------------------------------------------------------------------
+# the object nearest to location among the candidates (objects with a .location), closer than radius, or None:
+def nearest_of(location, candidates, radius):
+    best, best_d2 = None, radius * radius
+    for candidate in candidates:
+        dx = candidate.location.x - location.x
+        dy = candidate.location.y - location.y
+        d2 = dx * dx + dy * dy
+        if d2 < best_d2:
+            best, best_d2 = candidate, d2
+    return best
+
+
+# ------------------------------------------------------------------
+class Wasp(Butterfly):
+    sprites = wasp_cache  # drawn as a wasp, the rest of the Butterfly methods work as they are
+
+    # pursue the nearest butterfly of the SpatialHash neighbours: seek the point where it will be when the wasp gets
+    # there (at most MAX_LEAD frames ahead), or wander if no butterfly is in sight. Returns the pursued butterfly:
+    def hunt(self, neighbours, dt=1):
+        prey = nearest_of(self.location, neighbours.near(self.location, PERCEPTION), PERCEPTION)
+        if prey is None:
+            self.wander(dt)
+            return None
+        distance = self.location.Sub(prey.location).get_Magnitude()
+        lead = min(distance / self.max_speed, MAX_LEAD)
+        self.seek(PVector(prey.location.x + prey.velocity.x * lead, prey.location.y + prey.velocity.y * lead), 'none')
+        return prey
+
+    def catches(self, prey):
+        dx = prey.location.x - self.location.x
+        dy = prey.location.y - self.location.y
+        return dx * dx + dy * dy < CAPTURE_DISTANCE * CAPTURE_DISTANCE
+
+
+# ------------------------------------------------------------------
+# one frame of the wasps for the scalar path, before step_butterflies(): every wasp hunts, moves and catches its prey
+# (removed from the butterflies, the SpatialHash and the canvas), then every butterfly near a wasp flees from the
+# nearest one (the force is applied at its next move()). With respawn=True a new butterfly replaces every caught one,
+# dt is the time step in frames. Returns the number of butterflies caught:
+def step_wasps(wasps, butterflies, neighbours, respawn=False, dt=1):
+    caught = []
+    for wasp in wasps:
+        prey = wasp.hunt(neighbours, dt)
+        wasp.boundaries()
+        wasp.move(dt)
+        wasp.bounce()
+        if prey is not None and prey in neighbours.where and wasp.catches(prey):
+            neighbours.remove(prey)
+            caught.append(prey)
+    for prey in caught:
+        butterflies.remove(prey)
+        prey.canvas.delete(prey.id)
+        if respawn:
+            butterfly = Butterfly(prey.canvas, *butterfly_traits())
+            butterflies.append(butterfly)
+            neighbours.insert(butterfly)
+
+    # the wasps filed by cells as big as the flee distance:
+    hunters = SpatialHash(FLEE_DISTANCE, wasps)
+    for butterfly in butterflies:
+        wasp = nearest_of(butterfly.location, hunters.near(butterfly.location, FLEE_DISTANCE), FLEE_DISTANCE)
+        if wasp is not None:
+            butterfly.seek(wasp.location, direction='avoid')
+    return len(caught)
+
+
+# ------------------------------------------------------------------
+# all the wasps in flock arrays. They wander, turn away from the borders, the obstacles and each other, move and
+# bounce as a Flock, but pursue the nearest prey instead of food. The wasps have no perceptrons.
+class WaspSwarm(Flock):
+    SEPARATION_DISTANCE = 40
+    PREY_CELL = PERCEPTION / 4  # cell size of the prey grid: the ring search stops after a ring or two
+
+    sprites = wasp_cache
+    captured = 0  # number of prey caught
+
+    def __init__(self, canvas, max_speed, max_force, mass, seed=None):
+        super().__init__(canvas, max_speed, max_force, mass, seed)
+        self.brains = False
+        self.prey_grid = SpatialGrid(self.PREY_CELL, self.width, self.height)
+        self.hunted = np.full(len(self), -1, dtype=np.intp)  # the prey index of every wasp (-1: none)
+
+    # n wasps with random traits around the WASP_ means of config.py:
+    @classmethod
+    def random(cls, canvas, n, seed=None):
+        return cls(canvas, *wasp_traits_array(np.random.default_rng(seed), n), seed=seed)
+
+    # draw into the frame of the prey when it is composited (CompositeRenderer.layer()), so both end up in one
+    # image, otherwise with a renderer of its own:
+    def share_renderer(self, prey):
+        renderer = prey.renderer if prey.renderer is not None else prey.use_renderer()
+        if renderer.kind != 'composite':
+            return self.use_renderer()
+        for item in self.ids:
+            self.canvas.delete(item)
+        self.ids, self.images = [], []
+        self.renderer = renderer.layer(self.mass, self.sprites)
+        return self.renderer
+
+    # ------------------------------------------------------------------
+    # one frame of the swarm after the prey has moved: hunt, avoid the borders, the obstacles and the other wasps,
+    # move, bounce and catch:
+    def step(self, prey):
+        self.update(prey)
+        self.draw()
+
+    def update(self, prey, noise=None, dt=1):
+        profiler = self.profiler
+        start = perf_counter() if profiler is not None else 0
+        self.hunt(prey, self.wander_noise(dt) if noise is None else noise)
+        if profiler is not None:
+            start = profiler.lap('hunt', start)
+        self.avoid_environment()
+        self.separate()
+        self.move(dt)
+        self.bounce()
+        if self.field is not None:
+            self.bounce_field()
+        if profiler is not None:
+            start = profiler.lap('wasps', start)
+        caught = self.capture(prey)
+        if profiler is not None:
+            profiler.lap('capture', start)
+            profiler.count('caught', caught)
+        return caught
+
+    # pursue the nearest prey (a Flock) within PERCEPTION, at most MAX_LEAD frames ahead of it, or wander. One seek()
+    # for all the wasps with the pursuit or the wander point as target:
+    def hunt(self, prey, noise=None):
+        targets = self.wander_targets(noise)
+        self.hunted = np.full(len(self), -1, dtype=np.intp)
+        if len(prey):
+            self.prey_grid.rebuild(prey.location)
+            self.hunted, d2 = self.prey_grid.nearest(self.location, PERCEPTION)
+            wasps = np.flatnonzero(self.hunted >= 0)
+            hunted = self.hunted[wasps]
+            lead = np.minimum(np.sqrt(d2[wasps]) / self.max_speed[wasps], MAX_LEAD)
+            targets[wasps] = prey.location[hunted] + prey.velocity[hunted] * lead[:, None]
+        self.seek(targets)
+
+    # remove the prey that the wasps hunting it got close enough to (a prey is caught once, even by several wasps).
+    # Returns the number caught:
+    def capture(self, prey):
+        wasps = np.flatnonzero(self.hunted >= 0)
+        hunted = self.hunted[wasps]
+        diff = prey.location[hunted] - self.location[wasps]
+        caught = np.unique(hunted[diff[:, 0] ** 2 + diff[:, 1] ** 2 < CAPTURE_DISTANCE * CAPTURE_DISTANCE])
+        self.hunted[:] = -1  # the prey indices change with the removal
+        prey.remove(caught)
+        self.captured += len(caught)
+        return len(caught)
+
+    def remove(self, indices):
+        super().remove(indices)
+        self.hunted = np.full(len(self), -1, dtype=np.intp)
+
+    def spawn(self, location, max_speed, max_force, mass):
+        new = super().spawn(location, max_speed, max_force, mass)
+        self.hunted = np.full(len(self), -1, dtype=np.intp)
+        return new
+
+
+# ------------------------------------------------------------------
+# add n butterflies with random traits at random locations to the flock (e.g. to replace the caught ones):
+def spawn_butterflies(flock, n, rng=None):
+    rng = flock.rng if rng is None else rng
+    location = rng.uniform((0, 0), (flock.width, flock.height), (n, 2))
+    return flock.spawn(location, *butterfly_traits_array(rng, n))
+
+
+# one frame of the butterflies and the wasps with the flock engine: the butterflies forage or wander and flee from
+# the nearest wasp, then the wasps hunt and catch. The wasps are drawn first, so a composited frame has them on top.
+# With respawn=True a new butterfly replaces every caught one. Returns the number of butterflies caught:
+def step_predators(flock, swarm, food=None, respawn=False):
+    caught = update_predators(flock, swarm, food, respawn)
+    swarm.draw()
+    flock.draw()
+    return caught
+
+
+# the simulation part of step_predators(), with a time step of dt frames:
+def update_predators(flock, swarm, food=None, respawn=False, dt=1):
+    flock.update(food, predators=swarm, dt=dt)
+    caught = swarm.update(flock, dt=dt)
+    if respawn and caught:
+        spawn_butterflies(flock, caught)
+    return caught
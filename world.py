@@ -32,3 +32,34 @@ class Obstacle:
         self.size_y = size_y
         self.canvas = canvas
         self.ref = canvas.create_rectangle(self.x, self.y, self.x + self.size_x, self.y + self.size_y, fill=color, width=0)
+
+
+# ------------------------------------------------------------------
+# a food patch: an orange disc that shrinks as the butterflies eat from it. amount is the food left:
+class Food:
+    def __init__(self, canvas, x, y, amount=100, color='orange'):
+        self.x = x
+        self.y = y
+        self.amount = amount
+        self.canvas = canvas
+        self.slot = None  # slot in the index of the FoodField it belongs to
+        r = self.radius()
+        self.ref = canvas.create_oval(x - r, y - r, x + r, y + r, fill=color, width=0)
+
+    # radius on the canvas, growing with the square root of the amount (100 -> 7 pixels):
+    def radius(self):
+        return 2 + self.amount ** 0.5 / 2
+
+    # take up to bite of the food and return how much was taken:
+    def eat(self, bite):
+        eaten = min(bite, self.amount)
+        self.amount -= eaten
+        r = self.radius()
+        self.canvas.coords(self.ref, self.x - r, self.y - r, self.x + r, self.y + r)
+        return eaten
+
+    def depleted(self):
+        return self.amount <= 0
+
+    def remove(self):
+        self.canvas.delete(self.ref)